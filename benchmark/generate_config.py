@@ -0,0 +1,130 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+import os
+import json
+import math
+import argparse
+
+#################################
+# GENERATE SYNTHETIC CONFIG
+#################################
+
+# Write the four sitewise_config files of a synthetic plant to config_dir:
+# models are spread over depth levels, each model has a hierarchy to the
+# model of the next level in its column, and the assets form a tree with the
+# same fan-out under every parent. Half of the properties of a model are
+# attributes, the other half measurements with an alias on every asset.
+# Returns the number of (models, assets, associations) written.
+def generate_config(config_dir, models=3, assets=100, properties=4, depth=3):
+
+    depth= max(1, min(depth, models))
+    columns= math.ceil(models / depth)
+    attribute_count= properties // 2
+    measurement_count= properties - attribute_count
+
+    ##
+    # Models, levels[l] holds the model names of level l
+    ##
+    levels= [[] for _ in range(depth)]
+    models_config= []
+    for i in range(models):
+        level= min(i // columns, depth - 1)
+        model_name= "BenchModel-" + str(level) + "-" + str(i)
+        levels[level].append(model_name)
+        models_config.append({
+            "model_name": model_name,
+            "model_description": "Benchmark model",
+            "attributes": [{"name": "Attribute" + str(p), "data_type": "STRING", "default_value": "default"} for p in range(attribute_count)],
+            "measurements": [{"name": "Measurement" + str(p), "data_type": "DOUBLE", "unit": None, "forward_config_state": "DISABLED"} for p in range(measurement_count)],
+            "transforms": [],
+            "metrics": []
+        })
+
+    ##
+    # Model hierarchy, a model of level l is the child of the model of level
+    # l-1 in the same column, or of the last model of that level
+    ##
+    child_models= {}
+    model_hierarchy_config= []
+    for level in range(1, depth):
+        for column, model_name in enumerate(levels[level]):
+            parent_model_name= levels[level - 1][min(column, len(levels[level - 1]) - 1)]
+            child_models.setdefault(parent_model_name, []).append((model_name, "Hierarchy-" + model_name))
+    for parent_model_name, children in child_models.items():
+        model_hierarchy_config.append({
+            "parent_asset_model_name": parent_model_name,
+            "child_models": [{"child_asset_model_name": child_model_name, "logical_id": logical_id, "name": logical_id} for child_model_name, logical_id in children]
+        })
+
+    ##
+    # Assets, one root asset per model of the first level (all of them when
+    # there is a single level) and the same fan-out under every parent,
+    # until the asset count is reached
+    ##
+    roots= math.ceil(assets / len(levels[0])) if depth == 1 else 1
+    def asset_count(fan_out):
+        model_assets= {model_name: roots for model_name in levels[0]}
+        for level in range(1, depth):
+            for parent_model_name in levels[level - 1]:
+                for child_model_name, _ in child_models.get(parent_model_name, []):
+                    model_assets[child_model_name]= model_assets[parent_model_name] * fan_out
+        return sum(model_assets.values())
+    fan_out= 1
+    while depth > 1 and asset_count(fan_out) < assets:
+        fan_out+= 1
+
+    def asset_config(model_name, asset_name):
+        model= models_by_name[model_name]
+        return {
+            "model_name": model_name,
+            "asset_name": asset_name,
+            "asset_description": "Benchmark asset",
+            "attributes": [{"name": a["name"], "value": asset_name} for a in model["attributes"]],
+            "measurements": [{"name": m["name"], "logical_id": asset_name + "/" + m["name"], "alias": "/bench/" + asset_name + "/" + m["name"], "notification_state": "DISABLED"} for m in model["measurements"]]
+        }
+
+    models_by_name= {model["model_name"]: model for model in models_config}
+    assets_config= []
+    asset_hierarchy_config= []
+    level_assets= []
+    for i in range(roots):
+        for model_name in levels[0]:
+            if len(assets_config) < assets:
+                asset_name= model_name + "-Asset-" + str(i)
+                assets_config.append(asset_config(model_name, asset_name))
+                level_assets.append((model_name, asset_name))
+    while level_assets and len(assets_config) < assets:
+        next_level_assets= []
+        for parent_model_name, parent_asset_name in level_assets:
+            child_assets= []
+            for child_model_name, logical_id in child_models.get(parent_model_name, []):
+                for i in range(fan_out):
+                    if len(assets_config) >= assets:
+                        break
+                    child_asset_name= parent_asset_name + "." + str(i)
+                    assets_config.append(asset_config(child_model_name, child_asset_name))
+                    child_assets.append({"child_asset_name": child_asset_name, "logical_id": logical_id})
+                    next_level_assets.append((child_model_name, child_asset_name))
+            if child_assets:
+                asset_hierarchy_config.append({"parent_asset_name": parent_asset_name, "child_assets": child_assets})
+        level_assets= next_level_assets
+
+    os.makedirs(config_dir, exist_ok=True)
+    for file_name, config in (("models.json", models_config), ("model_hierarchy.json", model_hierarchy_config), ("assets.json", assets_config), ("asset_hierarchy.json", asset_hierarchy_config)):
+        with open(os.path.join(config_dir, file_name), "w") as outfile:
+            outfile.write(json.dumps(config, indent=4))
+
+    return len(models_config), len(assets_config), sum(len(h["child_assets"]) for h in asset_hierarchy_config)
+
+if __name__ == "__main__":
+    parser= argparse.ArgumentParser(description="Generate synthetic sitewise_config files")
+    parser.add_argument("config_dir", nargs="?", default="sitewise_config")
+    parser.add_argument("--models", type=int, default=3)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--properties", type=int, default=4, help="properties per model, half attributes and half measurements")
+    parser.add_argument("--depth", type=int, default=3, help="levels of the model and asset hierarchy")
+    args= parser.parse_args()
+    counts= generate_config(args.config_dir, args.models, args.assets, args.properties, args.depth)
+    print("Wrote %d models, %d assets and %d associations to %s" % (counts + (args.config_dir,)))
@@ -0,0 +1,162 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+import os
+import sys
+import json
+import time as t
+import argparse
+import tempfile
+import subprocess
+
+from generate_config import generate_config
+from sitewise_standin import SiteWiseStandIn, serve, default_rate_limits, default_latency, default_consistency_delay
+
+#################################
+# DEFINE BENCHMARK SETTINGS
+#################################
+
+sw_infra_path= os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "sw_infra.py")
+
+# The script runs against the stand-in with credentials that are never checked
+benchmark_environment= {
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_DEFAULT_REGION": "us-east-1"
+}
+
+#################################
+# RUN FLOWS
+#################################
+
+# Run one flow of sw_infra.py in workdir, with its confirmations answered by --yes.
+# Returns its exit code, wall-clock time and the peak resident memory of the
+# script or of its largest worker process.
+def run_flow(flow, workdir, endpoint_url, engine):
+    env= dict(os.environ, SITEWISE_ENDPOINT_URL=endpoint_url, **benchmark_environment)
+    with open(os.path.join(workdir, flow.lower() + ".log"), "w") as log:
+        begin= t.monotonic()
+        process= subprocess.Popen([sys.executable, sw_infra_path, flow, "--engine", engine, "--yes"], cwd=workdir, env=env, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT)
+        # wait4 gives the resource usage of this flow alone
+        _, status, rusage= os.wait4(process.pid, 0)
+        end= t.monotonic()
+    process.returncode= os.waitstatus_to_exitcode(status)
+    return {
+        "exit_code": process.returncode,
+        "wall_clock_seconds": round(end - begin, 3),
+        "peak_memory_mb": round(rusage.ru_maxrss / 1024, 1)
+    }
+
+# Resources left in the stand-in account
+def count_resources(standin):
+    with standin.lock:
+        assets= [a for a in standin.assets.values() if standin.state(a) is not None]
+        return {
+            "asset_models": sum(1 for m in standin.asset_models.values() if standin.state(m) is not None),
+            "assets": len(assets),
+            "associations": sum(len(a["children"]) for a in assets),
+            "aliases": sum(1 for a in assets for p in a["properties"].values() if p["alias"])
+        }
+
+def run_benchmark(args):
+    workdir= args.workdir or tempfile.mkdtemp(prefix="sw_infra_benchmark_")
+    os.makedirs(os.path.join(workdir, "created"), exist_ok=True)
+    models, assets, associations= generate_config(os.path.join(workdir, "sitewise_config"), args.models, args.assets, args.properties, args.depth)
+    print("Benchmark config: %d models, %d assets, %d associations, %d properties per model, in %s" % (models, assets, associations, args.properties, workdir))
+
+    rate_limits= dict(default_rate_limits, **args.tps)
+    standin= SiteWiseStandIn(rate_limits=rate_limits, latency=args.latency, consistency_delay=args.consistency_delay, error_rates=args.error_rate, seed=args.seed)
+    server= serve(standin)
+
+    report= {
+        "config": {"models": models, "assets": assets, "associations": associations, "properties": args.properties, "depth": args.depth},
+        "settings": {"engine": args.engine, "latency": args.latency, "consistency_delay": args.consistency_delay, "rate_limits": rate_limits, "error_rates": args.error_rate},
+        "flows": {}
+    }
+    try:
+        for flow in args.flows:
+            print("Running " + flow + " ... ")
+            standin.reset_counters()
+            result= run_flow(flow, workdir, server.endpoint_url, args.engine)
+            result.update(standin.counters())
+            result["total_calls"]= sum(result["calls"].values())
+            result["total_throttles"]= sum(result["throttles"].values())
+            result["resources"]= count_resources(standin)
+            report["flows"][flow]= result
+            print_flow(flow, result)
+    finally:
+        server.shutdown()
+    return report
+
+#################################
+# REPORT
+#################################
+
+def print_flow(flow, result):
+    print("\n%s: %.1f s, peak memory %.1f MB, exit code %d" % (flow, result["wall_clock_seconds"], result["peak_memory_mb"], result["exit_code"]))
+    print("\t%-40s %8s %10s %8s" % ("Operation", "Calls", "Throttled", "Errors"))
+    for operation in sorted(result["calls"]):
+        errors= sum(count for key, count in result["errors"].items() if key.split(":")[0] == operation)
+        print("\t%-40s %8d %10d %8d" % (operation, result["calls"][operation], result["throttles"].get(operation, 0), errors))
+    print("\tResources after " + flow + ": " + ", ".join(str(count) + " " + name for name, count in result["resources"].items()) + "\n")
+
+# Compare the flows of a report with a baseline report
+def print_comparison(report, baseline):
+    print("Comparison with baseline:")
+    for flow, result in report["flows"].items():
+        if flow not in baseline["flows"]:
+            continue
+        print("\t" + flow)
+        for key in ("wall_clock_seconds", "peak_memory_mb", "total_calls", "total_throttles"):
+            before, after= baseline["flows"][flow][key], result[key]
+            change= " (%+.1f%%)" % ((after - before) * 100 / before) if before else ""
+            print("\t\t%-20s %12s -> %-12s%s" % (key, before, after, change))
+    if baseline["config"] != report["config"]:
+        print("\tNOTE: the baseline was run with another config: " + json.dumps(baseline["config"]))
+
+#################################
+# MAIN
+#################################
+
+# OPERATION=VALUE arguments, VALUE parsed by value_type
+def operation_values(value_type):
+    def parse(argument):
+        operation, _, value= argument.partition("=")
+        return operation, value_type(value)
+    return parse
+
+def error_rate(value):
+    rate, _, code= value.partition(":")
+    return float(rate), code or None
+
+if __name__ == "__main__":
+    parser= argparse.ArgumentParser(description="Run the CREATE and DELETE flows of sw_infra.py against a local SiteWise stand-in and report their performance")
+    parser.add_argument("--models", type=int, default=3)
+    parser.add_argument("--assets", type=int, default=100)
+    parser.add_argument("--properties", type=int, default=4, help="properties per model, half attributes and half measurements")
+    parser.add_argument("--depth", type=int, default=3, help="levels of the model and asset hierarchy")
+    parser.add_argument("--engine", default="process", choices=["process", "thread", "async", "dag"], help="engine of sw_infra.py")
+    parser.add_argument("--flows", type=str.upper, nargs="+", default=["CREATE", "DELETE"])
+    parser.add_argument("--latency", type=float, default=default_latency, help="seconds every call takes")
+    parser.add_argument("--consistency-delay", type=float, default=default_consistency_delay, help="seconds a resource stays CREATING, UPDATING or DELETING")
+    parser.add_argument("--tps", type=operation_values(float), action="append", default=[], metavar="OPERATION=RATE",
+                        help="requests per second of an operation before it is throttled, 0 for no limit")
+    parser.add_argument("--error-rate", type=operation_values(error_rate), action="append", default=[], metavar="OPERATION=FRACTION[:CODE]",
+                        help="fraction of the calls of an operation that fail, with InternalFailureException unless CODE is given")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the error injection")
+    parser.add_argument("--workdir", help="directory of the config and created files, a new temporary directory by default")
+    parser.add_argument("--output", help="write the report to this JSON file")
+    parser.add_argument("--baseline", help="compare with the report of a previous run")
+    args= parser.parse_args()
+    args.tps= dict(args.tps)
+    args.error_rate= dict(args.error_rate)
+
+    report= run_benchmark(args)
+    if args.output:
+        with open(args.output, "w") as outfile:
+            outfile.write(json.dumps(report, indent=4))
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            print_comparison(report, json.load(file))
+    exit(max(result["exit_code"] != 0 for result in report["flows"].values()))
@@ -0,0 +1,540 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: MIT-0
+
+
+import json
+import re
+import time as t
+import uuid
+import random
+import threading
+import collections
+import urllib.parse
+import http.server
+import botocore.session
+
+#################################
+# DEFINE STAND-IN SETTINGS
+#################################
+
+# Default requests per second of each operation, after the IoT SiteWise
+# quotas page. Calls above the rate get a ThrottlingException.
+default_rate_limits= {
+    "CreateAssetModel": 10,
+    "UpdateAssetModel": 10,
+    "DescribeAssetModel": 50,
+    "DeleteAssetModel": 10,
+    "CreateAsset": 50,
+    "DescribeAsset": 50,
+    "DeleteAsset": 50,
+    "UpdateAssetProperty": 10,
+    "AssociateTimeSeriesToAssetProperty": 10,
+    "AssociateAssets": 30,
+    "DisassociateAssets": 30,
+    "BatchPutAssetPropertyValue": 1000,
+    "ListAssetModels": 10,
+    "ListAssets": 10,
+    "ListAssociatedAssets": 10,
+    "ListTagsForResource": 10,
+    "ListTimeSeries": 10
+}
+
+# Seconds every call takes, before its response is sent
+default_latency= 0.02
+
+# Seconds a created, updated or deleted resource stays in its transitional
+# state (CREATING, UPDATING, DELETING) before it is ACTIVE or gone
+default_consistency_delay= 0.5
+
+account_id= "123456789012"
+region= "us-east-1"
+
+#################################
+# SITEWISE STAND-IN
+#################################
+
+class SiteWiseError(Exception):
+
+    status_codes= {
+        "ThrottlingException": 429,
+        "ConflictingOperationException": 409,
+        "ResourceAlreadyExistsException": 409,
+        "ResourceNotFoundException": 404,
+        "InvalidRequestException": 400,
+        "InternalFailureException": 500,
+        "ServiceUnavailableException": 503,
+        "TooManyRequestsException": 429,
+        "AccessDeniedException": 403
+    }
+
+    # HTTP status of an error code, also of codes injected with error_rates
+    # that are not listed: server errors for failures and unavailability,
+    # client errors for the others
+    @classmethod
+    def status_code(cls, code):
+        if code in cls.status_codes:
+            return cls.status_codes[code]
+        if "Unavailable" in code:
+            return 503
+        if "Failure" in code:
+            return 500
+        return 400
+
+    def __init__(self, code, message, resource_id=None, resource_arn=None):
+        super().__init__(message)
+        self.code= code
+        self.body= {"message": message}
+        if resource_id is not None:
+            self.body.update({"resourceId": resource_id, "resourceArn": resource_arn})
+
+# In-memory state of one account, with the operations used by sw_infra.py.
+# Resources go through the same states as in SiteWise, with a
+# consistency_delay between them, and every call is counted by operation.
+# rate_limits, latency and error_rates can be changed while it runs.
+class SiteWiseStandIn:
+
+    def __init__(self, rate_limits=None, latency=default_latency, consistency_delay=default_consistency_delay, error_rates=None, seed=None):
+        self.rate_limits= dict(default_rate_limits if rate_limits is None else rate_limits)
+        self.latency= latency
+        self.consistency_delay= consistency_delay
+        # Operation name to (fraction of calls, error code) failed on purpose
+        self.error_rates= dict(error_rates or {})
+        self.random= random.Random(seed)
+        self.lock= threading.Lock()
+        self.asset_models= {}
+        self.assets= {}
+        # Alias to the (asset id, property id) it is bound to, None for a data
+        # stream that is not associated to any asset property
+        self.time_series= {}
+        self.tags= {}
+        self.buckets= {}
+        self.reset_counters()
+
+    def reset_counters(self):
+        with self.lock:
+            self.calls= collections.Counter()
+            self.throttles= collections.Counter()
+            self.errors= collections.Counter()
+
+    def counters(self):
+        with self.lock:
+            return {
+                "calls": dict(self.calls),
+                "throttles": dict(self.throttles),
+                "errors": dict(self.errors)
+            }
+
+    # Run one operation with the parameters parsed from the request
+    def call(self, operation, params):
+        if self.latency:
+            t.sleep(self.latency)
+        with self.lock:
+            self.calls[operation]+= 1
+            try:
+                self.throttle(operation)
+                rate, code= self.error_rates.get(operation, (0, None))
+                if rate and self.random.random() < rate:
+                    raise SiteWiseError(code or "InternalFailureException", "Injected " + (code or "InternalFailureException"))
+                return getattr(self, "op_" + operation)(**params)
+            except SiteWiseError as err:
+                if err.code == "ThrottlingException":
+                    self.throttles[operation]+= 1
+                else:
+                    self.errors[operation + ":" + err.code]+= 1
+                raise
+
+    # Token bucket per operation, holding at most one second of requests
+    def throttle(self, operation):
+        rate= self.rate_limits.get(operation)
+        if not rate:
+            return
+        now= t.monotonic()
+        tokens, updated= self.buckets.get(operation, (max(rate, 1), now))
+        tokens= min(max(rate, 1), tokens + (now - updated) * rate)
+        if tokens < 1:
+            self.buckets[operation]= (tokens, now)
+            raise SiteWiseError("ThrottlingException", "Rate exceeded for " + operation)
+        self.buckets[operation]= (tokens - 1, now)
+
+    ##
+    # Resource states
+    ##
+
+    def transition(self, resource, state):
+        resource["state"]= state
+        resource["ready_at"]= t.monotonic() + self.consistency_delay
+
+    # Current state of a resource, None once a deleted resource is gone
+    def state(self, resource):
+        if t.monotonic() < resource["ready_at"]:
+            return resource["state"]
+        return None if resource["state"] == "DELETING" else "ACTIVE"
+
+    def get_asset_model(self, asset_model_id):
+        asset_model= self.asset_models.get(asset_model_id)
+        if asset_model is None or self.state(asset_model) is None:
+            self.asset_models.pop(asset_model_id, None)
+            raise SiteWiseError("ResourceNotFoundException", "Asset model " + str(asset_model_id) + " not found")
+        return asset_model
+
+    def get_asset(self, asset_id):
+        asset= self.assets.get(asset_id)
+        if asset is None or self.state(asset) is None:
+            if asset is not None:
+                self.remove_asset(asset)
+            raise SiteWiseError("ResourceNotFoundException", "Asset " + str(asset_id) + " not found")
+        return asset
+
+    # A deleted asset leaves its data streams behind, not associated to any property
+    def remove_asset(self, asset):
+        del self.assets[asset["id"]]
+        for alias, bound in self.time_series.items():
+            if bound is not None and bound[0] == asset["id"]:
+                self.time_series[alias]= None
+
+    def require_state(self, resource, kind, *states):
+        state= self.state(resource)
+        if state not in states:
+            raise SiteWiseError("ConflictingOperationException", kind + " " + resource["id"] + " is " + str(state), resource["id"], resource["arn"])
+
+    def arn(self, kind, resource_id):
+        return "arn:aws:iotsitewise:" + region + ":" + account_id + ":" + kind + "/" + resource_id
+
+    # Model properties and hierarchies with their ids, keeping the ids of the
+    # ones that already exist by name
+    def model_definition(self, asset_model, assetModelProperties, assetModelHierarchies):
+        property_ids= {p["name"]: p["id"] for p in asset_model.get("properties", [])}
+        hierarchy_ids= {h["name"]: h["id"] for h in asset_model.get("hierarchies", [])}
+        for hierarchy in assetModelHierarchies:
+            child_asset_model= self.get_asset_model(hierarchy["childAssetModelId"])
+            if self.state(child_asset_model) != "ACTIVE":
+                self.require_state(child_asset_model, "Asset model", "ACTIVE")
+        asset_model["properties"]= [dict(p, id=property_ids.get(p["name"], str(uuid.uuid4()))) for p in assetModelProperties]
+        asset_model["hierarchies"]= [dict(h, id=hierarchy_ids.get(h["name"], str(uuid.uuid4()))) for h in assetModelHierarchies]
+
+    def page(self, items, nextToken=None, maxResults=50):
+        start= int(nextToken or 0)
+        end= start + int(maxResults or 50)
+        return items[start:end], (str(end) if end < len(items) else None)
+
+    ##
+    # Asset models
+    ##
+
+    def op_CreateAssetModel(self, assetModelName, assetModelDescription=None, assetModelProperties=(), assetModelHierarchies=(), tags=None, **kwargs):
+        for asset_model in self.asset_models.values():
+            if asset_model["name"] == assetModelName and self.state(asset_model) is not None:
+                raise SiteWiseError("ResourceAlreadyExistsException", "Asset model " + assetModelName + " already exists", asset_model["id"], asset_model["arn"])
+        asset_model_id= str(uuid.uuid4())
+        asset_model= {"id": asset_model_id, "arn": self.arn("asset-model", asset_model_id), "name": assetModelName, "description": assetModelDescription}
+        self.model_definition(asset_model, assetModelProperties, assetModelHierarchies)
+        self.transition(asset_model, "CREATING")
+        self.asset_models[asset_model_id]= asset_model
+        self.tags[asset_model["arn"]]= dict(tags or {})
+        return {"assetModelId": asset_model_id, "assetModelArn": asset_model["arn"], "assetModelStatus": {"state": "CREATING"}}
+
+    def op_UpdateAssetModel(self, assetModelId, assetModelName, assetModelDescription=None, assetModelProperties=(), assetModelHierarchies=(), **kwargs):
+        asset_model= self.get_asset_model(assetModelId)
+        self.require_state(asset_model, "Asset model", "ACTIVE")
+        self.model_definition(asset_model, assetModelProperties, assetModelHierarchies)
+        asset_model.update(name=assetModelName, description=assetModelDescription)
+        self.transition(asset_model, "UPDATING")
+        return {"assetModelStatus": {"state": "UPDATING"}}
+
+    def op_DescribeAssetModel(self, assetModelId, **kwargs):
+        asset_model= self.get_asset_model(assetModelId)
+        return {
+            "assetModelId": asset_model["id"],
+            "assetModelArn": asset_model["arn"],
+            "assetModelName": asset_model["name"],
+            "assetModelDescription": asset_model["description"] or "",
+            "assetModelProperties": asset_model["properties"],
+            "assetModelHierarchies": asset_model["hierarchies"],
+            "assetModelStatus": {"state": self.state(asset_model)}
+        }
+
+    def op_DeleteAssetModel(self, assetModelId, **kwargs):
+        asset_model= self.get_asset_model(assetModelId)
+        self.require_state(asset_model, "Asset model", "ACTIVE")
+        for asset_id in list(self.assets):
+            if self.assets[asset_id]["model_id"] == assetModelId and self.state(self.assets[asset_id]) is not None:
+                raise SiteWiseError("ConflictingOperationException", "Asset model " + assetModelId + " has assets", asset_model["id"], asset_model["arn"])
+        for other in self.asset_models.values():
+            if other is not asset_model and self.state(other) is not None and any(h["childAssetModelId"] == assetModelId for h in other["hierarchies"]):
+                raise SiteWiseError("ConflictingOperationException", "Asset model " + assetModelId + " is a child of " + other["id"], asset_model["id"], asset_model["arn"])
+        self.transition(asset_model, "DELETING")
+        return {"assetModelStatus": {"state": "DELETING"}}
+
+    def op_ListAssetModels(self, nextToken=None, maxResults=50, **kwargs):
+        asset_models= [m for m in self.asset_models.values() if self.state(m) is not None]
+        items, next_token= self.page(asset_models, nextToken, maxResults)
+        response= {"assetModelSummaries": [{"id": m["id"], "arn": m["arn"], "name": m["name"], "description": m["description"] or "", "status": {"state": self.state(m)}} for m in items]}
+        if next_token:
+            response["nextToken"]= next_token
+        return response
+
+    ##
+    # Assets
+    ##
+
+    def op_CreateAsset(self, assetName, assetModelId, assetDescription=None, tags=None, **kwargs):
+        asset_model= self.get_asset_model(assetModelId)
+        self.require_state(asset_model, "Asset model", "ACTIVE")
+        for asset in self.assets.values():
+            if asset["name"] == assetName and asset["model_id"] == assetModelId and self.state(asset) is not None:
+                raise SiteWiseError("ResourceAlreadyExistsException", "Asset " + assetName + " already exists", asset["id"], asset["arn"])
+        asset_id= str(uuid.uuid4())
+        asset= {
+            "id": asset_id,
+            "arn": self.arn("asset", asset_id),
+            "name": assetName,
+            "description": assetDescription,
+            "model_id": assetModelId,
+            "properties": {p["id"]: {"name": p["name"], "alias": None, "values": []} for p in asset_model["properties"]},
+            "hierarchies": {h["id"]: h["name"] for h in asset_model["hierarchies"]},
+            "children": {},
+            "parent": None
+        }
+        self.transition(asset, "CREATING")
+        self.assets[asset_id]= asset
+        self.tags[asset["arn"]]= dict(tags or {})
+        return {"assetId": asset_id, "assetArn": asset["arn"], "assetStatus": {"state": "CREATING"}}
+
+    def op_DescribeAsset(self, assetId, **kwargs):
+        asset= self.get_asset(assetId)
+        return {
+            "assetId": asset["id"],
+            "assetArn": asset["arn"],
+            "assetName": asset["name"],
+            "assetModelId": asset["model_id"],
+            "assetProperties": [{"id": property_id, "name": p["name"], "alias": p["alias"] or ""} for property_id, p in asset["properties"].items()],
+            "assetHierarchies": [{"id": hierarchy_id, "name": name} for hierarchy_id, name in asset["hierarchies"].items()],
+            "assetStatus": {"state": self.state(asset)}
+        }
+
+    def op_DeleteAsset(self, assetId, **kwargs):
+        asset= self.get_asset(assetId)
+        self.require_state(asset, "Asset", "ACTIVE")
+        if asset["parent"] is not None or asset["children"]:
+            raise SiteWiseError("ConflictingOperationException", "Asset " + assetId + " is associated to other assets", asset["id"], asset["arn"])
+        self.transition(asset, "DELETING")
+        return {"assetStatus": {"state": "DELETING"}}
+
+    def op_ListAssets(self, assetModelId=None, filter="ALL", nextToken=None, maxResults=50, **kwargs):
+        if filter == "ALL" and assetModelId is None:
+            raise SiteWiseError("InvalidRequestException", "assetModelId is required with the ALL filter")
+        assets= [a for a in self.assets.values() if self.state(a) is not None
+                 and (assetModelId is None or a["model_id"] == assetModelId)
+                 and (filter == "ALL" or a["parent"] is None)]
+        items, next_token= self.page(assets, nextToken, maxResults)
+        response= {"assetSummaries": [{"id": a["id"], "arn": a["arn"], "name": a["name"], "assetModelId": a["model_id"], "hierarchies": [], "status": {"state": self.state(a)}} for a in items]}
+        if next_token:
+            response["nextToken"]= next_token
+        return response
+
+    ##
+    # Asset properties
+    ##
+
+    def get_asset_property(self, assetId, propertyId):
+        asset= self.get_asset(assetId)
+        self.require_state(asset, "Asset", "ACTIVE")
+        if propertyId not in asset["properties"]:
+            raise SiteWiseError("ResourceNotFoundException", "Property " + propertyId + " not found in asset " + assetId)
+        return asset, asset["properties"][propertyId]
+
+    # An alias that names a data stream of another property, or a data stream
+    # that is not associated yet, conflicts
+    def op_UpdateAssetProperty(self, assetId, propertyId, propertyAlias=None, propertyNotificationState=None, **kwargs):
+        asset, asset_property= self.get_asset_property(assetId, propertyId)
+        if propertyAlias:
+            if propertyAlias in self.time_series and self.time_series[propertyAlias] != (assetId, propertyId):
+                raise SiteWiseError("ConflictingOperationException", "Alias " + propertyAlias + " is in use", asset["id"], asset["arn"])
+            self.time_series[propertyAlias]= (assetId, propertyId)
+        if asset_property["alias"] and asset_property["alias"] != propertyAlias:
+            self.time_series[asset_property["alias"]]= None
+        asset_property["alias"]= propertyAlias
+        return {}
+
+    def op_AssociateTimeSeriesToAssetProperty(self, alias, assetId, propertyId, **kwargs):
+        asset, asset_property= self.get_asset_property(assetId, propertyId)
+        if self.time_series.get(alias) not in (None, (assetId, propertyId)):
+            raise SiteWiseError("ConflictingOperationException", "Time series " + alias + " is associated to another property", asset["id"], asset["arn"])
+        self.time_series[alias]= (assetId, propertyId)
+        asset_property["alias"]= alias
+        return {}
+
+    def op_ListTimeSeries(self, assetId=None, aliasPrefix=None, timeSeriesType=None, nextToken=None, maxResults=50, **kwargs):
+        time_series= [
+            (alias, bound) for alias, bound in sorted(self.time_series.items())
+            if (aliasPrefix is None or alias.startswith(aliasPrefix))
+            and (assetId is None or (bound is not None and bound[0] == assetId))
+            and (timeSeriesType is None or (bound is None) == (timeSeriesType == "DISASSOCIATED"))
+        ]
+        items, next_token= self.page(time_series, nextToken, maxResults)
+        summaries= []
+        for alias, bound in items:
+            time_series_id= str(uuid.uuid5(uuid.NAMESPACE_URL, alias))
+            summary= {"alias": alias, "timeSeriesId": time_series_id, "dataType": "DOUBLE", "timeSeriesCreationDate": 0, "timeSeriesLastUpdateDate": 0, "timeSeriesArn": self.arn("time-series", time_series_id)}
+            if bound is not None:
+                summary.update(assetId=bound[0], propertyId=bound[1])
+            summaries.append(summary)
+        response= {"TimeSeriesSummaries": summaries}
+        if next_token:
+            response["nextToken"]= next_token
+        return response
+
+    def op_BatchPutAssetPropertyValue(self, entries, **kwargs):
+        error_entries= []
+        for entry in entries:
+            try:
+                if "propertyAlias" in entry:
+                    bound= self.time_series.get(entry["propertyAlias"])
+                    if bound is None:
+                        raise SiteWiseError("ResourceNotFoundException", "Alias " + entry["propertyAlias"] + " is not associated")
+                    asset, asset_property= self.get_asset_property(*bound)
+                else:
+                    asset, asset_property= self.get_asset_property(entry["assetId"], entry["propertyId"])
+                asset_property["values"]= entry["propertyValues"][-1:]
+            except SiteWiseError as err:
+                error_entries.append({"entryId": entry["entryId"], "errors": [{"errorCode": err.code, "errorMessage": str(err), "timestamps": [v["timestamp"] for v in entry["propertyValues"]]}]})
+        return {"errorEntries": error_entries}
+
+    ##
+    # Asset hierarchy
+    ##
+
+    def op_AssociateAssets(self, assetId, hierarchyId, childAssetId, **kwargs):
+        asset= self.get_asset(assetId)
+        child_asset= self.get_asset(childAssetId)
+        self.require_state(asset, "Asset", "ACTIVE")
+        self.require_state(child_asset, "Asset", "ACTIVE")
+        if hierarchyId not in asset["hierarchies"]:
+            raise SiteWiseError("InvalidRequestException", "Hierarchy " + hierarchyId + " not found in asset " + assetId)
+        hierarchy= next(h for h in self.asset_models[asset["model_id"]]["hierarchies"] if h["id"] == hierarchyId)
+        if hierarchy["childAssetModelId"] != child_asset["model_id"]:
+            raise SiteWiseError("InvalidRequestException", "Asset " + childAssetId + " is not a " + hierarchy["childAssetModelId"])
+        if child_asset["parent"] is not None:
+            raise SiteWiseError("ConflictingOperationException", "Asset " + childAssetId + " already has a parent", child_asset["id"], child_asset["arn"])
+        asset["children"][childAssetId]= hierarchyId
+        child_asset["parent"]= assetId
+        return {}
+
+    def op_DisassociateAssets(self, assetId, hierarchyId, childAssetId, **kwargs):
+        asset= self.get_asset(assetId)
+        child_asset= self.get_asset(childAssetId)
+        if asset["children"].get(childAssetId) != hierarchyId:
+            raise SiteWiseError("ResourceNotFoundException", "Asset " + childAssetId + " is not a child of " + assetId)
+        del asset["children"][childAssetId]
+        child_asset["parent"]= None
+        return {}
+
+    def op_ListAssociatedAssets(self, assetId, hierarchyId=None, traversalDirection="CHILD", nextToken=None, maxResults=50, **kwargs):
+        asset= self.get_asset(assetId)
+        if traversalDirection == "PARENT":
+            related= [self.assets[asset["parent"]]] if asset["parent"] is not None else []
+        else:
+            if hierarchyId not in asset["hierarchies"]:
+                raise SiteWiseError("InvalidRequestException", "Hierarchy " + str(hierarchyId) + " not found in asset " + assetId)
+            related= [self.assets[child_asset_id] for child_asset_id, child_hierarchy_id in asset["children"].items() if child_hierarchy_id == hierarchyId]
+        items, next_token= self.page(related, nextToken, maxResults)
+        response= {"assetSummaries": [{"id": a["id"], "arn": a["arn"], "name": a["name"], "assetModelId": a["model_id"], "hierarchies": [], "status": {"state": self.state(a)}} for a in items]}
+        if next_token:
+            response["nextToken"]= next_token
+        return response
+
+    ##
+    # Tags
+    ##
+
+    def op_ListTagsForResource(self, resourceArn, **kwargs):
+        if resourceArn not in self.tags:
+            raise SiteWiseError("ResourceNotFoundException", "Resource " + resourceArn + " not found")
+        return {"tags": dict(self.tags[resourceArn])}
+
+#################################
+# HTTP SERVER
+#################################
+
+# Routes of the operations of the stand-in, read from the botocore service
+# model so that requests are parsed the way boto3 sends them
+def build_routes():
+    service_model= botocore.session.get_session().get_service_model("iotsitewise")
+    routes= []
+    for operation in dir(SiteWiseStandIn):
+        if not operation.startswith("op_"):
+            continue
+        operation_model= service_model.operation_model(operation[3:])
+        path, _, query= operation_model.http["requestUri"].partition("?")
+        pattern= re.sub(r"\{(\w+)\+?\}", r"(?P<\1>[^/]+)", path.rstrip("/"))
+        locations= {}
+        for name, shape in operation_model.input_shape.members.items():
+            location= shape.serialization.get("location")
+            if location in ("querystring", "header"):
+                locations[shape.serialization["name"].lower() if location == "header" else shape.serialization["name"]]= (location, name, shape.type_name)
+        routes.append((operation_model.http["method"], re.compile(pattern + "/?$"), operation_model.name, locations, operation_model.http.get("responseCode", 200)))
+    return routes
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version= "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_request(self):
+        url= urllib.parse.urlsplit(self.path)
+        body= self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        for method, pattern, operation, locations, response_code in self.server.routes:
+            match= pattern.match(url.path)
+            if method != self.command or match is None:
+                continue
+            params= json.loads(body) if body else {}
+            params.update({k: urllib.parse.unquote(v) for k, v in match.groupdict().items()})
+            for key, values in urllib.parse.parse_qs(url.query).items():
+                if key in locations:
+                    _, name, type_name= locations[key]
+                    params[name]= int(values[0]) if type_name == "integer" else values[0]
+            try:
+                self.respond(response_code, self.server.standin.call(operation, params))
+            except SiteWiseError as err:
+                self.respond(SiteWiseError.status_code(err.code), err.body, err.code)
+            return
+        self.respond(404, {"message": "Unknown operation " + self.command + " " + url.path}, "UnknownOperationException")
+
+    do_GET= do_POST= do_PUT= do_DELETE= handle_request
+
+    def respond(self, status, body, error_code=None):
+        payload= json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        if error_code is not None:
+            self.send_header("x-amzn-ErrorType", error_code)
+        self.end_headers()
+        self.wfile.write(payload)
+
+# Serve a stand-in on a thread of this process. Returns the server, call
+# server.shutdown() to stop it.
+def serve(standin, host="127.0.0.1", port=0):
+    server= http.server.ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads= True
+    server.standin= standin
+    server.routes= build_routes()
+    server.endpoint_url= "http://" + host + ":" + str(server.server_address[1])
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == "__main__":
+    import argparse
+    parser= argparse.ArgumentParser(description="Serve a local stand-in of the AWS IoT SiteWise API, use it by setting SITEWISE_ENDPOINT_URL")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", type=float, default=default_latency)
+    parser.add_argument("--consistency-delay", type=float, default=default_consistency_delay)
+    args= parser.parse_args()
+    server= serve(SiteWiseStandIn(latency=args.latency, consistency_delay=args.consistency_delay), port=args.port)
+    print("Serving on " + server.endpoint_url)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,54 @@
+import boto3
+import pytest
+import botocore.config
+import botocore.exceptions
+
+from sitewise_standin import SiteWiseStandIn, SiteWiseError, serve
+
+#################################
+# HELPERS
+#################################
+
+@pytest.fixture
+def server():
+    server= serve(SiteWiseStandIn(latency=0, consistency_delay=0, seed=1))
+    yield server
+    server.shutdown()
+
+# Client of the stand-in that makes every call once
+@pytest.fixture
+def client(server):
+    return boto3.client(
+        "iotsitewise", endpoint_url=server.endpoint_url, region_name="us-east-1",
+        aws_access_key_id="test", aws_secret_access_key="test",
+        config=botocore.config.Config(retries={"total_max_attempts": 1}, inject_host_prefix=False)
+    )
+
+#################################
+# INJECTED ERRORS
+#################################
+
+@pytest.mark.parametrize("code, status", [
+    ("ThrottlingException", 429),
+    ("InternalFailureException", 500),
+    ("AccessDeniedException", 403),
+    ("ValidationException", 400),
+    ("ServiceUnavailableException", 503),
+    ("DependencyUnavailableException", 503),
+    ("SomeInternalFailure", 500)
+])
+def test_status_code(code, status):
+    assert SiteWiseError.status_code(code) == status
+
+# Any error code given to --error-rate reaches the client as an API error
+@pytest.mark.parametrize("code", ["AccessDeniedException", "ValidationException", "InternalFailureException"])
+def test_injected_errors_reach_the_client(server, client, code):
+    server.standin.error_rates["ListAssetModels"]= (1.0, code)
+    with pytest.raises(botocore.exceptions.ClientError) as raised:
+        client.list_asset_models()
+    assert raised.value.response["Error"]["Code"] == code
+    assert raised.value.response["ResponseMetadata"]["HTTPStatusCode"] == SiteWiseError.status_code(code)
+
+    # The connection is still usable
+    server.standin.error_rates.clear()
+    assert client.list_asset_models()["assetModelSummaries"] == []
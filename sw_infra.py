@@ -3,16 +3,69 @@
 
 
 import json
+import sqlite3
+import socket
+import hashlib
+import heapq
+import queue
+import random
+import os
 import boto3
 import botocore
+import botocore.config
 import sys
 import time as t
 import traceback
 import multiprocessing
+import multiprocessing.util
+import concurrent.futures
 import itertools
-import string
-import random
-client = boto3.client('iotsitewise')
+import functools
+import threading
+import collections
+import asyncio
+import argparse
+import contextlib
+
+#################################
+# DEFINE CLIENT
+#################################
+
+# Endpoint of the SiteWise API. Set SITEWISE_ENDPOINT_URL to send every call to
+# a local stand-in instead of AWS.
+endpoint_url= os.environ.get("SITEWISE_ENDPOINT_URL")
+
+# Size of the HTTP connection pool of the client, one connection for every
+# task in flight in this process. Set by the engine before the first call.
+max_pool_connections= 10
+
+def create_client(session):
+    config= botocore.config.Config(
+        max_pool_connections= max_pool_connections,
+        tcp_keepalive= True,
+        # Failed calls are retried by the engines, see RETRY POLICY. The
+        # adaptive mode still slows the client down when it is throttled.
+        retries= {"mode": "adaptive", "total_max_attempts": 1},
+        # SiteWise operations use api. and data. host prefixes, a local endpoint has neither
+        inject_host_prefix= endpoint_url is None
+    )
+    return session.client('iotsitewise', endpoint_url=endpoint_url, config=config)
+
+# One session and one client per process, created on the first call and
+# shared by all threads. Importing the script makes no connection.
+session= None
+client= None
+client_lock= threading.Lock()
+
+def get_client():
+    global session, client
+    if client is None:
+        with client_lock:
+            if client is None:
+                if session is None:
+                    session= boto3.session.Session()
+                client= create_client(session)
+    return client
 
 #################################
 # DEFINE TAGS
@@ -33,6 +86,13 @@ assets_path= "sitewise_config/assets.json"
 model_hierarchy_path= "sitewise_config/model_hierarchy.json"
 asset_hierarchy_path= "sitewise_config/asset_hierarchy.json"
 
+# The assets and asset hierarchy can also be given as JSON Lines, one entry
+# per line, see config_path
+jsonl_config_paths= {
+    assets_path: "sitewise_config/assets.jsonl",
+    asset_hierarchy_path: "sitewise_config/asset_hierarchy.jsonl"
+}
+
 # Define path variables for local files
 parent_models_path= "created/parent_models.json"
 resources_path= "created/resources.json"
@@ -40,114 +100,1158 @@ asset_hierarchy_mapping_path= "created/asset_hierarchy_mapping.json"
 script_assets_path= "created/assets.json"
 script_asset_models_path= "created/asset_models.json"
 hierarchy_id_mapping_path= "created/hierarchy_id_mapping.json"
+config_hashes_path= "created/config_hashes.json"
+metrics_path= "created/metrics.json"
+metrics_textfile_path= "created/metrics.prom"
+trace_events_path= "created/trace.jsonl"
+trace_path= "created/trace.json"
 
 #################################
-# ADD ELEMENT TO RESOURCES FILE
+# STREAM CONFIG AND RESULT FILES
 #################################
 
-def add_resources_element(key, element):
+# Size of the chunks read from the config files
+config_read_size= 1 << 20
+
+# Path of the config file read for path, its JSON Lines version if there is
+# one. It is looked up when the file is read, not when the script is imported.
+def config_path(path):
+    jsonl_path= jsonl_config_paths.get(path)
+    return jsonl_path if jsonl_path is not None and os.path.exists(jsonl_path) else path
+
+# Yield the entries of a config file one at a time, so that only one entry is
+# held in memory. JSON Lines files (.jsonl) are read line by line, JSON
+# arrays are decoded incrementally.
+def iter_config(path):
+    
+    path= config_path(path)
+    with open(path, 'r') as file:
+        
+        if path.endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+        
+        decoder= json.JSONDecoder()
+        buffer= file.read(config_read_size).lstrip()
+        if not buffer.startswith("["):
+            raise ValueError(path + " is not a JSON array")
+        position= 1
+        eof= False
+        
+        while True:
+            # Skip whitespace and separators, reading the next chunk when the buffer is used up
+            while True:
+                while position < len(buffer) and buffer[position] in " \t\r\n,":
+                    position+= 1
+                if position < len(buffer) or eof:
+                    break
+                buffer= file.read(config_read_size)
+                position= 0
+                eof= buffer == ""
+            
+            if position == len(buffer):
+                raise ValueError(path + " ends before the end of the JSON array")
+            if buffer[position] == "]":
+                return
+            
+            try:
+                entry, end= decoder.raw_decode(buffer, position)
+            except ValueError:
+                if eof:
+                    raise
+                # Entry cut by the end of the chunk
+                chunk= file.read(config_read_size)
+                eof= chunk == ""
+                buffer= buffer[position:] + chunk
+                position= 0
+                continue
+            
+            yield entry
+            position= end
+
+# Write a JSON object one member at a time, so that results are saved as they
+# complete instead of being held in memory. The file replaces path on close.
+class JsonObjectWriter:
     
-    # Read latest version of the file
-    with open(resources_path, 'r') as file:
-        resources_file = json.load(file)
+    def __init__(self, path):
+        self.path= path
+        self.count= 0
+        self.file= open(path + ".tmp", "w")
+        self.file.write("{")
     
-    # Add the element in key
-    resources_file[key].append(element)
+    def write(self, key, value):
+        self.file.write(("," if self.count else "") + "\n    " + json.dumps(key) + ": " + json.dumps(value))
+        self.count+= 1
     
-    # Write the updated version back to the file
-    with open(resources_path, "w") as outfile:
-        outfile.write(json.dumps(resources_file, indent=4))
+    def close(self):
+        self.file.write("\n}\n" if self.count else "}\n")
+        self.file.close()
+        os.replace(self.path + ".tmp", self.path)
 
 #################################
-# DELETE ELEMENT FROM RESOURCES FILE
+# RESULT RECORDS
 #################################
 
-def delete_resources_element(key, element):
+# Id and ARN of a created resource, kept instead of the whole API response.
+# Records are read like the response they replace, record["assetId"], and are
+# saved as [id, arn] arrays keyed by resource name.
+class ResourceRecord:
+    __slots__= ()
+    
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
     
-    # Read latest version of the file
-    with open(resources_path, 'r') as file:
-        resources_file = json.load(file)
+    def __getitem__(self, field):
+        return getattr(self, field)
     
-    # Delete the element from key
-    resources_file[key].remove(element)
+    # Build a record from an API response, or anything indexed by the record fields
+    @classmethod
+    def from_response(cls, response):
+        return cls(*(response[field] for field in cls.__slots__))
     
-    # Write the updated version back to the file
-    with open(resources_path, "w") as outfile:
-        outfile.write(json.dumps(resources_file, indent=4))
+    def to_json(self):
+        return [getattr(self, field) for field in self.__slots__]
+
+class AssetModelRecord(ResourceRecord):
+    __slots__= ("assetModelId", "assetModelArn")
+
+class AssetRecord(ResourceRecord):
+    __slots__= ("assetId", "assetArn")
+
+# Read a file written by save_records. Files holding whole API responses, as
+# written by earlier versions, are read as well.
+def load_records(path, record_type):
+    with open(path, 'r') as file:
+        return {
+            name: record_type.from_response(values) if isinstance(values, dict) else record_type(*values)
+            for name, values in json.load(file).items()
+        }
+
+def save_records(path, records):
+    writer= JsonObjectWriter(path)
+    for name, record in records.items():
+        writer.write(name, record.to_json())
+    writer.close()
 
 #################################
-# ADD ELEMENT TO PARENT MODEL FILE
+# DEFINE API RATE LIMITS
 #################################
 
-def add_parent_model_element(element):
+# Requests per second allowed for each SiteWise operation, shared by all
+# worker processes. Defaults follow the IoT SiteWise quotas page, set them to
+# the quotas of your account (including any increases) to run at full speed.
+# Operations not listed here are not rate limited.
+api_rate_limits= {
+    "CreateAssetModel": 10,
+    "UpdateAssetModel": 10,
+    "DescribeAssetModel": 50,
+    "DeleteAssetModel": 10,
+    "CreateAsset": 50,
+    "DescribeAsset": 50,
+    "DeleteAsset": 50,
+    "UpdateAssetProperty": 10,
+    "AssociateTimeSeriesToAssetProperty": 10,
+    "AssociateAssets": 30,
+    "DisassociateAssets": 30,
+    "BatchPutAssetPropertyValue": 1000,
+    "ListAssetModels": 10,
+    "ListAssets": 10,
+    "ListAssociatedAssets": 10,
+    "ListTagsForResource": 10,
+    "ListTimeSeries": 10
+}
+
+# Number of worker processes used to send API calls. The rate limits above
+# keep the workers under quota, this only bounds how many calls are in flight.
+worker_processes= 45
+
+#################################
+# API RATE LIMITER
+#################################
+
+# Token bucket per operation, kept in shared memory so that every worker
+# process draws from the same budget. Each bucket refills at the configured
+# TPS and holds at most one second of burst, and at least one request.
+class RateLimiter:
+
+    def __init__(self, rates):
+        self.operations= list(rates)
+        self.index= {operation: i for i, operation in enumerate(self.operations)}
+        self.account_rates= [float(rates[operation]) for operation in self.operations]
+        self.rates= multiprocessing.RawArray('d', self.account_rates)
+        now= t.monotonic()
+        
+        self.lock= multiprocessing.Lock()
+        self.tokens= multiprocessing.RawArray('d', self.account_rates)
+        self.updated= multiprocessing.RawArray('d', [now] * len(self.operations))
+        
+        # Usage statistics
+        self.calls= multiprocessing.RawArray('q', len(self.operations))
+        self.throttled_calls= multiprocessing.RawArray('q', len(self.operations))
+        self.delayed_calls= multiprocessing.RawArray('q', len(self.operations))
+        self.wait_time= multiprocessing.RawArray('d', len(self.operations))
+        self.max_wait= multiprocessing.RawArray('d', len(self.operations))
+        self.first_call= multiprocessing.RawArray('d', len(self.operations))
+        self.last_call= multiprocessing.RawArray('d', len(self.operations))
+    
+    # Block until a request for operation is allowed, returns the time waited
+    def acquire(self, operation):
+        if operation not in self.index:
+            return 0.0
+        i= self.index[operation]
+        begin= t.monotonic()
+        
+        while True:
+            with self.lock:
+                now= t.monotonic()
+                # Refill the bucket for the time elapsed since the last request
+                self.tokens[i]= min(max(self.rates[i], 1), self.tokens[i] + (now - self.updated[i]) * self.rates[i])
+                self.updated[i]= now
+                
+                if self.tokens[i] >= 1:
+                    self.tokens[i]-= 1
+                    waited= now - begin
+                    
+                    self.calls[i]+= 1
+                    if self.first_call[i] == 0:
+                        self.first_call[i]= now
+                    self.last_call[i]= now
+                    if waited > 0.001:
+                        self.delayed_calls[i]+= 1
+                        self.wait_time[i]+= waited
+                        self.max_wait[i]= max(self.max_wait[i], waited)
+                    return waited
+                
+                # Time until the next token is available
+                delay= (1 - self.tokens[i]) / self.rates[i]
+            t.sleep(delay)
     
-    # Read latest version of the file
-    with open(parent_models_path, 'r') as file:
-        parent_models = json.load(file)
+    # A call was throttled by SiteWise: the budget is used by another client
+    # of the account as well, so the bucket is emptied and the next calls
+    # wait for new tokens
+    def throttled(self, operation):
+        if operation not in self.index:
+            return
+        i= self.index[operation]
+        with self.lock:
+            self.throttled_calls[i]+= 1
+            self.tokens[i]= min(self.tokens[i], 0)
     
-    # Add the element in key
-    parent_models.append(element)
+    # Use a fraction of the account rates, when the budget is shared with
+    # workers on other hosts
+    def share(self, fraction):
+        with self.lock:
+            for i, rate in enumerate(self.account_rates):
+                self.rates[i]= rate * fraction
+                self.tokens[i]= min(self.tokens[i], max(self.rates[i], 1))
     
-    # Write the updated version back to the file
-    with open(parent_models_path, "w") as outfile:
-        outfile.write(json.dumps(parent_models, indent=4))
+    # Print the share of each budget that was used and how long calls waited
+    def report(self):
+        print("\nAPI rate limiter usage:")
+        for i, operation in enumerate(self.operations):
+            if self.calls[i] == 0:
+                continue
+            # Requests allowed between first and last call, including the initial burst
+            budget= self.rates[i] * (self.last_call[i] - self.first_call[i]) + self.rates[i]
+            print(f"\t{operation}: {self.calls[i]} calls at {self.rates[i]:g} TPS, "
+                  f"{100 * self.calls[i] / budget:.1f}% of budget used, "
+                  f"{self.delayed_calls[i]} calls waited {self.wait_time[i]:.2f}s in total "
+                  f"(max {self.max_wait[i]:.2f}s), {self.throttled_calls[i]} throttled")
 
 #################################
-# DELETE ELEMENT FROM PARENT MODEL FILE
+# API METRICS
 #################################
 
-def delete_parent_model_element(element):
+# Phase of the deployment a call is made for. Calls made by the functions of
+# a phase, see metrics_phase, are counted under it, all other calls under
+# the action that is running.
+metric_phases= ["models", "assets", "aliases", "attributes", "associations", "delete", "create", "apply", "enqueue", "worker", "discover"]
+
+# Upper bounds of the latency histogram buckets, in seconds
+latency_buckets= [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+# Calls, throttles, retries, errors, latency histogram and limiter wait time
+# per operation and phase, kept in shared memory like the rate limiter so
+# that the calls of every worker process are counted together
+class ApiMetrics:
+    
+    def __init__(self, operations, default_phase):
+        self.operations= list(operations)
+        self.index= {operation: i for i, operation in enumerate(self.operations)}
+        self.phase_index= {phase: i for i, phase in enumerate(metric_phases)}
+        self.default_phase= default_phase
+        self.started= t.time()
+        series= len(self.operations) * len(metric_phases)
+        
+        self.lock= multiprocessing.Lock()
+        self.calls= multiprocessing.RawArray('q', series)
+        self.throttles= multiprocessing.RawArray('q', series)
+        # Calls that failed with an error the script tries again after
+        self.retries= multiprocessing.RawArray('q', series)
+        # Calls that failed with any other error
+        self.errors= multiprocessing.RawArray('q', series)
+        self.latency_sum= multiprocessing.RawArray('d', series)
+        self.latency_max= multiprocessing.RawArray('d', series)
+        self.limiter_wait= multiprocessing.RawArray('d', series)
+        # One count per bucket and one for the calls slower than the last bucket
+        self.histogram= multiprocessing.RawArray('q', series * (len(latency_buckets) + 1))
+    
+    def record(self, operation, latency, waited, error_class=None, throttled=False):
+        phase= getattr(task_context, "phase", None) or self.default_phase
+        if operation not in self.index or phase not in self.phase_index:
+            return
+        i= self.index[operation] * len(metric_phases) + self.phase_index[phase]
+        bucket= next((b for b, bound in enumerate(latency_buckets) if latency <= bound), len(latency_buckets))
+        with self.lock:
+            self.calls[i]+= 1
+            self.throttles[i]+= throttled
+            if error_class == "fatal":
+                self.errors[i]+= 1
+            elif error_class is not None:
+                self.retries[i]+= 1
+            self.latency_sum[i]+= latency
+            self.latency_max[i]= max(self.latency_max[i], latency)
+            self.limiter_wait[i]+= waited
+            self.histogram[i * (len(latency_buckets) + 1) + bucket]+= 1
+    
+    # Every operation and phase with calls, as a list of dictionaries. The
+    # latency percentiles are the upper bounds of the buckets they fall in.
+    def snapshot(self):
+        with self.lock:
+            series= []
+            for operation, o in self.index.items():
+                for phase, p in self.phase_index.items():
+                    i= o * len(metric_phases) + p
+                    if self.calls[i] == 0:
+                        continue
+                    buckets= list(self.histogram[i * (len(latency_buckets) + 1):(i + 1) * (len(latency_buckets) + 1)])
+                    series.append({
+                        "operation": operation,
+                        "phase": phase,
+                        "calls": self.calls[i],
+                        "throttles": self.throttles[i],
+                        "retries": self.retries[i],
+                        "errors": self.errors[i],
+                        "latency_seconds_sum": round(self.latency_sum[i], 6),
+                        "latency_seconds_max": round(self.latency_max[i], 6),
+                        "latency_seconds_p50": latency_percentile(buckets, 0.5, self.latency_max[i]),
+                        "latency_seconds_p90": latency_percentile(buckets, 0.9, self.latency_max[i]),
+                        "latency_seconds_p99": latency_percentile(buckets, 0.99, self.latency_max[i]),
+                        "limiter_wait_seconds": round(self.limiter_wait[i], 6),
+                        "latency_buckets": buckets
+                    })
+            return series
+
+def latency_percentile(buckets, fraction, latency_max):
+    rank= fraction * sum(buckets)
+    count= 0
+    for b, bucket_count in enumerate(buckets):
+        count+= bucket_count
+        if count >= rank:
+            return latency_buckets[b] if b < len(latency_buckets) else round(latency_max, 6)
+    return round(latency_max, 6)
+
+# Metrics of this run, shared with the workers by init_worker
+api_metrics= None
+
+# Count the calls made by function under phase, also when it is called from
+# the function of another phase, and trace every call of function as a span
+# of the resource it works on
+def metrics_phase(phase):
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            outer_phase= getattr(task_context, "phase", None)
+            task_context.phase= phase
+            try:
+                resource= task_resource(args)
+                with trace_span((phase + " " + resource).strip(), phase, resource=resource):
+                    return function(*args, **kwargs)
+            finally:
+                task_context.phase= outer_phase
+        return wrapper
+    return decorator
+
+# Run function on the threads of an executor with the task context of the
+# calling thread: its phase, span, and the failures and steps of its task
+def with_task_context(function):
+    context= dict(vars(task_context))
+    def wrapper(*args):
+        vars(task_context).update(context)
+        try:
+            return function(*args)
+        finally:
+            vars(task_context).clear()
+    return wrapper
+
+def prometheus_labels(entry, **labels):
+    labels= dict({"operation": entry["operation"], "phase": entry["phase"]}, **labels)
+    return "{" + ",".join(key + '="' + value + '"' for key, value in labels.items()) + "}"
+
+# Write the metrics to metrics_path as JSON, and to metrics_textfile_path in
+# the Prometheus text format, for the textfile collector of node_exporter.
+# Both files are replaced at once, a reader never sees half of them.
+def write_metrics():
+    if api_metrics is None:
+        return
+    series= api_metrics.snapshot()
+    totals= {}
+    for entry in series:
+        total= totals.setdefault(entry["operation"], {"calls": 0, "throttles": 0, "retries": 0, "errors": 0, "latency_seconds_sum": 0, "limiter_wait_seconds": 0})
+        for key in total:
+            total[key]= round(total[key] + entry[key], 6)
+    metrics= {
+        "started": api_metrics.started,
+        "elapsed_seconds": round(t.time() - api_metrics.started, 3),
+        "latency_buckets": latency_buckets,
+        "operations": totals,
+        "series": series
+    }
+    with open(metrics_path + ".tmp", "w") as outfile:
+        outfile.write(json.dumps(metrics, indent=4))
+    os.replace(metrics_path + ".tmp", metrics_path)
+    
+    lines= []
+    for name, key, kind, description in (
+        ("sitewise_api_calls_total", "calls", "counter", "SiteWise API calls sent"),
+        ("sitewise_api_throttles_total", "throttles", "counter", "SiteWise API calls throttled"),
+        ("sitewise_api_retries_total", "retries", "counter", "SiteWise API calls failed with an error that is retried"),
+        ("sitewise_api_errors_total", "errors", "counter", "SiteWise API calls failed with an error that is not retried"),
+        ("sitewise_api_limiter_wait_seconds_total", "limiter_wait_seconds", "counter", "Time SiteWise API calls waited for the rate limiter")
+    ):
+        lines.append("# HELP " + name + " " + description)
+        lines.append("# TYPE " + name + " " + kind)
+        lines.extend(name + prometheus_labels(entry) + " " + str(entry[key]) for entry in series)
+    lines.append("# HELP sitewise_api_latency_seconds Latency of SiteWise API calls")
+    lines.append("# TYPE sitewise_api_latency_seconds histogram")
+    for entry in series:
+        count= 0
+        for bound, bucket_count in zip(latency_buckets + ["+Inf"], entry["latency_buckets"]):
+            count+= bucket_count
+            lines.append("sitewise_api_latency_seconds_bucket" + prometheus_labels(entry, le=str(bound)) + " " + str(count))
+        lines.append("sitewise_api_latency_seconds_sum" + prometheus_labels(entry) + " " + str(entry["latency_seconds_sum"]))
+        lines.append("sitewise_api_latency_seconds_count" + prometheus_labels(entry) + " " + str(entry["calls"]))
+    with open(metrics_textfile_path + ".tmp", "w") as outfile:
+        outfile.write("\n".join(lines) + "\n")
+    os.replace(metrics_textfile_path + ".tmp", metrics_textfile_path)
+
+# Write the metrics every interval seconds while the run goes on
+def flush_metrics_periodically(interval):
+    def flush():
+        while True:
+            t.sleep(interval)
+            write_metrics()
+    threading.Thread(target=flush, daemon=True).start()
+
+#################################
+# TRACING
+#################################
+
+# With --trace, every resource operation, API call and wait is recorded as a
+# span. Each process appends its spans to trace_events_path as they end, and
+# write_trace turns them into a trace in the Chrome trace event format, which
+# opens in Perfetto or chrome://tracing. Set by init_worker in the workers.
+tracing= False
+
+# Span ids are unique across processes: process id, then a counter
+span_counter= itertools.count()
+
+# Trace file descriptor of the current process
+trace_fd= None
+trace_pid= None
+
+def trace_event(name, category, begin, end, **args):
+    global trace_fd, trace_pid
+    if not tracing:
+        return None
+    # Workers forked from the main process open their own descriptor
+    if trace_fd is None or trace_pid != os.getpid():
+        trace_fd= os.open(trace_events_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        trace_pid= os.getpid()
+    span_id= args.pop("span_id", None) or str(os.getpid()) + "." + str(next(span_counter))
+    event= {
+        "name": name,
+        "cat": category,
+        "ph": "X",
+        "ts": round(begin * 1e6),
+        "dur": round((end - begin) * 1e6),
+        "pid": os.getpid(),
+        "tid": threading.get_ident(),
+        "args": dict(args, span_id=span_id, parent_id=getattr(task_context, "span", None), worker=str(os.getpid()) + "/" + threading.current_thread().name)
+    }
+    os.write(trace_fd, (json.dumps(event) + "\n").encode())
+    return span_id
+
+# Trace the code of a with block as a span, the child of the span that is open
+# on this thread
+@contextlib.contextmanager
+def trace_span(name, category, **args):
+    if not tracing:
+        yield
+        return
+    parent= getattr(task_context, "span", None)
+    span_id= str(os.getpid()) + "." + str(next(span_counter))
+    task_context.span= span_id
+    begin= t.time()
+    try:
+        yield
+    finally:
+        task_context.span= parent
+        trace_event(name, category, begin, t.time(), span_id=span_id, **args)
+
+# Start the trace of a new run
+def start_trace():
+    global tracing
+    tracing= True
+    if os.path.exists(trace_events_path):
+        os.remove(trace_events_path)
+
+# Find the chain of dependent spans that set the runtime. Starting from the
+# top level span that ended last, each step goes back to the span it waited
+# for: the dependency that ended last for work items of the dag engine,
+# otherwise the top level span that ended last before it started, as the
+# phases of the other engines start once the previous phase is done. The gap
+# before a step is time it waited for a worker, a backoff or the limiter.
+def critical_path(events):
+    spans= [event for event in events if event["ph"] == "X"]
+    if not spans:
+        return []
+    top_level= sorted((event for event in spans if event["args"]["parent_id"] is None), key=lambda event: event["ts"] + event["dur"])
+    by_key= {event["args"]["key"]: event for event in top_level if "key" in event["args"]}
+    children= collections.defaultdict(list)
+    for event in spans:
+        children[event["args"]["parent_id"]].append(event)
+    
+    # Time spent in API calls, waits and limiter waits under a span, by name
+    def breakdown(span):
+        totals= collections.Counter()
+        stack= list(children[span["args"]["span_id"]])
+        while stack:
+            event= stack.pop()
+            if event["cat"] in ("api", "limiter"):
+                totals[event["name"]]+= event["dur"]
+            else:
+                stack.extend(children[event["args"]["span_id"]])
+        return {name: round(duration / 1e6, 3) for name, duration in totals.most_common(5)}
+    
+    path= []
+    step= top_level[-1] if top_level else max(spans, key=lambda event: event["ts"] + event["dur"])
+    while step is not None:
+        path.append(step)
+        dependencies= [by_key[key] for key in step["args"].get("dependencies", []) if key in by_key]
+        candidates= dependencies or [event for event in top_level if event["ts"] + event["dur"] <= step["ts"]]
+        step= max(candidates, key=lambda event: event["ts"] + event["dur"], default=None)
+    path.reverse()
+    
+    origin= min(event["ts"] for event in spans)
+    summary= []
+    previous_end= origin
+    for step in path:
+        summary.append({
+            "name": step["name"],
+            "start_seconds": round((step["ts"] - origin) / 1e6, 3),
+            "duration_seconds": round(step["dur"] / 1e6, 3),
+            "waited_seconds": round(max(0, step["ts"] - previous_end) / 1e6, 3),
+            "worker": step["args"]["worker"],
+            "calls": breakdown(step)
+        })
+        previous_end= step["ts"] + step["dur"]
+    return summary
+
+# Longest steps of the critical path printed at the end of the run, the whole
+# path is in the trace
+critical_path_print_steps= 20
+
+# Write the spans of the run to trace_path in the Chrome trace event format,
+# with the names of the worker processes and threads, and print the critical
+# path of the run
+def write_trace():
+    if not tracing or not os.path.exists(trace_events_path):
+        return
+    with open(trace_events_path, "r") as file:
+        events= [json.loads(line) for line in file if line.endswith("\n")]
+    path= critical_path(events)
+    
+    workers= {}
+    for event in events:
+        workers.setdefault((event["pid"], event["tid"]), event["args"]["worker"].split("/", 1)[1])
+    for (pid, tid), thread_name in workers.items():
+        events.append({"name": "process_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": "sw_infra" if pid == os.getpid() else "worker " + str(pid)}})
+        events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}})
+    
+    with open(trace_path + ".tmp", "w") as outfile:
+        outfile.write(json.dumps({"traceEvents": events, "displayTimeUnit": "ms", "otherData": {"critical_path": path}}))
+    os.replace(trace_path + ".tmp", trace_path)
+    
+    print("\nCritical path, " + str(len(path)) + " steps (trace written to " + trace_path + "):")
+    longest= sorted(path, key=lambda step: step["duration_seconds"] + step["waited_seconds"])[-critical_path_print_steps:]
+    if len(longest) < len(path):
+        print("\t" + str(len(longest)) + " longest steps:")
+    for step in (step for step in path if step in longest):
+        calls= ", ".join(name + " " + str(duration) + "s" for name, duration in step["calls"].items())
+        print(f"\t+{step['start_seconds']:.2f}s {step['name']}: {step['duration_seconds']:.2f}s"
+              f", after waiting {step['waited_seconds']:.2f}s" + (" (" + calls + ")" if calls else ""))
+
+# Limiter shared by the main process and all workers, set by init_worker
+rate_limiter= None
+
+# Property name to property id for each asset model name, set by init_worker
+property_index= {}
+
+# Steps completed by previous CREATE runs, see load_checkpoints. Set by init_worker
+checkpoints= {}
+
+def init_worker(limiter, properties=None, done=None, metrics=None, trace=False, series=None):
+    global session, client, client_lock, max_pool_connections, rate_limiter, property_index, checkpoints, api_metrics, tracing, time_series_index
+    # A forked worker must not share the HTTP connections of its parent, it
+    # creates its own client for the one task it runs at a time and its alias
+    # updates
+    session, client, client_lock= None, None, threading.Lock()
+    max_pool_connections= 1 + alias_concurrency
+    rate_limiter= limiter
+    if properties is not None:
+        property_index= properties
+    if done is not None:
+        checkpoints= done
+    api_metrics= metrics
+    tracing= trace
+    time_series_index= series
+
+# Make a SiteWise API call once the rate limiter allows it
+def sitewise_call(operation, **kwargs):
+    waited= rate_limiter.acquire(operation) if rate_limiter is not None else 0.0
+    if waited > 0.001:
+        trace_event("wait " + operation, "limiter", t.time() - waited, t.time())
+    begin= t.monotonic()
+    try:
+        with trace_span(operation, "api"):
+            response= getattr(get_client(), botocore.xform_name(operation))(**kwargs)
+    except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as err:
+        throttled= isinstance(err, botocore.exceptions.ClientError) and err.response['Error']['Code'] in ("ThrottlingException", "TooManyRequestsException")
+        if rate_limiter is not None and throttled:
+            rate_limiter.throttled(operation)
+        if api_metrics is not None:
+            api_metrics.record(operation, t.monotonic() - begin, waited, classify_error(err), throttled)
+        raise
+    if api_metrics is not None:
+        api_metrics.record(operation, t.monotonic() - begin, waited)
+    return response
+
+#################################
+# RETRY POLICY
+#################################
+
+# Every failed call is classified as:
+#   retryable: throttled, or failed on the service side or on the way there
+#   conflict: the resource is busy, for example still creating or updating
+#   fatal: the request itself is wrong, trying again does not help
+# A task that fails with a retryable or conflict error is deferred by its
+# engine and run again after a backoff, while the worker runs other tasks.
+# Fatal errors, and tasks that ran out of attempts, are reported at the end
+# of the run.
+retryable_error_codes= (
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "InternalFailureException",
+    "ServiceUnavailableException",
+    "RequestTimeout",
+    "RequestTimeoutException"
+)
+conflict_error_codes= (
+    "ConflictingOperationException",
+)
+
+# Attempts of a task before it is reported as failed
+retry_max_attempts= 8
+
+# Backoff before the next attempt of a task, in seconds. It doubles with every
+# attempt up to retry_max_delay, and a random part of it is used so that
+# deferred tasks do not all come back at once. Conflicts start with a longer
+# backoff, to give the resource time to settle.
+retry_base_delay= 0.5
+conflict_base_delay= 2
+retry_max_delay= 60
+
+def classify_error(err):
+    if isinstance(err, botocore.exceptions.ClientError):
+        if err.response['Error']['Code'] in retryable_error_codes or err.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500:
+            return "retryable"
+        if err.response['Error']['Code'] in conflict_error_codes:
+            return "conflict"
+        return "fatal"
+    # The connection failed or timed out
+    if isinstance(err, (botocore.exceptions.ConnectionError, botocore.exceptions.HTTPClientError)):
+        return "retryable"
+    return "fatal"
+
+def retry_delay(error_class, attempt):
+    base_delay= conflict_base_delay if error_class == "conflict" else retry_base_delay
+    return random.uniform(0, min(retry_max_delay, base_delay * 2 ** attempt))
+
+def error_message(err):
+    if isinstance(err, botocore.exceptions.ClientError):
+        return err.response['Error']['Code'] + ": " + err.response['Error']['Message']
+    return repr(err)
+
+# Operations that failed permanently in this process, as (operation,
+# resource, error). Failures in worker processes are handed back by call_task.
+failed_operations= []
+
+# Checkpoints and failures of the task running on this thread, see call_task
+task_context= threading.local()
+
+def record_failure(operation, resource, error):
+    getattr(task_context, "failures", failed_operations).append((operation, resource, error if isinstance(error, str) else error_message(error)))
+
+# Let an error reach the engine if the task can be tried again later,
+# otherwise print and record it
+def defer_or_fail(err, operation, resource):
+    if classify_error(err) != "fatal":
+        raise err
+    print(str(err) + "\n")
+    record_failure(operation, resource, err)
+
+def report_failures():
+    if not failed_operations:
+        return
+    print(f"\n{len(failed_operations)} operations failed permanently:")
+    for operation, resource, error in failed_operations:
+        print("\t" + operation + " " + resource + ": " + error)
+
+# Tasks waiting for their backoff to end, in the order they are due
+class DeferredTasks:
+    
+    def __init__(self):
+        self.heap= []
+        self.sequence= itertools.count()
     
-    # Read latest version of the file
-    with open(parent_models_path, 'r') as file:
-        parent_models = json.load(file)
+    def __len__(self):
+        return len(self.heap)
     
-    # Delete the element from key
-    parent_models.remove(element)
+    def defer(self, task, delay):
+        heapq.heappush(self.heap, (t.monotonic() + delay, next(self.sequence), task))
     
-    # Write the updated version back to the file
-    with open(parent_models_path, "w") as outfile:
-        outfile.write(json.dumps(parent_models, indent=4))
+    # The first task whose backoff ended, or None
+    def pop_due(self):
+        if self.heap and self.heap[0][0] <= t.monotonic():
+            return heapq.heappop(self.heap)[2]
+        return None
+    
+    # Seconds until the next task is due, None if no task is deferred
+    def wait_time(self):
+        if not self.heap:
+            return None
+        return max(0, self.heap[0][0] - t.monotonic())
+
+# Run function on every item with executor. An item that fails with a
+# retryable error is deferred and run again once its backoff ended, while the
+# other items keep running. Returns the result of every item, or the error it
+# failed with permanently.
+def map_deferred(executor, function, items):
+    
+    deferred= DeferredTasks()
+    futures= {}
+    results= {}
+    for item in items:
+        futures[executor.submit(function, item)]= (item, 0)
+    
+    while futures or len(deferred):
+        item= deferred.pop_due()
+        while item is not None:
+            futures[executor.submit(function, item[0])]= item
+            item= deferred.pop_due()
+        if not futures:
+            t.sleep(deferred.wait_time())
+            continue
         
+        # Wake up when an item is done or a deferred item is due
+        done, _= concurrent.futures.wait(futures, timeout=deferred.wait_time(), return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            item, attempt= futures.pop(future)
+            err= future.exception()
+            error_class= classify_error(err) if err is not None else None
+            if error_class in ("retryable", "conflict") and attempt + 1 < retry_max_attempts:
+                deferred.defer((item, attempt + 1), retry_delay(error_class, attempt))
+            else:
+                results[item]= err if err is not None else future.result()
+    
+    return results
+
 #################################
-# ADD ELEMENT TO ASSET HIERARCHY FILE
+# WAIT FOR RESOURCES
 #################################
 
-def add_asset_hierarchy_mapping_element(element):
+# Backoff between status polls, in seconds
+waiter_initial_delay= 0.25
+waiter_max_delay= 5
+waiter_timeout= 900
+
+# Maximum number of describe calls in flight while polling a batch
+waiter_concurrency= 32
+
+# Describe operation, id parameter and status key for each resource type
+waiter_operations= {
+    "asset_model": ("DescribeAssetModel", "assetModelId", "assetModelStatus"),
+    "asset": ("DescribeAsset", "assetId", "assetStatus")
+}
+
+# Poll a batch of resources until they are ACTIVE, or until they are gone if
+# deleted is True. Every pending resource is polled concurrently on each pass,
+# with an exponential backoff between passes. Returns the last describe
+# response of every resource that became ACTIVE.
+def wait_for_resources(resource_type, resource_ids, deleted=False):
+    with trace_span("wait " + resource_type + ("s deleted" if deleted else "s active"), "wait", count=len(resource_ids)):
+        return poll_resources(resource_type, resource_ids, deleted)
+
+def poll_resources(resource_type, resource_ids, deleted):
+    
+    operation, id_key, status_key= waiter_operations[resource_type]
+    
+    # Returns (exists, describe response)
+    def poll(resource_id):
+        try:
+            return True, sitewise_call(operation, **{id_key: resource_id})
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] == 'ResourceNotFoundException':
+                return False, None
+            # Throttled polls are tried again on the next pass
+            if classify_error(err) == "fatal":
+                print(str(err) + "\n")
+            return True, None
+    
+    responses= {}
+    pending= list(dict.fromkeys(resource_ids))
+    delay= waiter_initial_delay
+    deadline= t.monotonic() + waiter_timeout
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=waiter_concurrency) as executor:
+        while pending:
+            still_pending= []
+            for resource_id, (exists, response) in zip(pending, executor.map(with_task_context(poll), pending)):
+                if deleted:
+                    if exists:
+                        still_pending.append(resource_id)
+                    continue
+                
+                # A new resource may not be visible yet, keep polling
+                if response is None:
+                    still_pending.append(resource_id)
+                    continue
+                
+                state= response[status_key]['state']
+                if state == 'ACTIVE':
+                    responses[resource_id]= response
+                elif state == 'FAILED':
+                    print("\t" + resource_type + " " + resource_id + " FAILED: " + str(response[status_key].get('error')))
+                else:
+                    still_pending.append(resource_id)
+            
+            pending= still_pending
+            if pending:
+                if t.monotonic() + delay > deadline:
+                    print("\tTimed out waiting for " + str(len(pending)) + " " + resource_type + "(s): " + ", ".join(pending))
+                    break
+                t.sleep(delay)
+                delay= min(delay * 2, waiter_max_delay)
     
-    # Read latest version of the file
-    with open(asset_hierarchy_mapping_path, 'r') as file:
-        asset_hierarchy_list = json.load(file)
+    return responses
+
+# Describe a batch of resources concurrently, returns the describe response of
+# every resource that exists
+def describe_resources(resource_type, resource_ids):
+    
+    operation, id_key, status_key= waiter_operations[resource_type]
     
-    # Add the element in key
-    asset_hierarchy_list.append(element)
+    def describe(resource_id):
+        try:
+            return sitewise_call(operation, **{id_key: resource_id})
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] == 'ResourceNotFoundException':
+                return None
+            raise
     
-    with open(asset_hierarchy_mapping_path, "w") as outfile:
-        outfile.write(json.dumps(asset_hierarchy_list, indent=4))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=waiter_concurrency) as executor:
+        responses= map_deferred(executor, with_task_context(describe), dict.fromkeys(resource_ids))
+    for resource_id, response in responses.items():
+        if isinstance(response, Exception):
+            print(str(response) + "\n")
+            record_failure(operation, resource_id, response)
+    return {resource_id: response for resource_id, response in responses.items() if response is not None and not isinstance(response, Exception)}
 
 #################################
-# DELETE ELEMENT FROM ASSET HIERARCHY FILE
+# ASSET MODEL PROPERTY INDEX
 #################################
 
-def delete_asset_hierarchy_mapping_element(element):
+# Assets have the same property ids as their model, so one describe per model
+# is enough to map every measurement and attribute name to its property id
+def build_property_index(asset_models, describe_asset_model_responses):
+    
+    index= {}
+    for model_name, asset_model in asset_models.items():
+        describe_asset_model_response= describe_asset_model_responses.get(asset_model["assetModelId"])
+        if describe_asset_model_response is None:
+            continue
+        index[model_name]= {
+            asset_model_property["name"]: asset_model_property["id"]
+            for asset_model_property in describe_asset_model_response["assetModelProperties"]
+        }
+    return index
+
+#################################
+# STATE JOURNAL
+#################################
+
+# Every created or deleted resource is appended to the journal as one JSON
+# line. Each record is written with a single append so concurrent workers
+# never overwrite each other, and the journal is replayed to get the current
+# state. compact_journal() writes the state back to the files in created/.
+journal_path= "created/journal.jsonl"
+
+# fsync the journal after this many records or seconds, whichever comes first
+journal_fsync_records= 64
+journal_fsync_interval= 1.0
+
+# Journal keys. asset_model_ids holds the model of every asset and
+# checkpoints the completed CREATE steps, both are only kept in the journal.
+# The other keys are compacted to the created/ files.
+journal_keys= ("asset_models", "assets", "parent_models", "asset_hierarchy_mapping", "asset_model_ids", "checkpoints")
+
+# Journal file descriptor of the current process
+journal_fd= None
+journal_pid= None
+journal_unsynced= 0
+journal_synced_at= 0.0
+
+def journal_sync():
+    global journal_unsynced, journal_synced_at
+    if journal_fd is not None and journal_pid == os.getpid() and journal_unsynced:
+        os.fsync(journal_fd)
+        journal_unsynced= 0
+        journal_synced_at= t.monotonic()
+
+def journal_append(op, key, value):
+    global journal_fd, journal_pid, journal_unsynced
+    
+    # Workers forked from the main process open their own descriptor
+    if journal_fd is None or journal_pid != os.getpid():
+        journal_fd= os.open(journal_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        journal_pid= os.getpid()
+        journal_unsynced= 0
+        # Flush pending records when the process exits
+        multiprocessing.util.Finalize(None, journal_sync, exitpriority=10)
+    
+    record= json.dumps({"op": op, "key": key, "value": value}) + "\n"
+    os.write(journal_fd, record.encode())
+    
+    journal_unsynced+= 1
+    if journal_unsynced >= journal_fsync_records or t.monotonic() - journal_synced_at >= journal_fsync_interval:
+        journal_sync()
+
+# Replay the journal into a dictionary of lists, one per journal key. If there
+# is no journal yet, the state is read from the files in created/.
+def load_journal():
+    
+    if not os.path.exists(journal_path):
+        resources_file = {"asset_models": [], "assets": []}
+        parent_models = []
+        asset_hierarchy_list = []
+        # Missing files hold no resources
+        if os.path.exists(resources_path):
+            with open(resources_path, 'r') as file:
+                resources_file = json.load(file)
+        if os.path.exists(parent_models_path):
+            with open(parent_models_path, 'r') as file:
+                parent_models = json.load(file)
+        if os.path.exists(asset_hierarchy_mapping_path):
+            with open(asset_hierarchy_mapping_path, 'r') as file:
+                asset_hierarchy_list = json.load(file)
+        return {
+            "asset_models": resources_file["asset_models"],
+            "assets": resources_file["assets"],
+            "parent_models": parent_models,
+            "asset_hierarchy_mapping": asset_hierarchy_list,
+            "asset_model_ids": [],
+            "checkpoints": []
+        }
+    
+    # Ordered sets of elements, keyed by their JSON form
+    state= {key: {} for key in journal_keys}
+    with open(journal_path, 'r') as file:
+        for line in file:
+            try:
+                record= json.loads(line)
+            except ValueError:
+                # Record cut short by a crash
+                continue
+            element_key= json.dumps(record["value"], sort_keys=True)
+            if record["op"] == "add":
+                state[record["key"]][element_key]= record["value"]
+            else:
+                state[record["key"]].pop(element_key, None)
     
-    # Read latest version of the file
-    with open(asset_hierarchy_mapping_path, 'r') as file:
-        asset_hierarchy_list = json.load(file)
+    return {key: list(elements.values()) for key, elements in state.items()}
+
+# Write the journal state to the created/ files and rewrite the journal with
+# only the resources that still exist
+def compact_journal():
+    
+    journal_sync()
+    state= load_journal()
+    state["checkpoints"]= live_checkpoints(state)
     
-    # Add the element in key
-    asset_hierarchy_list.remove(element)
+    snapshots= [
+        (resources_path, {"asset_models": state["asset_models"], "assets": state["assets"]}),
+        (parent_models_path, state["parent_models"]),
+        (asset_hierarchy_mapping_path, state["asset_hierarchy_mapping"])
+    ]
+    for path, content in snapshots:
+        with open(path + ".tmp", "w") as outfile:
+            outfile.write(json.dumps(content, indent=4))
+        os.replace(path + ".tmp", path)
     
-    with open(asset_hierarchy_mapping_path, "w") as outfile:
-        outfile.write(json.dumps(asset_hierarchy_list, indent=4))
+    rewrite_journal(state)
+    return state
+
+# Replace the journal with the elements of state
+def rewrite_journal(state):
+    global journal_fd
+    with open(journal_path + ".tmp", "w") as outfile:
+        for key in journal_keys:
+            for element in state[key]:
+                outfile.write(json.dumps({"op": "add", "key": key, "value": element}) + "\n")
+        outfile.flush()
+        os.fsync(outfile.fileno())
+    os.replace(journal_path + ".tmp", journal_path)
+    # Records appended after this go to the new journal, not the replaced one
+    if journal_fd is not None and journal_pid == os.getpid():
+        os.close(journal_fd)
+    journal_fd= None
 
 #################################
-# CREATE MODELS
+# CHECKPOINTS
 #################################
 
-def create_asset_model(model):
+# Every completed CREATE step is recorded in the journal, so that a CREATE
+# run after a failure skips the steps that are already done. The "model" and
+# "asset" steps are keyed by name, with the ids of the resource as result.
+# The "aliases" and "attributes" steps are keyed by asset id.
+def checkpoint(step, name, result=None):
+    journal_append("add", "checkpoints", {"step": step, "name": name, "result": result})
+    remember_step(step, name, result)
+
+# Make a completed step known to this process, and to the next attempts of
+# the running task if it is deferred
+def remember_step(step, name, result=None):
+    checkpoints.setdefault(step, {})[name]= result
+    if hasattr(task_context, "steps"):
+        task_context.steps.append((step, name, result))
+
+# Checkpoints of the resources that still exist
+def live_checkpoints(state):
     
-    obj = {}
+    asset_models= set(state["asset_models"])
+    assets= set(state["assets"])
+    live= []
+    for element in state["checkpoints"]:
+        if element["step"] == "model":
+            alive= element["result"]["assetModelId"] in asset_models
+        elif element["step"] == "asset":
+            alive= element["result"]["assetId"] in assets
+        else:
+            alive= element["name"] in assets
+        if alive:
+            live.append(element)
+    return live
+
+# Replay the journal into a dictionary of completed steps. Associations are
+# read from the asset hierarchy mapping, keyed by "parentAssetId/childAssetId".
+def load_checkpoints():
+    
+    state= load_journal()
+    done= {"model": {}, "asset": {}, "aliases": {}, "attributes": {}, "association": {}}
+    for element in live_checkpoints(state):
+        done[element["step"]][element["name"]]= element["result"]
+    for element in state["asset_hierarchy_mapping"]:
+        done["association"][element["assetId"] + "/" + element["childAssetId"]]= element["hierarchyId"]
+    return done
+
+# Find a model left by a previous run, by name
+def find_asset_model(asset_model_name):
+    
+    kwargs= {"maxResults": 250}
+    while True:
+        list_asset_models_response= sitewise_call("ListAssetModels", **kwargs)
+        for summary in list_asset_models_response["assetModelSummaries"]:
+            if summary["name"] == asset_model_name:
+                return {"assetModelId": summary["id"], "assetModelArn": summary["arn"]}
+        if "nextToken" not in list_asset_models_response:
+            return None
+        kwargs["nextToken"]= list_asset_models_response["nextToken"]
+
+# Find an asset left by a previous run, by name among the assets of its model
+def find_asset(asset_name, asset_model_id):
+    
+    kwargs= {"assetModelId": asset_model_id, "filter": "ALL", "maxResults": 250}
+    while True:
+        list_assets_response= sitewise_call("ListAssets", **kwargs)
+        for summary in list_assets_response["assetSummaries"]:
+            if summary["name"] == asset_name:
+                return {"assetId": summary["id"], "assetArn": summary["arn"]}
+        if "nextToken" not in list_assets_response:
+            return None
+        kwargs["nextToken"]= list_assets_response["nextToken"]
+
+#################################
+# ADD ELEMENT TO RESOURCES FILE
+#################################
+
+def add_resources_element(key, element):
+    journal_append("add", key, element)
+
+#################################
+# DELETE ELEMENT FROM RESOURCES FILE
+#################################
+
+def delete_resources_element(key, element):
+    journal_append("remove", key, element)
+
+#################################
+# ADD ELEMENT TO PARENT MODEL FILE
+#################################
+
+def add_parent_model_element(element):
+    journal_append("add", "parent_models", element)
+
+#################################
+# DELETE ELEMENT FROM PARENT MODEL FILE
+#################################
+
+def delete_parent_model_element(element):
+    journal_append("remove", "parent_models", element)
+        
+#################################
+# ADD ELEMENT TO ASSET HIERARCHY FILE
+#################################
+
+def add_asset_hierarchy_mapping_element(element):
+    journal_append("add", "asset_hierarchy_mapping", element)
+
+#################################
+# DELETE ELEMENT FROM ASSET HIERARCHY FILE
+#################################
+
+def delete_asset_hierarchy_mapping_element(element):
+    journal_append("remove", "asset_hierarchy_mapping", element)
+
+#################################
+# CREATE MODELS
+#################################
+
+# Build the assetModelProperties of a model from its config
+def asset_model_properties(model):
     
     # Create asset property value array
     asset_property_values = []
@@ -277,21 +1381,41 @@ def create_asset_model(model):
                     }
                 })
     
+    return asset_property_values
+
+@metrics_phase("models")
+def create_asset_model(model, hierarchies=None):
+    
+    hierarchies= hierarchies or []
+    obj = {}
+    
+    # Model created by a previous run
+    if model['model_name'] in checkpoints.get("model", {}):
+        obj[model['model_name']]= AssetModelRecord.from_response(checkpoints["model"][model['model_name']])
+        return obj
+    
+    asset_property_values = asset_model_properties(model)
+    
     # Error handling of the create model API Call
     try:
         # Create Model
-        create_asset_model_response = client.create_asset_model(
+        create_asset_model_response = sitewise_call("CreateAssetModel",
             assetModelName= model['model_name'],
             assetModelDescription= model['model_description'],
             assetModelProperties= asset_property_values,
+            assetModelHierarchies= hierarchies,
             tags=tags
         )
         
         # Add asset model to list of assets
         add_resources_element("asset_models", create_asset_model_response["assetModelId"])
         
+        # Add parent model to parent models list
+        if hierarchies != []:
+            add_parent_model_element(create_asset_model_response["assetModelId"])
+        
         # Add asset model to return dictionary
-        obj[model['model_name']]= create_asset_model_response
+        obj[model['model_name']]= AssetModelRecord.from_response(create_asset_model_response)
     
     except botocore.exceptions.ClientError as err:
         if err.response['Error']['Code'] == 'InternalError': # Generic error
@@ -299,566 +1423,2868 @@ def create_asset_model(model):
             print('Error Message: {}'.format(err.response['Error']['Message']))
             print('Request ID: {}'.format(err.response['ResponseMetadata']['RequestId']))
             print('Http code: {}'.format(err.response['ResponseMetadata']['HTTPStatusCode']))
+            defer_or_fail(err, "CreateAssetModel", model['model_name'])
         
         elif err.response['Error']['Code'] == 'ResourceAlreadyExistsException':
-            # print('Error Message: {}'.format(err.response['Error']['Message']))
-            print("\tResource already exists!")
+            # Adopt the model left by a previous run
+            asset_model= find_asset_model(model['model_name'])
+            if asset_model is not None:
+                print("\tAdopting existing asset model: " + model['model_name'])
+                add_resources_element("asset_models", asset_model["assetModelId"])
+                if hierarchies != []:
+                    add_parent_model_element(asset_model["assetModelId"])
+                obj[model['model_name']]= AssetModelRecord.from_response(asset_model)
+            else:
+                print("\tResource already exists!")
+                record_failure("CreateAssetModel", model['model_name'], err)
         else:
-            print(str(err) + "\n")
+            defer_or_fail(err, "CreateAssetModel", model['model_name'])
     
-    t.sleep(1)
+    if model['model_name'] in obj:
+        asset_model= obj[model['model_name']]
+        checkpoint("model", model['model_name'], {"assetModelId": asset_model.assetModelId, "assetModelArn": asset_model.assetModelArn})
     
     return obj
 
 
 #################################
-# DELETE MODELS
-#################################
-
-def delete_asset_models(resources_file):  
-    
-    for asset_model in resources_file["asset_models"]:
-       
-        print("\tNow deleting asset model: "+ asset_model)
-        
-        # Error handling of the delete model API Call
-        try:
-            # Remove model from cloud
-            delete_asset_model_response = client.delete_asset_model(
-                assetModelId= asset_model
-            )
-            
-            # Remove model id from resources file
-            delete_resources_element("asset_models", asset_model)
-            
-        except botocore.exceptions.ClientError as err:
-            print(str(err) + "\n")
-        
-        t.sleep(0.5)
-    
-#################################
-# CREATE ASSETS
+# UPDATE MODELS
 #################################
-def return_elements(list_asset_properties_response, assetId):
-    arr=[]
-    # Get property id and then find out the name of the property
-    for assetPropertySummary in list_asset_properties_response["assetPropertySummaries"]:
-        describe_asset_property_response = client.describe_asset_property(
-            assetId= assetId,
-            propertyId= assetPropertySummary['id']
-        )
-        arr_input= {}
-        arr_input["assetName"]= describe_asset_property_response["assetName"]
-        arr_input["assetId"]= describe_asset_property_response["assetId"]
-        arr_input["propertyId"]= describe_asset_property_response["assetProperty"]["id"]
-        arr_input["assetPropertyName"]= describe_asset_property_response["assetProperty"]["name"]
-        arr.append(arr_input)
-    return arr
 
-def create_asset(asset, asset_models):
+# Update an existing model to match its config. Properties and hierarchies
+# that keep their name keep their id, so assets keep their data and aliases.
+@metrics_phase("models")
+def update_asset_model(model, hierarchies, asset_model_id):
     
     obj = {}
     
-    print("\tCreating Asset: " + str(asset['asset_name']))
-    # Error handling of the create asset API Call
+    # Error handling of the update model API Call
     try:
-        asset_model_id= asset_models[asset['model_name']]['assetModelId']
+        describe_asset_model_response = sitewise_call("DescribeAssetModel",
+            assetModelId= asset_model_id
+        )
+        property_ids= {asset_model_property["name"]: asset_model_property["id"] for asset_model_property in describe_asset_model_response["assetModelProperties"]}
+        hierarchy_ids= {asset_model_hierarchy["name"]: asset_model_hierarchy["id"] for asset_model_hierarchy in describe_asset_model_response["assetModelHierarchies"]}
         
-        create_asset_response = client.create_asset(
-            assetName= asset['asset_name'],
+        asset_property_values = asset_model_properties(model)
+        for asset_property_value in asset_property_values:
+            if asset_property_value["name"] in property_ids:
+                asset_property_value["id"]= property_ids[asset_property_value["name"]]
+        for hierarchy in hierarchies:
+            if hierarchy["name"] in hierarchy_ids:
+                hierarchy["id"]= hierarchy_ids[hierarchy["name"]]
+        
+        update_asset_model_response = sitewise_call("UpdateAssetModel",
             assetModelId= asset_model_id,
-            tags=tags,
-            assetDescription='Creating a SW Asset'
+            assetModelName= model['model_name'],
+            assetModelDescription= model['model_description'],
+            assetModelProperties= asset_property_values,
+            assetModelHierarchies= hierarchies
         )
-        # Add asset to list of assets created
-        add_resources_element("assets", create_asset_response["assetId"])
         
-        # Add asset to return dictionary
-        obj[asset['asset_name']]= create_asset_response
+        # Add parent model to parent models list
+        if hierarchies != []:
+            add_parent_model_element(asset_model_id)
         
+        obj[model['model_name']]= AssetModelRecord(asset_model_id, describe_asset_model_response["assetModelArn"])
+    
     except botocore.exceptions.ClientError as err:
-        if err.response['Error']['Code'] == 'ResourceAlreadyExistsException':
-            # print('Error Message: {}'.format(err.response['Error']['Message']))
-            print("Resource already exists!")
-        else:
-            print(str(err) + "\n")
+        defer_or_fail(err, "UpdateAssetModel", model['model_name'])
     
-    t.sleep(2)
+    return obj
+
+#################################
+# DELETE MODELS
+#################################
+
+@metrics_phase("delete")
+def delete_asset_model(asset_model_id, parent=False):
     
-    # establish array to store all measurments property data
-    json_arr=[]
+    print("\tNow deleting asset model: "+ asset_model_id)
     
-    # First API call without nextToken
-    list_asset_properties_response = client.list_asset_properties(
-        assetId= create_asset_response["assetId"],
-        maxResults= 250
-    )
-    # Add elements in resonse to array
-    for element in return_elements(list_asset_properties_response, create_asset_response["assetId"]):
-        json_arr.append(element)
-        
-    # Check if there was a next token
-    while "nextToken" in list_asset_properties_response:
-        # Make api call again with next token
-        list_asset_properties_response = client.list_asset_properties(
-            assetId= create_asset_response["assetId"],
-            nextToken= list_asset_properties_response["nextToken"],
-            maxResults= 250
+    # Error handling of the delete model API Call
+    try:
+        # Remove model from cloud
+        delete_asset_model_response = sitewise_call("DeleteAssetModel",
+            assetModelId= asset_model_id
         )
-        # Add elements in resonse to array
-        for element in return_elements(list_asset_properties_response, create_asset_response["assetId"]):
-            json_arr.append(element)
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
     
-    # print(len(json_arr))
+    # Confirm the model is gone before its child models are deleted
+    wait_for_resources("asset_model", [asset_model_id], deleted=True)
+    
+    # Remove model id from resources file
+    delete_resources_element("asset_models", asset_model_id)
+    if parent:
+        delete_parent_model_element(asset_model_id)
     
-    # Iterate through measurement, find property id of measurement, and update asset property with alias
-    if  asset['measurements'] != []:
-        for measurement in asset["measurements"]:
-            for json_element in json_arr:
-                if measurement["name"]==json_element["assetPropertyName"]:
-                    # Make sure asset is done creating
-                    t.sleep(5)
-                    try:
-                        update_asset_property_response = client.update_asset_property(
-                            assetId= json_element["assetId"],
-                            propertyId= json_element["propertyId"],
-                            propertyAlias= measurement["alias"],
-                            propertyNotificationState= measurement["notification_state"]
-                        )
-                    except botocore.exceptions.ClientError as err:
-                        if err.response['Error']['Code'] == 'ConflictingOperationException':
-                            print("\t\tTrying to add asset to alias data stream")
-                            try:
-                                # Run the update stream code
-                                response = client.associate_time_series_to_asset_property(
-                                    alias= measurement["alias"],
-                                    assetId= json_element["assetId"],
-                                    propertyId= json_element["propertyId"]
-                                )
-                                update_asset_property_response = client.update_asset_property(
-                                    assetId= json_element["assetId"],
-                                    propertyId= json_element["propertyId"],
-                                    propertyAlias= measurement["alias"],
-                                    propertyNotificationState= measurement["notification_state"]
-                                )
-                                print("\t\tAsset added to alias data stream")
-                            except botocore.exceptions.ClientError as err:
-                                print(str(err) + "\n")
-                        else:
-                            print(str(err) + "\n")
-                    
-                    # Break loop as we've found our match
-                    break
-    if  asset['attributes'] != []:
-        for attribute in asset["attributes"]:
-            for json_element in json_arr:
-                if attribute["name"]==json_element["assetPropertyName"]:
-                    try:
-                        
-                        # Check what type of entry is in the config file
-                        if type(attribute["value"]) is str:
-                            val={
-                                "stringValue": attribute["value"]
-                            }
-                        elif type(attribute["value"]) is int:
-                            val={
-                                "integerValue": attribute["value"]
-                            }
-                        elif type(attribute["value"]) is float:
-                            val={
-                                "doubleValue": attribute["value"]
-                            }
-                        elif type(attribute["value"]) is bool:
-                            val={
-                                "booleanValue": attribute["value"]
-                            }
-                        
-                        # Create entry json payload
-                        entry={
-                            "entryId": asset["asset_name"] + "-" + attribute["name"] + "-" + ''.join(random.choices(string.ascii_lowercase +
-                                string.digits, k = 7)),
-                            "assetId": json_element["assetId"],
-                            "propertyId": json_element["propertyId"],
-                            "propertyValues": [{
-                                "value": val,
-                                "timestamp": {
-                                    "timeInSeconds": int(t.time())
-                                }
-                            }]
-                        }
-                        entries=[]; entries.append(entry)
-                        
-                        # Make the BatchPutAssetPropertyValue API call to add attribute value
-                        batch_put_asset_property_value_response = client.batch_put_asset_property_value(
-                            entries=entries
-                        )
-                        
-                    except botocore.exceptions.ClientError as err:
-                        print(str(err) + "\n")
-                    # Break loop as we've found our match
-                    break
-    return obj
-
 #################################
-# DELETE ASSETS
+# CREATE ASSETS
 #################################
-
-def delete_assets(resources_file):
+@metrics_phase("assets")
+def create_asset(asset, asset_models):
     
-    for asset in resources_file['assets']:
-        
-        print("\tNow deleting asset: "+ asset)
-        
-        # Error handling of the delete asset API Call
+    obj = {}
+    attribute_values= []
+    if asset['model_name'] not in asset_models:
+        print("\tModel " + asset['model_name'] + " of asset " + asset['asset_name'] + " was not created")
+        record_failure("CreateAsset", asset['asset_name'], "model " + asset['model_name'] + " was not created")
+        return obj, attribute_values
+    asset_model_id= asset_models[asset['model_name']]['assetModelId']
+    
+    # Asset created by a previous run
+    if asset['asset_name'] in checkpoints.get("asset", {}):
+        obj[asset['asset_name']]= AssetRecord.from_response(checkpoints["asset"][asset['asset_name']])
+    
+    else:
+        print("\tCreating Asset: " + str(asset['asset_name']))
+        # Error handling of the create asset API Call
         try:
-            # Remove asset from cloud
-            response = client.delete_asset(
-                assetId= asset
+            create_asset_response = sitewise_call("CreateAsset",
+                assetName= asset['asset_name'],
+                assetModelId= asset_model_id,
+                tags=tags,
+                assetDescription='Creating a SW Asset'
             )
+            # Add asset to list of assets created, with its model for DELETE
+            add_resources_element("assets", create_asset_response["assetId"])
+            add_resources_element("asset_model_ids", {"assetId": create_asset_response["assetId"], "assetModelId": asset_model_id})
             
-            # Remove model id from resources file
-            delete_resources_element("assets", asset)
+            # Add asset to return dictionary
+            obj[asset['asset_name']]= AssetRecord.from_response(create_asset_response)
             
         except botocore.exceptions.ClientError as err:
-            print(str(err) + "\n")
+            if err.response['Error']['Code'] == 'ResourceAlreadyExistsException':
+                # Adopt the asset left by a previous run
+                existing_asset= find_asset(asset['asset_name'], asset_model_id)
+                if existing_asset is not None:
+                    print("\tAdopting existing asset: " + asset['asset_name'])
+                    add_resources_element("assets", existing_asset["assetId"])
+                    add_resources_element("asset_model_ids", {"assetId": existing_asset["assetId"], "assetModelId": asset_model_id})
+                    obj[asset['asset_name']]= AssetRecord.from_response(existing_asset)
+                else:
+                    print("Resource already exists!")
+                    record_failure("CreateAsset", asset['asset_name'], err)
+            else:
+                defer_or_fail(err, "CreateAsset", asset['asset_name'])
         
-        t.sleep(0.5)
+        if asset['asset_name'] not in obj:
+            return obj, attribute_values
+        created_asset= obj[asset['asset_name']]
+        checkpoint("asset", asset['asset_name'], {"assetId": created_asset.assetId, "assetArn": created_asset.assetArn})
+    
+    # Assets share the property ids of their model, look them up by name
+    asset_id= obj[asset['asset_name']].assetId
+    if asset['model_name'] not in property_index:
+        # The model failed or never became ACTIVE, its property ids are not known
+        if asset['measurements'] != [] or asset['attributes'] != []:
+            print("\tProperties of model " + asset['model_name'] + " are not known, aliases and attributes of asset " + asset['asset_name'] + " are not set")
+            record_failure("UpdateAssetProperty", asset['asset_name'], "the properties of model " + asset['model_name'] + " are not known")
+        return obj, attribute_values
+    asset_properties= property_index[asset['model_name']]
+    
+    # Make sure asset is done creating and set the aliases of its measurements
+    if  asset['measurements'] != [] and asset_id not in checkpoints.get("aliases", {}):
+        wait_for_resources("asset", [asset_id])
+        if update_asset_aliases(asset, asset_id):
+            checkpoint("aliases", asset_id)
+    
+    # Collect attribute values, they are written in batches across assets by put_attribute_values
+    if  asset['attributes'] != [] and asset_id not in checkpoints.get("attributes", {}):
+        for attribute in asset["attributes"]:
+            if attribute["name"] not in asset_properties:
+                continue
+            attribute_values.append((asset_id, asset_properties[attribute["name"]], attribute["value"]))
+    
+    return obj, attribute_values
+
+#################################
+# ALIASES
+#################################
+
+# Data stream of every alias found by build_time_series_index: alias to
+# (asset id, property id), or None for a data stream that is not associated
+# to any property. Aliases without a data stream are not in the index. Set by
+# init_worker in the workers, None if the data streams were not scanned.
+time_series_index= None
+
+# Alias updates in flight in each process, across all its assets
+alias_concurrency= 8
+
+# Executor of the alias updates of the current process
+alias_executor= None
+alias_executor_pid= None
+
+def get_alias_executor():
+    global alias_executor, alias_executor_pid
+    # Threads do not survive a fork, a worker starts its own executor
+    if alias_executor is None or alias_executor_pid != os.getpid():
+        alias_executor= concurrent.futures.ThreadPoolExecutor(max_workers=alias_concurrency)
+        alias_executor_pid= os.getpid()
+    return alias_executor
+
+# Longest prefix of the aliases in the assets config, the data stream scan is
+# limited to it
+def config_alias_prefix(assets=None):
+    prefix= None
+    for asset in assets if assets is not None else iter_config(assets_path):
+        for measurement in asset["measurements"]:
+            # Measurements without an alias get none set, like in validate_config
+            if measurement.get("alias") is None:
+                continue
+            prefix= measurement["alias"] if prefix is None else os.path.commonprefix([prefix, measurement["alias"]])
+    return prefix or ""
+
+# Index the data streams whose alias starts with prefix, with one paginated scan
+def build_time_series_index(prefix=""):
+    index= {}
+    kwargs= {"aliasPrefix": prefix} if prefix else {}
+    for summary in list_all("ListTimeSeries", "TimeSeriesSummaries", **kwargs):
+        if "alias" in summary:
+            index[summary["alias"]]= (summary["assetId"], summary["propertyId"]) if "assetId" in summary else None
+    return index
+
+# Set the alias of every measurement of an asset, all of them concurrently.
+# Returns False if an alias could not be set.
+@metrics_phase("aliases")
+def update_asset_aliases(asset, asset_id):
+    
+    if asset['model_name'] not in property_index:
+        print("\tProperties of model " + asset['model_name'] + " are not known, aliases of asset " + asset['asset_name'] + " are not set")
+        record_failure("UpdateAssetProperty", asset['asset_name'], "the properties of model " + asset['model_name'] + " are not known")
+        return False
+    asset_properties= property_index[asset['model_name']]
+    measurements= [measurement for measurement in asset["measurements"] if measurement["name"] in asset_properties and measurement.get("alias") is not None]
+    update= with_task_context(lambda measurement: update_asset_alias(asset_id, asset_properties[measurement["name"]], measurement))
+    return all(list(get_alias_executor().map(update, measurements)))
+
+# Set the alias of one asset property. The data stream of the alias in
+# time_series_index tells which calls it needs: a new alias is set with
+# UpdateAssetProperty, a data stream that exists but is not associated is
+# first associated to the property, and a data stream associated to another
+# property is reported. Returns False if the alias could not be set.
+def update_asset_alias(asset_id, property_id, measurement):
+    
+    indexed= time_series_index is not None and measurement["alias"] in time_series_index
+    data_stream= time_series_index.get(measurement["alias"]) if indexed else None
+    if data_stream is not None and tuple(data_stream) != (asset_id, property_id):
+        print("\t\tAlias " + measurement["alias"] + " is used by property " + data_stream[1] + " of asset " + data_stream[0])
+        record_failure("UpdateAssetProperty", measurement["alias"], "the alias is used by property " + data_stream[1] + " of asset " + data_stream[0])
+        return False
+    
+    operation= "UpdateAssetProperty"
+    try:
+        if indexed and data_stream is None:
+            operation= "AssociateTimeSeriesToAssetProperty"
+            sitewise_call("AssociateTimeSeriesToAssetProperty",
+                alias= measurement["alias"],
+                assetId= asset_id,
+                propertyId= property_id
+            )
+            operation= "UpdateAssetProperty"
+        sitewise_call("UpdateAssetProperty",
+            assetId= asset_id,
+            propertyId= property_id,
+            propertyAlias= measurement["alias"],
+            propertyNotificationState= measurement["notification_state"]
+        )
+        return True
+    except botocore.exceptions.ClientError as err:
+        # A data stream of the alias that is not in the index, it was created
+        # after the scan or the data streams were not scanned
+        if indexed or err.response['Error']['Code'] != 'ConflictingOperationException':
+            defer_or_fail(err, operation, measurement["alias"])
+            return False
+    
+    print("\t\tTrying to add asset to alias data stream")
+    try:
+        sitewise_call("AssociateTimeSeriesToAssetProperty",
+            alias= measurement["alias"],
+            assetId= asset_id,
+            propertyId= property_id
+        )
+        sitewise_call("UpdateAssetProperty",
+            assetId= asset_id,
+            propertyId= property_id,
+            propertyAlias= measurement["alias"],
+            propertyNotificationState= measurement["notification_state"]
+        )
+        print("\t\tAsset added to alias data stream")
+        return True
+    except botocore.exceptions.ClientError as err:
+        defer_or_fail(err, "AssociateTimeSeriesToAssetProperty", measurement["alias"])
+        return False
+
+#################################
+# ATTRIBUTE VALUES
+#################################
+
+# BatchPutAssetPropertyValue accepts up to 10 entries per request
+attribute_batch_size= 10
+
+# Number of batch requests in flight
+attribute_batch_concurrency= 16
+
+# Attribute values collected while assets are created are written once there
+# are this many of them
+attribute_flush_size= attribute_batch_size * attribute_batch_concurrency * 4
+
+# Entries failing with one of these errors are retried, up to the number of attempts
+attribute_batch_attempts= 5
+retryable_entry_errors= (
+    "ThrottlingException",
+    "LimitExceededException",
+    "InternalFailureException",
+    "ServiceUnavailableException",
+    "ConflictingOperationException",
+    "ConnectionError"
+)
+
+# Check what type of entry is in the config file
+def attribute_variant(value):
+    if type(value) is str:
+        return {"stringValue": value}
+    elif type(value) is int:
+        return {"integerValue": value}
+    elif type(value) is float:
+        return {"doubleValue": value}
+    elif type(value) is bool:
+        return {"booleanValue": value}
+
+# Send one batch of entries, returns the (entryId, errorCode, errorMessage) of every failed entry
+@metrics_phase("attributes")
+def put_attribute_batch(entries):
+    try:
+        batch_put_asset_property_value_response = sitewise_call("BatchPutAssetPropertyValue",
+            entries= entries
+        )
+    except botocore.exceptions.ClientError as err:
+        return [(entry["entryId"], err.response['Error']['Code'], err.response['Error']['Message']) for entry in entries]
+    except botocore.exceptions.BotoCoreError as err:
+        return [(entry["entryId"], "ConnectionError", str(err)) for entry in entries]
+    
+    return [
+        (error_entry["entryId"], error["errorCode"], error["errorMessage"])
+        for error_entry in batch_put_asset_property_value_response["errorEntries"]
+        for error in error_entry["errors"]
+    ]
+
+# Write (assetId, propertyId, value) attribute values in full batches, sent
+# concurrently. Entries that fail with a retryable error are deferred and
+# sent again, in batches of the entries due, once their backoff ended.
+# Returns the entries that could not be written.
+def put_attribute_values(attribute_values):
+    
+    timestamp= int(t.time())
+    pending= {}
+    for i, (asset_id, property_id, value) in enumerate(attribute_values):
+        pending[str(i)]= {
+            "entryId": str(i),
+            "assetId": asset_id,
+            "propertyId": property_id,
+            "propertyValues": [{
+                "value": attribute_variant(value),
+                "timestamp": {
+                    "timeInSeconds": timestamp
+                }
+            }]
+        }
+    
+    failed= []
+    deferred= DeferredTasks()
+    # (entry, attempt) of the entries of every batch in flight
+    futures= {}
+    due= [(entry, 0) for entry in pending.values()]
+    put_batch= with_task_context(put_attribute_batch)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=attribute_batch_concurrency) as executor:
+        while due or futures or len(deferred):
+            for i in range(0, len(due), attribute_batch_size):
+                batch= due[i:i + attribute_batch_size]
+                futures[executor.submit(put_batch, [entry for entry, _ in batch])]= batch
+            due= []
+            if not futures:
+                t.sleep(deferred.wait_time())
+            else:
+                # Wake up when a batch is done or a deferred entry is due
+                done, _= concurrent.futures.wait(futures, timeout=deferred.wait_time(), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    batch= futures.pop(future)
+                    errors= {}
+                    for entry_id, error_code, error_message in future.result():
+                        errors.setdefault(entry_id, (error_code, error_message))
+                    for entry, attempt in batch:
+                        if entry["entryId"] not in errors:
+                            continue
+                        error_code, error_message= errors[entry["entryId"]]
+                        if error_code in retryable_entry_errors and attempt + 1 < attribute_batch_attempts:
+                            deferred.defer((entry, attempt + 1), retry_delay("retryable", attempt))
+                        else:
+                            print("\tFailed to write attribute value of asset " + entry["assetId"] + ": " + error_code + " " + error_message)
+                            record_failure("BatchPutAssetPropertyValue", entry["assetId"], error_code + ": " + error_message)
+                            failed.append(entry)
             
+            item= deferred.pop_due()
+            while item is not None:
+                due.append(item)
+                item= deferred.pop_due()
+    
+    # Checkpoint the assets whose values were all written
+    failed_assets= {entry["assetId"] for entry in failed}
+    for asset_id in dict.fromkeys(asset_id for asset_id, _, _ in attribute_values):
+        if asset_id not in failed_assets:
+            checkpoint("attributes", asset_id)
+    
+    return failed
+
+#################################
+# DELETE ASSETS
+#################################
+
+@metrics_phase("delete")
+def delete_asset(asset_id, asset_model_id=None):
+    
+    print("\tNow deleting asset: "+ asset_id)
+    
+    # Error handling of the delete asset API Call
+    try:
+        # Remove asset from cloud
+        response = sitewise_call("DeleteAsset",
+            assetId= asset_id
+        )
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] == 'ConflictingOperationException':
+            # The asset is still updating after being disassociated
+            wait_for_resources("asset", [asset_id])
+            response = sitewise_call("DeleteAsset",
+                assetId= asset_id
+            )
+        elif err.response['Error']['Code'] != 'ResourceNotFoundException':
+            raise
+    
+    # Confirm the asset is gone before its parent and its model are deleted
+    wait_for_resources("asset", [asset_id], deleted=True)
+    
+    # Remove asset id from resources file
+    delete_resources_element("assets", asset_id)
+    if asset_model_id is not None:
+        delete_resources_element("asset_model_ids", {"assetId": asset_id, "assetModelId": asset_model_id})
+    
 #################################
 # Model Hierarchy
 #################################
 
-def create_model_hierarchy(model_hierarchy_path, asset_models, parent_models_path):
+# Group models into levels so that every model comes after its child models.
+# Models in the same level do not depend on each other.
+def model_levels(models, model_hierarchies):
     
-    # Load the json objects file into variable
-    with open(model_hierarchy_path, 'r') as file:
-        model_hierarchies= json.load(file)
+    model_names= {model['model_name'] for model in models}
+    children= {model_name: set() for model_name in model_names}
+    for model_hierarchy in model_hierarchies:
+        for child_model in model_hierarchy['child_models']:
+            if model_hierarchy['parent_asset_model_name'] in model_names and child_model['child_asset_model_name'] in model_names:
+                children[model_hierarchy['parent_asset_model_name']].add(child_model['child_asset_model_name'])
+    
+    levels= []
+    created= set()
+    pending= list(models)
+    while pending:
+        level= [model for model in pending if children[model['model_name']] <= created]
+        if level == []:
+            raise ValueError("Cycle in model hierarchy between models: " + ", ".join(model['model_name'] for model in pending))
+        levels.append(level)
+        created.update(model['model_name'] for model in level)
+        pending= [model for model in pending if model['model_name'] not in created]
+    return levels
+
+# Hierarchies to create a parent model with, its child models must already exist
+def asset_model_hierarchies(model_hierarchy, asset_models):
+    
+    # array of asset model hierarchy properties
+    json_arr= []
+    
+    for child_model in model_hierarchy['child_models']:
+        if child_model["child_asset_model_name"] not in asset_models:
+            print("\tChild model " + child_model["child_asset_model_name"] + " of " + model_hierarchy['parent_asset_model_name'] + " was not created")
+            continue
         
+        json_arr_input= {}
+        json_arr_input["name"]= child_model["name"]
+        json_arr_input["childAssetModelId"]= asset_models[child_model["child_asset_model_name"]]["assetModelId"]
+        json_arr.append(json_arr_input)
+    
+    return json_arr
+
+# Map the logical ids of the model hierarchies to the hierarchy ids of the
+# created parent models, read from one describe response per parent
+def build_hierarchy_id_mapping(model_hierarchies, asset_models, describe_asset_model_responses):
+    
     # Dictionary of model hierarchy name and hoerarchy if
     hierarchy_id_mapping= {}
+    
+    for model_hierarchy in model_hierarchies:
+        parent_asset_model= asset_models.get(model_hierarchy['parent_asset_model_name'])
+        if parent_asset_model is None or parent_asset_model["assetModelId"] not in describe_asset_model_responses:
+            continue
         
-    # Iterate through all the model hierarchy in the JSON
-    for model_hierarchy in model_hierarchies: 
-        
-        # array of asset model hierarchy properties
-        json_arr= []
-        
-        # Fetch model Id of parent model
-        parent_asset_model_id= asset_models[model_hierarchy['parent_asset_model_name']]["assetModelId"]
-        
-        # Make describe call to get current config
-        describe_asset_model_response = client.describe_asset_model(
-            assetModelId= parent_asset_model_id,
-            excludeProperties= False
-        )
-        parent_asset_model_name= describe_asset_model_response["assetModelName"]
-        parent_asset_model_description= describe_asset_model_response["assetModelDescription"]
-        parent_asset_model_properties= describe_asset_model_response["assetModelProperties"]
+        # Hierarchy ids of the parent model in SW by hierarchy name
+        parent_asset_model_hierarchies= {asset_model_hierarchy["name"]: asset_model_hierarchy["id"] for asset_model_hierarchy in describe_asset_model_responses[parent_asset_model["assetModelId"]]["assetModelHierarchies"]}
+        # Map the logical id from config file with the hierarchy id of the model in SW
+        for child_model in model_hierarchy['child_models']:
+            if child_model["name"] in parent_asset_model_hierarchies:
+                hierarchy_id_mapping[child_model["logical_id"]]= parent_asset_model_hierarchies[child_model["name"]]
     
-                    
-        if model_hierarchy['child_models'] != []:
-            for child_model in model_hierarchy['child_models']:
-                
-                # Fetch model Id of child model 
-                child_asset_model_id= asset_models[child_model["child_asset_model_name"]]["assetModelId"]
-                
-                json_arr_input= {}
-                json_arr_input["name"]= child_model["name"]
-                json_arr_input["childAssetModelId"]= child_asset_model_id
-                json_arr.append(json_arr_input)
-            
-            
-            # print("Parent Model: "+ str(parent_asset_model_id) + "\nChild Models:\n"+ str(json_arr))
-            # Update model with current + hierarchy setting
-            
-            # Error handling of the update asset modelAPI Call
-            try:
-                response = client.update_asset_model(
-                    assetModelId= parent_asset_model_id,
-                    assetModelName= parent_asset_model_name,
-                    assetModelDescription= parent_asset_model_description,
-                    assetModelProperties= parent_asset_model_properties,
-                    assetModelHierarchies= json_arr
-                )
-                
-                # Add parent model to parent models list
-                add_parent_model_element(parent_asset_model_id)
-                t.sleep(5)
-                
-                # Make describe call to get current config
-                describe_asset_model_response = client.describe_asset_model(
-                    assetModelId= parent_asset_model_id,
-                    excludeProperties= True
-                )
-                
-                parent_asset_model_hierarchies= describe_asset_model_response["assetModelHierarchies"]
-                # Get all the assetModelHierarchies. Create a mapping of logical Id and hierarchy id 
-                for child_model in model_hierarchy['child_models']:
-                    for asset_model_hierarchy in parent_asset_model_hierarchies:
-                        
-                        # Map the logical id from config file with the hierarchy id of the model in SW
-                        if child_model["name"]==asset_model_hierarchy["name"]:
-                            hierarchy_id_mapping[child_model["logical_id"]]=asset_model_hierarchy["id"]
-                            break
-            except botocore.exceptions.ClientError as err:
-                print(str(err) + "\n")  
-                
-    # Return this back to use for asset association
-    return hierarchy_id_mapping    
+    return hierarchy_id_mapping
 
-def delete_model_hierarchy(parent_models):
+# Create the models level by level, leaves first, with their hierarchies.
+# created_asset_models holds models created before, whose children they can
+# be. Returns all the models and the describe response of every model that
+# became ACTIVE.
+def create_asset_models(models, model_hierarchies, created_asset_models=None):
     
-    for model in parent_models:
-        
-        # Error handling of the update asset model API Call to remove hierarchy
-        try:
-            describe_asset_model_response = client.describe_asset_model(
-                assetModelId= model
-            )
-            
-            update_asset_model_response = client.update_asset_model(
-                assetModelId= describe_asset_model_response["assetModelId"],
-                assetModelName= describe_asset_model_response["assetModelName"],
-                assetModelDescription= describe_asset_model_response['assetModelDescription'],
-                assetModelProperties= describe_asset_model_response["assetModelProperties"],
-                assetModelHierarchies= []
-            )
-            delete_parent_model_element(model)
-        except botocore.exceptions.ClientError as err:
-            print(str(err) + "\n")  
+    model_hierarchies_by_parent= {model_hierarchy['parent_asset_model_name']: model_hierarchy for model_hierarchy in model_hierarchies}
+    asset_models= dict(created_asset_models or {})
+    describe_asset_model_responses= {}
+    
+    for level in model_levels(models, model_hierarchies):
+        # Models of a level are created in parallel
+        tasks= []
+        for model in level:
+            if model['model_name'] in model_hierarchies_by_parent:
+                tasks.append((model, asset_model_hierarchies(model_hierarchies_by_parent[model['model_name']], asset_models)))
+            else:
+                tasks.append((model, []))
+        created_asset_models= run_tasks(create_asset_model, tasks)
         
-        t.sleep(0.5)
+        # Convert list to object 
+        level_asset_models= {k: v for item in created_asset_models if item for k, v in item.items() if v}
+        asset_models.update(level_asset_models)
         
+        # Parents of the next level need their children to be ACTIVE
+        describe_asset_model_responses.update(wait_for_resources("asset_model", [model["assetModelId"] for model in level_asset_models.values()]))
+    
+    return asset_models, describe_asset_model_responses
+
 #################################
 # Asset Hierarchy
 #################################
 
-def create_asset_hierarchy(asset_hierarchy_path, hierarchy_id_mapping, assets):
-
-    # Load the json objects file into variable
-    with open(asset_hierarchy_path, 'r') as file:
-        asset_hierarchies= json.load(file)
+# Parent and children of every asset of an asset hierarchy, kept in memory.
+# A node is an asset name for the config, or an asset id for the journal, and
+# every edge keeps the child entry it was added with.
+class AssetHierarchyGraph:
     
-    asset_hierarchy_list=[]
+    def __init__(self):
+        self.children= collections.defaultdict(list)
+        self.parents= collections.defaultdict(list)
     
-    for asset_hierarchy in asset_hierarchies:
+    def add(self, parent, child, entry):
+        self.children[parent].append((child, entry))
+        if parent not in self.parents[child]:
+            self.parents[child].append(parent)
+    
+    # Graph of asset hierarchy config entries, by asset name
+    @classmethod
+    def from_config(cls, asset_hierarchies):
+        graph= cls()
+        for asset_hierarchy in asset_hierarchies:
+            for child_asset in asset_hierarchy['child_assets']:
+                graph.add(asset_hierarchy['parent_asset_name'], child_asset['child_asset_name'], child_asset)
+        return graph
+    
+    # Graph of asset_hierarchy_mapping journal elements, by asset id
+    @classmethod
+    def from_mapping(cls, asset_hierarchy_mapping):
+        graph= cls()
+        for element in asset_hierarchy_mapping:
+            graph.add(element["assetId"], element["childAssetId"], element)
+        return graph
+    
+    # Children listed under more than one parent, with their parents
+    def multiple_parents(self):
+        return {child: parents for child, parents in self.parents.items() if len(parents) > 1}
+    
+    # Parents that are part of a cycle, or below one
+    def cycle(self):
+        placed= {parent for level in self.levels(check=False) for parent in level}
+        return [parent for parent in self.children if parent not in placed]
+    
+    # Group the parent assets into levels, top down: a parent comes after the
+    # parents of its own parent asset. The associations of a level do not touch
+    # the same asset twice, and DELETE disassociates them in reverse order.
+    def levels(self, check=True):
         
-        # Fetch asset Id of parent asset
-        parent_asset_id= assets[asset_hierarchy['parent_asset_name']]["assetId"]
+        pending= {parent: len(self.parents.get(parent, [])) for parent in self.children}
+        levels= []
+        level= [parent for parent, count in pending.items() if count == 0]
+        while level:
+            levels.append(level)
+            next_level= []
+            for parent in level:
+                for child in dict.fromkeys(child for child, _ in self.children[parent]):
+                    if child in pending:
+                        pending[child]-= 1
+                        if pending[child] == 0:
+                            next_level.append(child)
+            level= next_level
         
-        if asset_hierarchy['child_assets'] != []:
-            for child_asset in asset_hierarchy['child_assets']:
-                
-                json_element= {}
-                
-                # Get hierarchy id for given logical id
-                hierarchy_id= hierarchy_id_mapping[child_asset['logical_id']]
-                # Get asset id of child asset
-                child_asset_id= assets[child_asset['child_asset_name']]["assetId"]
-                
-                # Error handling of the associate assets API Call to remove hierarchy
-                try:
-                    associate_assets_response = client.associate_assets(
-                        assetId= parent_asset_id,
-                        hierarchyId= hierarchy_id,
-                        childAssetId= child_asset_id
-                    )
-                except botocore.exceptions.ClientError as err:
-                    print(str(err) + "\n")      
-                
-                # Add associated asset info to array element
-                json_element["assetId"]= parent_asset_id
-                json_element["hierarchyId"]= hierarchy_id
-                json_element["childAssetId"]= child_asset_id
-                
-                #  Add element to asset hierarchy mapping file
-                add_asset_hierarchy_mapping_element(json_element)
-                
-                t.sleep(1)
-                
+        if check and sum(len(level) for level in levels) < len(pending):
+            raise ValueError("Cycle in asset hierarchy between assets: " + ", ".join(self.cycle()))
+        return levels
+    
+    # Config entry of the children of a parent asset, as in asset_hierarchy.json
+    def asset_hierarchy(self, parent):
+        return {"parent_asset_name": parent, "child_assets": [entry for _, entry in self.children[parent]]}
+
+# Associate the assets of the asset hierarchy entries, level by level. The
+# parents of a level are associated concurrently under the AssociateAssets
+# rate limit, the children of a parent one after the other. Returns the
+# number of associations.
+def create_asset_hierarchy(asset_hierarchies, hierarchy_id_mapping, assets):
+    
+    graph= AssetHierarchyGraph.from_config(asset_hierarchies)
+    return associate_levels(graph, hierarchy_id_mapping, assets)
+
+def associate_levels(graph, hierarchy_id_mapping, assets):
+    
+    associations= 0
+    for level in graph.levels():
+        tasks= []
+        for parent_asset_name in level:
+            asset_hierarchy= graph.asset_hierarchy(parent_asset_name)
+            # Each task only carries the assets it associates
+            asset_names= [parent_asset_name] + [child_asset['child_asset_name'] for child_asset in asset_hierarchy['child_assets']]
+            tasks.append((asset_hierarchy, hierarchy_id_mapping, {asset_name: assets[asset_name] for asset_name in asset_names if asset_name in assets}))
+        associations+= sum(len(asset_hierarchy_list) for asset_hierarchy_list in run_tasks(associate_child_assets, tasks) if asset_hierarchy_list)
+    return associations
+
+# Associate all the children of one parent asset
+@metrics_phase("associations")
+def associate_child_assets(asset_hierarchy, hierarchy_id_mapping, assets):
+    
+    asset_hierarchy_list=[]
+    
+    # Fetch asset Id of parent asset
+    if asset_hierarchy['parent_asset_name'] not in assets:
+        print("\tParent asset " + asset_hierarchy['parent_asset_name'] + " was not created")
+        record_failure("AssociateAssets", asset_hierarchy['parent_asset_name'], "the parent asset was not created")
+        return asset_hierarchy_list
+    parent_asset_id= assets[asset_hierarchy['parent_asset_name']]["assetId"]
+    
+    if asset_hierarchy['child_assets'] != []:
+        for child_asset in asset_hierarchy['child_assets']:
+            
+            json_element= {}
+            
+            # The child asset or the hierarchy of the parent model may have failed to create
+            if child_asset['child_asset_name'] not in assets or child_asset['logical_id'] not in hierarchy_id_mapping:
+                print("\tChild asset " + child_asset['child_asset_name'] + " or hierarchy " + child_asset['logical_id'] + " was not created")
+                record_failure("AssociateAssets", asset_hierarchy['parent_asset_name'] + "/" + child_asset['child_asset_name'], "the child asset or the hierarchy was not created")
+                continue
+            
+            # Get hierarchy id for given logical id
+            hierarchy_id= hierarchy_id_mapping[child_asset['logical_id']]
+            # Get asset id of child asset
+            child_asset_id= assets[child_asset['child_asset_name']]["assetId"]
+            
+            # Add associated asset info to array element
+            json_element["assetId"]= parent_asset_id
+            json_element["hierarchyId"]= hierarchy_id
+            json_element["childAssetId"]= child_asset_id
+            
+            # Association made by a previous run
+            if checkpoints.get("association", {}).get(parent_asset_id + "/" + child_asset_id) == hierarchy_id:
+                asset_hierarchy_list.append(json_element)
+                continue
+            
+            # Error handling of the associate assets API Call to remove hierarchy
+            try:
+                associate_assets_response = sitewise_call("AssociateAssets",
+                    assetId= parent_asset_id,
+                    hierarchyId= hierarchy_id,
+                    childAssetId= child_asset_id
+                )
+            except botocore.exceptions.ClientError as err:
+                defer_or_fail(err, "AssociateAssets", asset_hierarchy['parent_asset_name'] + "/" + child_asset['child_asset_name'])
+                continue
+            
+            #  Add element to asset hierarchy mapping file
+            add_asset_hierarchy_mapping_element(json_element)
+            remember_step("association", parent_asset_id + "/" + child_asset_id, hierarchy_id)
+            asset_hierarchy_list.append(json_element)
+            
     return asset_hierarchy_list
 
-def delete_asset_hierarchy(asset_hierarchy_list):
+# Disassociate all the children of one parent asset
+@metrics_phase("delete")
+def disassociate_child_assets(asset_hierarchy_list):
     for asset_hierarchy in asset_hierarchy_list:
         try:
-            disassociate_assets_response = client.disassociate_assets(
+            disassociate_assets_response = sitewise_call("DisassociateAssets",
                 assetId= asset_hierarchy["assetId"],
                 hierarchyId= asset_hierarchy["hierarchyId"],
                 childAssetId= asset_hierarchy["childAssetId"]
             )
-            delete_asset_hierarchy_mapping_element(asset_hierarchy)
         except botocore.exceptions.ClientError as err:
-            print(str(err) + "\n")      
-            
-        t.sleep(0.5)
+            if err.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+        delete_asset_hierarchy_mapping_element(asset_hierarchy)
         
 #################################
-# MAIN
+# EXECUTION ENGINES
 #################################
 
-if str(sys.argv[1]).upper()=='CREATE':
+# Engine running the CREATE tasks, set with --engine:
+#   process: pool of worker_processes processes, each with its own client
+#   thread: pool of task_concurrency threads in the main process, sharing
+#           one client and its HTTP connection pool
+#   async: coroutines on a single event loop, sharing one client and its
+#          HTTP connection pool. botocore calls are blocking, so each
+#          coroutine hands its call to a thread of the loop's executor.
+#   dag: work items scheduled on a thread pool as soon as the items they
+#        depend on are done, see create_resources_graph
+engine= "process"
 
-    #################################
-    # CREATE 
-    #################################
+# Maximum number of tasks in flight with the thread, async and dag engines,
+# also the size of the shared HTTP connection pool
+task_concurrency= 256
+
+# Event loop used by every phase when the async engine is selected. The
+# blocking boto3 calls of its coroutines run on task_concurrency threads, so
+# it has no more calls in flight than the thread engine.
+async_loop= None
+
+def start_async_engine():
+    global async_loop
+    async_loop= asyncio.new_event_loop()
+    async_loop.set_default_executor(concurrent.futures.ThreadPoolExecutor(max_workers=task_concurrency))
+
+# Name of the resource a task works on, for the report of failed operations
+def task_resource(args):
+    for arg in args:
+        if isinstance(arg, dict):
+            for key in ("asset_name", "model_name", "parent_asset_name"):
+                if key in arg:
+                    return str(arg[key])
+    return " ".join(str(arg) for arg in args if isinstance(arg, str))
+
+# Run one attempt of a task, returns (status, result, steps, failures). The
+# status is "done", "failed", or the class of the error to try again after,
+# with the error message as result. steps are the checkpoints made by this
+# attempt, the next attempt knows them even if it runs in another process.
+def call_task(task):
+    function, args, steps, attempt= task
+    for step, name, result in steps:
+        checkpoints.setdefault(step, {})[name]= result
+    task_context.steps= []
+    task_context.failures= []
+    try:
+        return "done", function(*args), task_context.steps, task_context.failures
+    except Exception as err:
+        error_class= classify_error(err)
+        if error_class == "fatal":
+            print("\tFailed " + function.__name__ + " " + task_resource(args) + ":")
+            traceback.print_exc()
+            task_context.failures.append((function.__name__, task_resource(args), error_message(err)))
+            return "failed", None, task_context.steps, task_context.failures
+        return error_class, error_message(err), task_context.steps, task_context.failures
+    finally:
+        del task_context.steps, task_context.failures
+
+# Handle the outcome of one attempt of a task. Returns the next attempt of the
+# task and its backoff if it must be tried again, otherwise None.
+def task_outcome(index, task, outcome, on_result):
+    function, args, steps, attempt= task
+    status, result, task_steps, failures= outcome
+    if status == "done":
+        on_result(index, result)
+    elif status != "failed":
+        # Failures of an attempt that is tried again are not final
+        if attempt + 1 < retry_max_attempts:
+            return (function, args, steps + task_steps, attempt + 1), retry_delay(status, attempt)
+        print("\tGiving up " + function.__name__ + " " + task_resource(args) + " after " + str(retry_max_attempts) + " attempts: " + result)
+        failures.append((function.__name__, task_resource(args), result))
+    failed_operations.extend(failures)
+    return None
+
+async def gather_tasks(function, tasks, on_result):
     
+    loop= asyncio.get_running_loop()
+    semaphore= asyncio.Semaphore(task_concurrency)
+    pending= set()
     
-    ##
-    # Get confirmation that only new resources are being created
-    ##
-    answer = None 
-    while answer not in ("yes", "no"): 
-        answer = input("Have you made sure that resources that you are about to deploy do not already exist in this account?\nEnter yes or no: ") 
-        if answer == "yes": 
-            continue 
-        elif answer == "no": 
-            print("Exiting ... ")
-            exit(0) 
-        else: 
-        	print("Please enter yes or no.") 
+    # A deferred task gives its slot back while it waits for its backoff
+    async def run_task(index, task):
+        while task is not None:
+            async with semaphore:
+                outcome= await loop.run_in_executor(None, call_task, task)
+            next_attempt= task_outcome(index, task, outcome, on_result)
+            if next_attempt is None:
+                return
+            task, delay= next_attempt
+            await asyncio.sleep(delay)
     
-    ##
-    # Initiate empty resources file
-    ##
-    print("Initiating Resources File")
-    resources= {
-        "asset_models": [],
-        "assets": []
-    }
-    with open(resources_path, "w") as outfile:
-        outfile.write(json.dumps(resources, indent=4))
+    async def consume(limit):
+        while len(pending) > limit:
+            done, _= await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                future.result()
     
-    ##
-    # Create Asset Models
-    ##
-    print("Creating Asset Models ... ")
-     # Open models file from sitewise config files 
-    with open(models_path, 'r') as file:
-        models = json.load(file)
-    begin = t.time()
-    # Establish multiprocessing pool object
-    pool = multiprocessing.Pool(processes=8)
-    # Created all assets in parallel
-    created_asset_models= pool.starmap(create_asset_model, zip(models))
-    # Close the pool and wait for all processes to finish
-    pool.close()
-    pool.join()
-    end = t.time()
-    print(f"\nTotal runtime to Create all Asset Models is {end - begin}\n")
-    # Convert list to object 
-    script_asset_models= {k: v for item in created_asset_models for k, v in item.items() if v}
-    # Update models file
-    with open(script_asset_models_path, "w") as outfile:
-        outfile.write(json.dumps(script_asset_models, indent=4))
-    t.sleep(5)
-    
-    ##
-    # Create Assets
-    ##
-    print("Creating Assets ... ")
-    # Load existing models file
-    with open(script_asset_models_path, 'r') as file:
-        script_asset_models = json.load(file)
-    # Load assets config file
-    with open(assets_path, 'r') as file:
-        assets= json.load(file)
-    begin = t.time()
-    # Establish multiprocessing pool object
-    pool = multiprocessing.Pool(processes=45)
-    # Created all assets in parallel
-    created_assets= pool.starmap(create_asset, zip(assets, itertools.repeat(script_asset_models)))
-    # Close the pool and wait for all processes to finish
-    pool.close()
-    pool.join()
-    end = t.time()
-    print(f"\nTotal runtime to Create all Assets is {end - begin}\n")
-    # Convert list to object 
-    script_assets= {k: v for item in created_assets for k, v in item.items()  if v}
-    # Update assets file
-    with open(script_assets_path, "w") as outfile:
-        outfile.write(json.dumps(script_assets, indent=4))
-    
-    ##
-    # Configure Asset Model Hierarchy
-    ##
-    # Initiate empty parent models file
-    with open(parent_models_path, "w") as outfile:
-        outfile.write(json.dumps([], indent=4))
-    print("Adding Model Hierarchy ... ")
-    with open(script_asset_models_path, 'r') as file:
-        script_asset_models = json.load(file)
-    hierarchy_id_mapping= create_model_hierarchy(model_hierarchy_path, script_asset_models, parent_models_path)
-    # Writing to hierarchy_id_mapping.json
-    with open(hierarchy_id_mapping_path, "w") as outfile:
-        outfile.write(json.dumps(hierarchy_id_mapping, indent=4))
-    t.sleep(5)
+    try:
+        for index, args in enumerate(tasks):
+            await consume(stream_window - 1)
+            pending.add(asyncio.ensure_future(run_task(index, (function, args, [], 0))))
+        await consume(0)
+    except BaseException:
+        # Tasks still in flight are not waited for, and their errors are dropped
+        for future in pending:
+            if future.done() and not future.cancelled():
+                future.exception()
+            else:
+                future.cancel()
+        raise
+
+# Maximum number of tasks handed to the workers whose result has not been
+# consumed yet, deferred tasks included. Tasks are read from their iterator
+# only as results come back, so memory does not grow with the number of tasks.
+stream_window= 1000
+
+# Pool of worker processes opened by task_pool, used by dispatch_tasks
+# instead of a new pool for every call
+shared_pool= None
+
+# Keep one pool of worker processes open for every dispatch_tasks call of the
+# block, for callers that dispatch many small batches of tasks
+@contextlib.contextmanager
+def task_pool():
+    global shared_pool
     
-    ##
-    # Configure Asset Hierarchy
-    ##
-    print("Adding Asset Hierarchy ... ")
-    with open(script_assets_path, 'r') as file:
-        script_assets = json.load(file)
-    with open(hierarchy_id_mapping_path, 'r') as file:
-        hierarchy_id_mapping = json.load(file)
-    asset_hierarchy_list= create_asset_hierarchy(asset_hierarchy_path, hierarchy_id_mapping, script_assets)
+    if engine != "process":
+        yield
+        return
+    shared_pool= multiprocessing.Pool(processes=worker_processes, initializer=init_worker, initargs=(rate_limiter, property_index, checkpoints, api_metrics, tracing, time_series_index))
+    try:
+        yield
+    except BaseException:
+        shared_pool.terminate()
+        raise
+    else:
+        shared_pool.close()
+    finally:
+        shared_pool.join()
+        shared_pool= None
+
+# Run function for every tuple of arguments in tasks and pass (index of the
+# task, result) to on_result as soon as a task is done. Tasks that fail with
+# a retryable error are deferred and run again once their backoff ended,
+# tasks that fail permanently have no result. With the process and thread
+# engines, tasks that are not parallel run one by one in the main process.
+# The dag engine only plans CREATE as a graph, the other flows run their
+# tasks on threads like the thread engine.
+def dispatch_tasks(function, tasks, on_result, parallel=True):
+    
+    if engine == "async":
+        async_loop.run_until_complete(gather_tasks(function, tasks, on_result))
+        return
+    
+    deferred= DeferredTasks()
+    outcomes= queue.Queue()
+    
+    if parallel and engine in ("thread", "dag"):
+        # Threads share the client, the checkpoints and the property index of the main process
+        executor= concurrent.futures.ThreadPoolExecutor(max_workers=task_concurrency)
+        def submit(index, task):
+            future= executor.submit(call_task, task)
+            future.add_done_callback(lambda future: outcomes.put((index, task, future.exception() or future.result())))
+    elif parallel:
+        pool = shared_pool or multiprocessing.Pool(processes=worker_processes, initializer=init_worker, initargs=(rate_limiter, property_index, checkpoints, api_metrics, tracing, time_series_index))
+        def submit(index, task):
+            pool.apply_async(call_task, (task,),
+                             callback=lambda outcome: outcomes.put((index, task, outcome)),
+                             error_callback=lambda err: outcomes.put((index, task, err)))
+    else:
+        def submit(index, task):
+            outcomes.put((index, task, call_task(task)))
+    
+    tasks= enumerate(tasks)
+    exhausted= False
+    in_flight= 0
+    try:
+        while True:
+            # Deferred tasks whose backoff ended go first, then new tasks
+            while in_flight < (stream_window if parallel else 1):
+                item= deferred.pop_due()
+                if item is None and not exhausted:
+                    item= next(tasks, None)
+                    if item is None:
+                        exhausted= True
+                    else:
+                        item= (item[0], (function, item[1], [], 0))
+                if item is None:
+                    break
+                submit(*item)
+                in_flight+= 1
+            
+            if in_flight == 0:
+                if len(deferred) == 0:
+                    break
+                t.sleep(deferred.wait_time())
+                continue
+            
+            # Wake up when a task completes or a deferred task is due
+            try:
+                index, task, outcome= outcomes.get(timeout=deferred.wait_time())
+            except queue.Empty:
+                continue
+            in_flight-= 1
+            if isinstance(outcome, BaseException):
+                raise outcome
+            next_attempt= task_outcome(index, task, outcome, on_result)
+            if next_attempt is not None:
+                deferred.defer((index, next_attempt[0]), next_attempt[1])
+    except BaseException:
+        if parallel and engine in ("thread", "dag"):
+            executor.shutdown(wait=False, cancel_futures=True)
+        elif parallel and pool is not shared_pool:
+            pool.terminate()
+        raise
     
-    print("Done!")
+    if parallel and engine in ("thread", "dag"):
+        executor.shutdown()
+    elif parallel and pool is not shared_pool:
+        # Close the pool and wait for all processes to finish
+        pool.close()
+        pool.join()
+
+# Run function for every tuple of arguments in tasks and return the results in
+# order, None for the tasks that failed
+def run_tasks(function, tasks, parallel=True):
     
-    print("\n\n*********")
-    print("\nNOTE: If this deployment has FAILED, make sure to run the DELETE flow, and make sure all resources from this deployment have been removed BEFORE trying again.")
-    print("\n*********\n")
+    tasks= list(tasks)
+    results= [None] * len(tasks)
+    def store(index, result):
+        results[index]= result
+    dispatch_tasks(function, tasks, store, parallel)
+    return results
+
+# Run function for every tuple of arguments in tasks and pass each result to
+# on_result as soon as it is available, in completion order. Unlike
+# run_tasks, neither the tasks nor the results are held in memory.
+def stream_tasks(function, tasks, on_result, parallel=True):
+    dispatch_tasks(function, tasks, lambda index, result: on_result(result), parallel)
+
+#################################
+# DEPENDENCY GRAPH
+#################################
 
-elif str(sys.argv[1]).upper()=='DELETE':
-    #################################
-    # DELETE 
-    #################################
+# Work items with explicit dependencies. Each item starts as soon as all the
+# items it depends on are done, items whose dependencies failed are skipped
+# unless they are added with always=True. An item that fails with a
+# retryable error is deferred and started again once its backoff ended.
+class WorkGraph:
     
+    def __init__(self):
+        self.items= {}
     
-    ##   
-    # Remove Asset Hierarchy
-    ##
-    # Fetch all the hierarchy from hierarchy file
-    # Fetch all the parent models from parent model file
-    with open(asset_hierarchy_mapping_path, 'r') as file:
-        asset_hierarchy_list = json.load(file)
-    print("Removing Asset Hierarchy ... ")
-    delete_asset_hierarchy(asset_hierarchy_list)
-    t.sleep(10)
+    def add(self, key, function, dependencies=(), always=False):
+        self.items[key]= (function, list(dependencies), always)
     
-    ##
-    # Remove Model Hierarchy
-    ##
-    with open(parent_models_path, 'r') as file:
-        parent_models = json.load(file)
-    print("Removing Model Hierarchy ... ")
-    delete_model_hierarchy(parent_models)
-    # Writing empty hierarchy_id_mapping.json
-    with open(hierarchy_id_mapping_path, "w") as outfile:
-        outfile.write(json.dumps({}, indent=4))
-    t.sleep(10)
+    # Run all items on max_workers threads, returns the keys of the items that did not complete
+    def run(self, max_workers):
+        
+        dependents= collections.defaultdict(list)
+        remaining= {}
+        failed= set()
+        for key, (function, dependencies, always) in self.items.items():
+            remaining[key]= len(dependencies)
+            for dependency in dependencies:
+                if dependency not in self.items:
+                    print("\t" + key + " depends on unknown item " + dependency)
+                    failed.add(key)
+                dependents[dependency].append(key)
+        
+        deferred= DeferredTasks()
+        attempts= collections.Counter()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            
+            running= {}
+            def submit(key):
+                running[executor.submit(call_item, key, self.items[key][0], self.items[key][1])]= key
+            
+            # Start the items that were waiting on key once it is done or failed
+            def release(key, succeeded):
+                for dependent in dependents[key]:
+                    if dependent not in remaining:
+                        continue
+                    if not succeeded and not self.items[dependent][2]:
+                        skip(dependent)
+                        continue
+                    remaining[dependent]-= 1
+                    if remaining[dependent] == 0:
+                        submit(dependent)
+            
+            # Skip an item and everything that requires it
+            def skip(key):
+                if key in remaining:
+                    del remaining[key]
+                    failed.add(key)
+                    release(key, False)
+            
+            for key in list(self.items):
+                if key in failed:
+                    skip(key)
+                elif remaining.get(key) == 0:
+                    submit(key)
+            
+            while running or len(deferred):
+                key= deferred.pop_due()
+                if key is not None:
+                    submit(key)
+                    continue
+                done, _ = concurrent.futures.wait(running, timeout=deferred.wait_time(), return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    key= running.pop(future)
+                    if key not in remaining:
+                        continue
+                    try:
+                        failed_operations.extend(future.result())
+                    except Exception as err:
+                        error_class= classify_error(err)
+                        attempts[key]+= 1
+                        if error_class != "fatal" and attempts[key] < retry_max_attempts:
+                            deferred.defer(key, retry_delay(error_class, attempts[key] - 1))
+                            continue
+                        if isinstance(err, botocore.exceptions.ClientError):
+                            print("\tFailed " + key + ": " + str(err) + "\n")
+                        else:
+                            print("\tFailed " + key + ":")
+                            traceback.print_exception(type(err), err, err.__traceback__)
+                        # The failure is reported once, by the operation that failed if it recorded it
+                        failed_operations.extend(err.failures or [(key.split(":")[0], key.split(":", 1)[-1], error_message(err))])
+                        del remaining[key]
+                        failed.add(key)
+                        release(key, False)
+                        continue
+                    del remaining[key]
+                    release(key, True)
+        
+        return failed
+
+# Run one work item, returns the failures it recorded. The failures of an
+# item that raises are attached to the error.
+def call_item(key, function, dependencies):
+    task_context.failures= []
+    try:
+        with trace_span(key, "item", key=key, dependencies=dependencies):
+            function()
+        return task_context.failures
+    except Exception as err:
+        err.failures= task_context.failures
+        raise
+    finally:
+        del task_context.failures
+
+# Plan the whole CREATE flow as one graph. A parent model depends on its
+# child models, an asset on its model, and the associations of a parent
+# asset on the assets and parent models of the hierarchies involved.
+# Returns the created models, assets and hierarchy ids by name.
+def create_resources_graph(models, assets, model_hierarchies, asset_hierarchies):
+    
+    graph= WorkGraph()
+    asset_models= {}
+    script_assets= {}
+    hierarchy_id_mapping= {}
+    attribute_values= []
     
-    # Fetch list of all resources from resources file
-    with open(resources_path, 'r') as file:
-        resources_file = json.load(file)
+    model_hierarchies_by_parent= {model_hierarchy['parent_asset_model_name']: model_hierarchy for model_hierarchy in model_hierarchies}
+    # Parent model of every hierarchy logical id
+    hierarchy_parent_models= {
+        child_model['logical_id']: model_hierarchy['parent_asset_model_name']
+        for model_hierarchy in model_hierarchies
+        for child_model in model_hierarchy['child_models']
+    }
+    
+    def create_model_item(model):
+        hierarchies= []
+        if model['model_name'] in model_hierarchies_by_parent:
+            hierarchies= asset_model_hierarchies(model_hierarchies_by_parent[model['model_name']], asset_models)
+        asset_models.update(create_asset_model(model, hierarchies))
         
+        # The assets of a model that failed are skipped
+        if model['model_name'] not in asset_models:
+            raise RuntimeError("asset model " + model['model_name'] + " was not created")
+        asset_model= asset_models[model['model_name']]
+        describe_asset_model_responses= wait_for_resources("asset_model", [asset_model["assetModelId"]])
+        property_index.update(build_property_index({model['model_name']: asset_model}, describe_asset_model_responses))
+        hierarchy_id_mapping.update(build_hierarchy_id_mapping(model_hierarchies_by_parent.values(), asset_models, describe_asset_model_responses))
     
-    ##
-    # Delete Assets
-    ##
-    print("Removing Assets ... ")
-    delete_assets(resources_file)
-    # Writing empty assets.json
-    with open(script_assets_path, "w") as outfile:
-        outfile.write(json.dumps({}, indent=4))
-    t.sleep(10)
+    def create_asset_item(asset):
+        obj, asset_attribute_values= create_asset(asset, asset_models)
+        script_assets.update(obj)
+        attribute_values.extend(asset_attribute_values)
+        # The associations of an asset that failed are skipped
+        if asset['asset_name'] not in obj:
+            raise RuntimeError("asset " + asset['asset_name'] + " was not created")
     
-    ##
-    # Delete Asset Models
-    ##
-    print("Removing Models ... ")
-    delete_asset_models(resources_file)
-    with open(script_asset_models_path, "w") as outfile:
-        outfile.write(json.dumps({}, indent=4))
+    def associate_child_assets_item(asset_hierarchy):
+        asset_names= [asset_hierarchy['parent_asset_name']] + [child_asset['child_asset_name'] for child_asset in asset_hierarchy['child_assets']]
+        wait_for_resources("asset", [script_assets[asset_name]["assetId"] for asset_name in asset_names])
+        associate_child_assets(asset_hierarchy, hierarchy_id_mapping, script_assets)
+    
+    for model in models:
+        dependencies= []
+        if model['model_name'] in model_hierarchies_by_parent:
+            dependencies= ["model:" + child_model['child_asset_model_name'] for child_model in model_hierarchies_by_parent[model['model_name']]['child_models']]
+        graph.add("model:" + model['model_name'], functools.partial(create_model_item, model), dependencies)
+    
+    for asset in assets:
+        graph.add("asset:" + asset['asset_name'], functools.partial(create_asset_item, asset), ["model:" + asset['model_name']])
+    
+    # Attribute values are batched across all assets
+    graph.add("attributes", lambda: put_attribute_values(attribute_values), ["asset:" + asset['asset_name'] for asset in assets], always=True)
+    
+    for asset_hierarchy in asset_hierarchies:
+        dependencies= ["asset:" + asset_hierarchy['parent_asset_name']]
+        for child_asset in asset_hierarchy['child_assets']:
+            dependencies.append("asset:" + child_asset['child_asset_name'])
+            dependencies.append("model:" + hierarchy_parent_models.get(child_asset['logical_id'], child_asset['logical_id']))
+        graph.add("association:" + asset_hierarchy['parent_asset_name'],
+                  functools.partial(associate_child_assets_item, asset_hierarchy),
+                  list(dict.fromkeys(dependencies)))
+    
+    failed= graph.run(task_concurrency)
+    if failed:
+        print("\n" + str(len(failed)) + " work items did not complete: " + ", ".join(sorted(failed)))
+    
+    return asset_models, script_assets, hierarchy_id_mapping
+
+# Plan the whole DELETE flow as one graph. The associations of a parent
+# asset are removed before either asset is deleted, child assets are deleted
+# before their parents, and a model is deleted once its last asset is gone
+# and the parent models that reference it are deleted. Returns the items
+# that did not complete.
+def delete_resources_graph(state):
+    
+    graph= WorkGraph()
+    assets= set(state["assets"])
+    asset_models= set(state["asset_models"])
+    parent_models= set(state["parent_models"])
+    asset_model_ids= {element["assetId"]: element["assetModelId"] for element in state["asset_model_ids"]}
+    
+    # Associations grouped by parent asset, the children of a parent are
+    # disassociated one after the other. A parent is disassociated once its
+    # child assets are, the reverse of the levels they were associated in.
+    hierarchy= AssetHierarchyGraph.from_mapping(state["asset_hierarchy_mapping"])
+    for parent_asset_id, children in hierarchy.children.items():
+        graph.add("disassociate:" + parent_asset_id,
+                  functools.partial(disassociate_child_assets, [element for _, element in children]),
+                  ["disassociate:" + child_asset_id for child_asset_id in dict.fromkeys(child_asset_id for child_asset_id, _ in children) if child_asset_id in hierarchy.children])
+    
+    asset_dependencies= collections.defaultdict(list)
+    for asset_hierarchy in state["asset_hierarchy_mapping"]:
+        asset_dependencies[asset_hierarchy["assetId"]].append("disassociate:" + asset_hierarchy["assetId"])
+        asset_dependencies[asset_hierarchy["childAssetId"]].append("disassociate:" + asset_hierarchy["assetId"])
+        # Leaf assets are deleted before their parents
+        if asset_hierarchy["childAssetId"] in assets:
+            asset_dependencies[asset_hierarchy["assetId"]].append("asset:" + asset_hierarchy["childAssetId"])
+    for asset_id in state["assets"]:
+        graph.add("asset:" + asset_id,
+                  functools.partial(delete_asset, asset_id, asset_model_ids.get(asset_id)),
+                  list(dict.fromkeys(asset_dependencies[asset_id])))
+    
+    # A child model cannot be deleted while a parent model references it
+    model_dependencies= collections.defaultdict(list)
+    for parent_asset_model_id, describe_asset_model_response in describe_resources("asset_model", list(parent_models & asset_models)).items():
+        for asset_model_hierarchy in describe_asset_model_response["assetModelHierarchies"]:
+            if asset_model_hierarchy["childAssetModelId"] in asset_models:
+                model_dependencies[asset_model_hierarchy["childAssetModelId"]].append("model:" + parent_asset_model_id)
+    
+    # Assets created before their model was recorded hold up every model
+    unknown_model_assets= []
+    for asset_id in state["assets"]:
+        if asset_id in asset_model_ids and asset_model_ids[asset_id] in asset_models:
+            model_dependencies[asset_model_ids[asset_id]].append("asset:" + asset_id)
+        elif asset_id not in asset_model_ids:
+            unknown_model_assets.append("asset:" + asset_id)
+    
+    for asset_model_id in state["asset_models"]:
+        graph.add("model:" + asset_model_id,
+                  functools.partial(delete_asset_model, asset_model_id, asset_model_id in parent_models),
+                  list(dict.fromkeys(model_dependencies[asset_model_id] + unknown_model_assets)))
     
-    print("Done!")
\ No newline at end of file
+    failed= graph.run(task_concurrency)
+    if failed:
+        print("\n" + str(len(failed)) + " work items did not complete: " + ", ".join(sorted(failed)))
+    
+    return failed
+
+#################################
+# DISCOVER RESOURCES
+#################################
+
+# Number of listings and tag reads in flight during DISCOVER
+discover_concurrency= 32
+
+# Make a SiteWise API call, trying it again after a backoff while it fails
+# with a retryable error. It waits in place: the pages of a listing are read
+# one after the other, and the other listings of DISCOVER keep running on
+# their own threads meanwhile.
+def call_with_retries(operation, **kwargs):
+    for attempt in range(retry_max_attempts):
+        try:
+            return sitewise_call(operation, **kwargs)
+        except (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError) as err:
+            if classify_error(err) == "fatal" or attempt + 1 == retry_max_attempts:
+                raise
+            t.sleep(retry_delay(classify_error(err), attempt))
+
+# Every item of a paginated list operation, none if the resource listed from
+# is gone
+def list_all(operation, items_key, **kwargs):
+    items= []
+    kwargs["maxResults"]= 250
+    while True:
+        try:
+            response= call_with_retries(operation, **kwargs)
+        except botocore.exceptions.ClientError as err:
+            if err.response['Error']['Code'] == 'ResourceNotFoundException':
+                return []
+            raise
+        items.extend(response[items_key])
+        if "nextToken" not in response:
+            return items
+        kwargs["nextToken"]= response["nextToken"]
+
+# True if the resource has every tag the script puts on the resources it creates
+def has_script_tags(resource_arn):
+    try:
+        resource_tags= call_with_retries("ListTagsForResource", resourceArn=resource_arn)["tags"]
+    except botocore.exceptions.ClientError as err:
+        if err.response['Error']['Code'] == 'ResourceNotFoundException':
+            return False
+        raise
+    return all(resource_tags.get(key) == value for key, value in tags.items())
+
+# Find the resources of the script in the account, by their tags, and return
+# them as a journal state. Each step runs its calls concurrently under the rate
+# limits: the tags of every model, the assets of every tagged model, the tags
+# of every asset, the hierarchies of the models, and the children of every
+# asset in each hierarchy of its model.
+def discover_resources():
+    
+    state= {key: [] for key in journal_keys}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=discover_concurrency) as executor:
+        
+        model_summaries= list_all("ListAssetModels", "assetModelSummaries")
+        model_summaries= [summary for summary, tagged in zip(model_summaries, executor.map(has_script_tags, [summary["arn"] for summary in model_summaries])) if tagged]
+        print(f"\t{len(model_summaries)} asset models found")
+        
+        asset_summaries= []
+        for summaries in executor.map(lambda summary: list_all("ListAssets", "assetSummaries", assetModelId=summary["id"], filter="ALL"), model_summaries):
+            asset_summaries.extend(summaries)
+        asset_summaries= [summary for summary, tagged in zip(asset_summaries, executor.map(has_script_tags, [summary["arn"] for summary in asset_summaries])) if tagged]
+        print(f"\t{len(asset_summaries)} assets found")
+        
+        # Assets have the hierarchies of their model, with the same ids
+        describe_asset_model_responses= describe_resources("asset_model", [summary["id"] for summary in model_summaries])
+        hierarchies= [
+            (summary["id"], asset_model_hierarchy["id"])
+            for summary in asset_summaries
+            for asset_model_hierarchy in describe_asset_model_responses.get(summary["assetModelId"], {}).get("assetModelHierarchies", [])
+        ]
+        children= executor.map(lambda hierarchy: list_all("ListAssociatedAssets", "assetSummaries", assetId=hierarchy[0], hierarchyId=hierarchy[1], traversalDirection="CHILD"), hierarchies)
+        for (asset_id, hierarchy_id), child_summaries in zip(hierarchies, children):
+            for child_summary in child_summaries:
+                state["asset_hierarchy_mapping"].append({"assetId": asset_id, "hierarchyId": hierarchy_id, "childAssetId": child_summary["id"]})
+        print(f"\t{len(state['asset_hierarchy_mapping'])} asset associations found")
+    
+    for summary in model_summaries:
+        state["asset_models"].append(summary["id"])
+        if describe_asset_model_responses.get(summary["id"], {}).get("assetModelHierarchies"):
+            state["parent_models"].append(summary["id"])
+        state["checkpoints"].append({"step": "model", "name": summary["name"], "result": {"assetModelId": summary["id"], "assetModelArn": summary["arn"]}})
+    for summary in asset_summaries:
+        state["assets"].append(summary["id"])
+        state["asset_model_ids"].append({"assetId": summary["id"], "assetModelId": summary["assetModelId"]})
+        state["checkpoints"].append({"step": "asset", "name": summary["name"], "result": {"assetId": summary["id"], "assetArn": summary["arn"]}})
+    return state
+
+#################################
+# VALIDATE CONFIG
+#################################
+
+# Maximum number of properties of an asset model
+max_asset_model_properties= 500
+
+# Property kinds of a model config, in the order they are created
+property_kinds= ("attributes", "measurements", "transforms", "metrics")
+
+# Check every reference between the four config files before any API call is
+# made, the assets and asset hierarchy are read as a stream. Returns the list
+# of errors and the indexes built on the way:
+#   models           model name -> model
+#   properties       model name -> {property name: property kind}
+#   hierarchies      hierarchy logical id -> (parent model name, child model name)
+#   asset_models     asset name -> model name
+def validate_config():
+    
+    errors= []
+    models_file= os.path.basename(models_path)
+    model_hierarchy_file= os.path.basename(model_hierarchy_path)
+    assets_file= os.path.basename(config_path(assets_path))
+    asset_hierarchy_file= os.path.basename(config_path(asset_hierarchy_path))
+    
+    ##
+    # Models and their properties
+    ##
+    with open(models_path, 'r') as file:
+        models = json.load(file)
+    model_index= {}
+    properties= {}
+    for model in models:
+        if model['model_name'] in model_index:
+            errors.append(models_file + ": duplicate model " + repr(model['model_name']))
+            continue
+        model_index[model['model_name']]= model
+        model_properties= properties[model['model_name']]= {}
+        for kind in property_kinds:
+            for model_property in model[kind]:
+                if model_property['name'] in model_properties:
+                    errors.append(models_file + ": model " + repr(model['model_name']) + " has more than one property " + repr(model_property['name']))
+                    continue
+                model_properties[model_property['name']]= kind
+        if len(model_properties) > max_asset_model_properties:
+            errors.append(models_file + ": model " + repr(model['model_name']) + " has " + str(len(model_properties)) + " properties, the limit is " + str(max_asset_model_properties))
+    
+    ##
+    # Model hierarchies
+    ##
+    with open(model_hierarchy_path, 'r') as file:
+        model_hierarchies= json.load(file)
+    hierarchies= {}
+    hierarchy_parents= set()
+    for model_hierarchy in model_hierarchies:
+        parent_model_name= model_hierarchy['parent_asset_model_name']
+        if parent_model_name not in model_index:
+            errors.append(model_hierarchy_file + ": unknown parent model " + repr(parent_model_name))
+        if parent_model_name in hierarchy_parents:
+            errors.append(model_hierarchy_file + ": parent model " + repr(parent_model_name) + " is listed more than once")
+        hierarchy_parents.add(parent_model_name)
+        hierarchy_names= set()
+        for child_model in model_hierarchy['child_models']:
+            if child_model['child_asset_model_name'] not in model_index:
+                errors.append(model_hierarchy_file + ": unknown child model " + repr(child_model['child_asset_model_name']) + " of " + repr(parent_model_name))
+            if child_model['name'] in hierarchy_names:
+                errors.append(model_hierarchy_file + ": model " + repr(parent_model_name) + " has more than one hierarchy " + repr(child_model['name']))
+            hierarchy_names.add(child_model['name'])
+            if child_model['logical_id'] in hierarchies:
+                errors.append(model_hierarchy_file + ": duplicate hierarchy logical id " + repr(child_model['logical_id']))
+                continue
+            hierarchies[child_model['logical_id']]= (parent_model_name, child_model['child_asset_model_name'])
+    try:
+        model_levels(list(model_index.values()), model_hierarchies)
+    except ValueError as err:
+        errors.append(model_hierarchy_file + ": " + str(err))
+    
+    ##
+    # Variables of transforms and metrics. A variable refers to a property of
+    # its own model, or with a hierarchy logical id to a property of the child
+    # model of one of its hierarchies.
+    ##
+    for model in model_index.values():
+        for kind in ("transforms", "metrics"):
+            for model_property in model[kind]:
+                variable_names= set()
+                for variable in model_property['variables']:
+                    where= models_file + ": variable " + repr(variable['name']) + " of " + repr(model['model_name']) + "." + repr(model_property['name'])
+                    if variable['name'] in variable_names:
+                        errors.append(where + " is declared more than once")
+                    variable_names.add(variable['name'])
+                    referenced_model_name= model['model_name']
+                    if variable.get('hierarchy_logical_id') is not None:
+                        if kind == "transforms":
+                            errors.append(where + " refers to a hierarchy, only metrics can")
+                            continue
+                        hierarchy= hierarchies.get(variable['hierarchy_logical_id'])
+                        if hierarchy is None or hierarchy[0] != model['model_name']:
+                            errors.append(where + " refers to " + repr(variable['hierarchy_logical_id']) + ", which is not a hierarchy of the model")
+                            continue
+                        referenced_model_name= hierarchy[1]
+                    if variable['property_logical_id'] not in properties.get(referenced_model_name, {}):
+                        errors.append(where + " refers to unknown property " + repr(variable['property_logical_id']) + " of " + repr(referenced_model_name))
+                    elif variable['property_logical_id'] == model_property['name'] and referenced_model_name == model['model_name']:
+                        errors.append(where + " refers to its own property")
+    
+    ##
+    # Assets, attributes and measurement aliases
+    ##
+    asset_models= {}
+    aliases= set()
+    for asset in iter_config(assets_path):
+        if asset['asset_name'] in asset_models:
+            errors.append(assets_file + ": duplicate asset " + repr(asset['asset_name']))
+            continue
+        asset_models[asset['asset_name']]= asset['model_name']
+        if asset['model_name'] not in model_index:
+            errors.append(assets_file + ": asset " + repr(asset['asset_name']) + " uses unknown model " + repr(asset['model_name']))
+            continue
+        model_properties= properties[asset['model_name']]
+        for kind in ("attributes", "measurements"):
+            for asset_property in asset[kind]:
+                if model_properties.get(asset_property['name']) != kind:
+                    errors.append(assets_file + ": asset " + repr(asset['asset_name']) + " sets " + repr(asset_property['name']) + ", which is not one of the " + kind + " of " + repr(asset['model_name']))
+        for measurement in asset['measurements']:
+            if measurement.get('alias') is None:
+                continue
+            if measurement['alias'] in aliases:
+                errors.append(assets_file + ": alias " + repr(measurement['alias']) + " of asset " + repr(asset['asset_name']) + " is used more than once")
+            aliases.add(measurement['alias'])
+    
+    ##
+    # Asset hierarchy. A child asset has only one parent, and no asset is its own ancestor.
+    ##
+    hierarchy_parent_assets= set()
+    graph= AssetHierarchyGraph()
+    for asset_hierarchy in iter_config(asset_hierarchy_path):
+        parent_asset_name= asset_hierarchy['parent_asset_name']
+        if parent_asset_name not in asset_models:
+            errors.append(asset_hierarchy_file + ": unknown parent asset " + repr(parent_asset_name))
+        if parent_asset_name in hierarchy_parent_assets:
+            errors.append(asset_hierarchy_file + ": parent asset " + repr(parent_asset_name) + " is listed more than once")
+        hierarchy_parent_assets.add(parent_asset_name)
+        for child_asset in asset_hierarchy['child_assets']:
+            where= asset_hierarchy_file + ": child asset " + repr(child_asset['child_asset_name']) + " of " + repr(parent_asset_name)
+            if child_asset['child_asset_name'] not in asset_models:
+                errors.append(where + " is unknown")
+            graph.add(parent_asset_name, child_asset['child_asset_name'], child_asset)
+            hierarchy= hierarchies.get(child_asset['logical_id'])
+            if hierarchy is None:
+                errors.append(where + " uses unknown hierarchy logical id " + repr(child_asset['logical_id']))
+                continue
+            # Assets of an unknown model are already reported
+            parent_model_name= asset_models.get(parent_asset_name)
+            child_model_name= asset_models.get(child_asset['child_asset_name'])
+            if parent_model_name in model_index and parent_model_name != hierarchy[0]:
+                errors.append(where + " uses hierarchy " + repr(child_asset['logical_id']) + " of model " + repr(hierarchy[0]) + ", the parent asset is a " + repr(parent_model_name))
+            if child_model_name in model_index and child_model_name != hierarchy[1]:
+                errors.append(where + " uses hierarchy " + repr(child_asset['logical_id']) + " for model " + repr(hierarchy[1]) + ", the child asset is a " + repr(child_model_name))
+    for child_asset_name, parent_asset_names in graph.multiple_parents().items():
+        errors.append(asset_hierarchy_file + ": child asset " + repr(child_asset_name) + " has more than one parent: " + ", ".join(map(repr, parent_asset_names)))
+    cycle= graph.cycle()
+    if cycle:
+        errors.append(asset_hierarchy_file + ": cycle in the asset hierarchy between assets: " + ", ".join(map(repr, cycle)))
+    
+    return errors, {"models": model_index, "properties": properties, "hierarchies": hierarchies, "asset_models": asset_models}
+
+# Validate the config and exit with every error found, before any resource is
+# created. Returns the indexes of validate_config.
+def preflight():
+    print("Validating config ... ")
+    begin = t.time()
+    try:
+        errors, config_index= validate_config()
+    except (KeyError, TypeError, ValueError) as err:
+        # A config entry without a required key, or a file that is not valid JSON
+        errors, config_index= ["config file is malformed: " + repr(err)], None
+    end = t.time()
+    for error in errors:
+        print("\t" + error)
+    print(f"{len(errors)} errors found in {(end - begin) * 1000:.0f} ms\n")
+    if errors:
+        exit(1)
+    return config_index
+
+#################################
+# PLAN AND APPLY
+#################################
+
+def load_sitewise_config():
+    with open(models_path, 'r') as file:
+        models = json.load(file)
+    assets= list(iter_config(assets_path))
+    with open(model_hierarchy_path, 'r') as file:
+        model_hierarchies= json.load(file)
+    asset_hierarchies= list(iter_config(asset_hierarchy_path))
+    return models, assets, model_hierarchies, asset_hierarchies
+
+def config_hash(entry):
+    return hashlib.sha256(json.dumps(entry, sort_keys=True).encode()).hexdigest()
+
+# Hash every model (with its hierarchies), asset, attribute and asset
+# association of the config
+def hash_config(models, assets, model_hierarchies, asset_hierarchies):
+    
+    model_hierarchies_by_parent= {model_hierarchy['parent_asset_model_name']: model_hierarchy for model_hierarchy in model_hierarchies}
+    hashes= {
+        "models": {},
+        "assets": {},
+        "asset_model_names": {},
+        "attributes": {},
+        "associations": {}
+    }
+    
+    for model in models:
+        child_models= model_hierarchies_by_parent.get(model['model_name'], {}).get('child_models', [])
+        hashes["models"][model['model_name']]= config_hash([model, child_models])
+    
+    for asset in assets:
+        # Attributes are hashed on their own so that a new value does not touch the asset
+        hashes["assets"][asset['asset_name']]= config_hash({key: value for key, value in asset.items() if key != 'attributes'})
+        hashes["asset_model_names"][asset['asset_name']]= asset['model_name']
+        hashes["attributes"][asset['asset_name']]= {attribute['name']: config_hash(attribute) for attribute in asset['attributes']}
+    
+    for asset_hierarchy in asset_hierarchies:
+        associations= hashes["associations"].setdefault(asset_hierarchy['parent_asset_name'], {})
+        for child_asset in asset_hierarchy['child_assets']:
+            associations[child_asset['child_asset_name']]= config_hash(child_asset['logical_id'])
+    
+    return hashes
+
+# Hash the config files, reading the assets and asset hierarchy as a stream
+def hash_sitewise_config():
+    with open(models_path, 'r') as file:
+        models = json.load(file)
+    with open(model_hierarchy_path, 'r') as file:
+        model_hierarchies= json.load(file)
+    return hash_config(models, iter_config(assets_path), model_hierarchies, iter_config(asset_hierarchy_path))
+
+# Hashes recorded by the last CREATE or APPLY
+def load_config_hashes():
+    if not os.path.exists(config_hashes_path):
+        return hash_config([], [], [], [])
+    with open(config_hashes_path, 'r') as file:
+        return json.load(file)
+
+def record_config_hashes(hashes):
+    with open(config_hashes_path + ".tmp", "w") as outfile:
+        outfile.write(json.dumps(hashes, indent=4))
+    os.replace(config_hashes_path + ".tmp", config_hashes_path)
+
+# Compare the config hashes with the recorded ones and list the minimal
+# changes to apply. An asset that moves to another model is recreated.
+def plan_changes(recorded, hashes):
+    
+    def diff(old, new):
+        added= [key for key in new if key not in old]
+        removed= [key for key in old if key not in new]
+        changed= [key for key in new if key in old and old[key] != new[key]]
+        return added, removed, changed
+    
+    plan= {}
+    plan["create_models"], plan["delete_models"], plan["update_models"]= diff(recorded["models"], hashes["models"])
+    
+    added_assets, removed_assets, changed_assets= diff(recorded["assets"], hashes["assets"])
+    recreated_assets= [asset_name for asset_name in changed_assets if recorded["asset_model_names"][asset_name] != hashes["asset_model_names"][asset_name]]
+    plan["create_assets"]= added_assets + recreated_assets
+    plan["delete_assets"]= removed_assets + recreated_assets
+    plan["update_assets"]= [asset_name for asset_name in changed_assets if asset_name not in recreated_assets]
+    
+    # New assets get their attribute values when they are created
+    plan["write_attributes"]= [
+        (asset_name, attribute_name)
+        for asset_name, attributes in hashes["attributes"].items() if asset_name not in plan["create_assets"]
+        for attribute_name, attribute_hash in attributes.items()
+        if recorded["attributes"].get(asset_name, {}).get(attribute_name) != attribute_hash
+    ]
+    
+    # Associations of recreated assets are made again
+    recreated= set(recreated_assets)
+    plan["disassociate"]= [
+        (parent_asset_name, child_asset_name)
+        for parent_asset_name, children in recorded["associations"].items()
+        for child_asset_name, association_hash in children.items()
+        if hashes["associations"].get(parent_asset_name, {}).get(child_asset_name) != association_hash
+        or parent_asset_name in recreated or child_asset_name in recreated
+    ]
+    plan["associate"]= [
+        (parent_asset_name, child_asset_name)
+        for parent_asset_name, children in hashes["associations"].items()
+        for child_asset_name, association_hash in children.items()
+        if recorded["associations"].get(parent_asset_name, {}).get(child_asset_name) != association_hash
+        or parent_asset_name in recreated or child_asset_name in recreated
+    ]
+    
+    return plan
+
+def print_plan(plan):
+    
+    print("\nPlan:")
+    for key, symbol, label in [
+        ("create_models", "+", "model"),
+        ("update_models", "~", "model"),
+        ("delete_models", "-", "model"),
+        ("create_assets", "+", "asset"),
+        ("update_assets", "~", "asset"),
+        ("delete_assets", "-", "asset"),
+        ("write_attributes", "~", "attribute"),
+        ("associate", "+", "association"),
+        ("disassociate", "-", "association")
+    ]:
+        for item in plan[key]:
+            print("\t" + symbol + " " + label + " " + (" / ".join(item) if isinstance(item, (list, tuple)) else item))
+    
+    creates= len(plan["create_models"]) + len(plan["create_assets"]) + len(plan["associate"])
+    updates= len(plan["update_models"]) + len(plan["update_assets"]) + len(plan["write_attributes"])
+    deletes= len(plan["delete_models"]) + len(plan["delete_assets"]) + len(plan["disassociate"])
+    print(f"\n{creates} to create, {updates} to update, {deletes} to delete")
+
+# Apply a plan to the resources recorded in created/. Returns the hashes to
+# record: entries that could not be applied keep their recorded hash so the
+# next APPLY tries them again.
+def apply_plan(plan, recorded, hashes, models, assets, model_hierarchies, asset_hierarchies):
+    global property_index
+    
+    state= load_journal()
+    script_asset_models= load_records(script_asset_models_path, AssetModelRecord)
+    script_assets= load_records(script_assets_path, AssetRecord)
+    with open(hierarchy_id_mapping_path, 'r') as file:
+        hierarchy_id_mapping= json.load(file)
+    
+    assets_by_name= {asset['asset_name']: asset for asset in assets}
+    model_hierarchies_by_parent= {model_hierarchy['parent_asset_model_name']: model_hierarchy for model_hierarchy in model_hierarchies}
+    
+    ##
+    # Remove associations and assets
+    ##
+    asset_ids= {asset_name: script_assets[asset_name]["assetId"] for asset_name in plan["delete_assets"] if asset_name in script_assets}
+    disassociations= {
+        (script_assets[parent_asset_name]["assetId"], script_assets[child_asset_name]["assetId"])
+        for parent_asset_name, child_asset_name in plan["disassociate"]
+        if parent_asset_name in script_assets and child_asset_name in script_assets
+    }
+    failed= delete_resources_graph({
+        "asset_hierarchy_mapping": [element for element in state["asset_hierarchy_mapping"] if (element["assetId"], element["childAssetId"]) in disassociations],
+        "assets": list(asset_ids.values()),
+        "asset_model_ids": [element for element in state["asset_model_ids"] if element["assetId"] in asset_ids.values()],
+        "asset_models": [],
+        "parent_models": []
+    })
+    for asset_name, asset_id in asset_ids.items():
+        if "asset:" + asset_id not in failed:
+            del script_assets[asset_name]
+    
+    ##
+    # Create and update models, leaves first
+    ##
+    describe_asset_model_responses= {}
+    for level in model_levels(models, model_hierarchies):
+        tasks= {"create": [], "update": []}
+        for model in level:
+            if model['model_name'] not in plan["create_models"] and model['model_name'] not in plan["update_models"]:
+                continue
+            hierarchies= []
+            if model['model_name'] in model_hierarchies_by_parent:
+                hierarchies= asset_model_hierarchies(model_hierarchies_by_parent[model['model_name']], script_asset_models)
+            if model['model_name'] in plan["create_models"]:
+                tasks["create"].append((model, hierarchies))
+            elif model['model_name'] in script_asset_models:
+                tasks["update"].append((model, hierarchies, script_asset_models[model['model_name']]["assetModelId"]))
+        
+        level_asset_models= {}
+        for item in run_tasks(create_asset_model, tasks["create"]) + run_tasks(update_asset_model, tasks["update"]):
+            level_asset_models.update(item or {})
+        script_asset_models.update(level_asset_models)
+        describe_asset_model_responses.update(wait_for_resources("asset_model", [model["assetModelId"] for model in level_asset_models.values()]))
+    hierarchy_id_mapping.update(build_hierarchy_id_mapping(model_hierarchies, script_asset_models, describe_asset_model_responses))
+    
+    ##
+    # Remove models, parents first
+    ##
+    model_ids= {model_name: script_asset_models[model_name]["assetModelId"] for model_name in plan["delete_models"] if model_name in script_asset_models}
+    failed= delete_resources_graph({
+        "asset_hierarchy_mapping": [],
+        "assets": [],
+        "asset_model_ids": [],
+        "asset_models": list(model_ids.values()),
+        "parent_models": [asset_model_id for asset_model_id in state["parent_models"] if asset_model_id in model_ids.values()]
+    })
+    for model_name, asset_model_id in model_ids.items():
+        if "model:" + asset_model_id not in failed:
+            del script_asset_models[model_name]
+    
+    ##
+    # Create and update assets
+    ##
+    # Property ids of the models of every asset to create or update
+    asset_model_names= {assets_by_name[asset_name]['model_name'] for asset_name in plan["create_assets"] + plan["update_assets"]}
+    asset_model_names.update(assets_by_name[asset_name]['model_name'] for asset_name, _ in plan["write_attributes"])
+    needed_asset_models= {model_name: script_asset_models[model_name] for model_name in asset_model_names if model_name in script_asset_models}
+    describe_asset_model_responses.update(describe_resources("asset_model", [
+        asset_model["assetModelId"] for asset_model in needed_asset_models.values() if asset_model["assetModelId"] not in describe_asset_model_responses
+    ]))
+    property_index= build_property_index(needed_asset_models, describe_asset_model_responses)
+    
+    created_assets= [item for item in run_tasks(create_asset, [
+        (assets_by_name[asset_name], script_asset_models) for asset_name in plan["create_assets"] if assets_by_name[asset_name]['model_name'] in script_asset_models
+    ]) if item is not None]
+    for item, _ in created_assets:
+        script_assets.update(item)
+    run_tasks(update_asset_aliases, [
+        (assets_by_name[asset_name], script_assets[asset_name]["assetId"]) for asset_name in plan["update_assets"] if asset_name in script_assets
+    ])
+    
+    ##
+    # Write attribute values
+    ##
+    attribute_values= [value for _, asset_attribute_values in created_assets for value in asset_attribute_values]
+    for asset_name, attribute_name in plan["write_attributes"]:
+        asset= assets_by_name[asset_name]
+        asset_properties= property_index.get(asset['model_name'], {})
+        if asset_name in script_assets and attribute_name in asset_properties:
+            attribute= next(attribute for attribute in asset['attributes'] if attribute['name'] == attribute_name)
+            attribute_values.append((script_assets[asset_name]["assetId"], asset_properties[attribute_name], attribute['value']))
+    put_attribute_values(attribute_values)
+    
+    ##
+    # Add associations
+    ##
+    planned= set(plan["associate"])
+    graph= AssetHierarchyGraph()
+    for parent_asset_name, children in AssetHierarchyGraph.from_config(asset_hierarchies).children.items():
+        for child_asset_name, child_asset in children:
+            if (parent_asset_name, child_asset_name) in planned:
+                graph.add(parent_asset_name, child_asset_name, child_asset)
+    wait_for_resources("asset", list({
+        script_assets[asset_name]["assetId"]
+        for parent_asset_name, child_asset_name in plan["associate"]
+        for asset_name in (parent_asset_name, child_asset_name) if asset_name in script_assets
+    }))
+    associate_levels(graph, hierarchy_id_mapping, script_assets)
+    
+    # Update models, assets and hierarchy id files
+    save_records(script_asset_models_path, script_asset_models)
+    save_records(script_assets_path, script_assets)
+    with open(hierarchy_id_mapping_path, "w") as outfile:
+        outfile.write(json.dumps(hierarchy_id_mapping, indent=4))
+    
+    # Resources that were not created, or not deleted, keep their recorded hash
+    applied= json.loads(json.dumps(hashes))
+    for model_name in plan["create_models"]:
+        if model_name not in script_asset_models:
+            del applied["models"][model_name]
+    for model_name in plan["delete_models"]:
+        if model_name in script_asset_models:
+            applied["models"][model_name]= recorded["models"][model_name]
+    for asset_name in plan["create_assets"]:
+        if asset_name not in script_assets:
+            del applied["assets"][asset_name]
+            del applied["attributes"][asset_name]
+    for asset_name in plan["delete_assets"]:
+        if asset_name in script_assets and asset_name not in plan["create_assets"]:
+            applied["assets"][asset_name]= recorded["assets"][asset_name]
+            applied["asset_model_names"][asset_name]= recorded["asset_model_names"][asset_name]
+            applied["attributes"][asset_name]= recorded["attributes"][asset_name]
+    return applied
+
+#################################
+# ESTIMATE
+#################################
+
+# Typical duration of one SiteWise call, and the time a new or deleted
+# resource takes to settle, in seconds. PLAN --estimate runs the plan against
+# them and against api_rate_limits without calling AWS, set them from the API
+# metrics of a previous run.
+estimate_call_latency= 0.1
+estimate_consistency_delay= {"asset_model": 5, "asset": 1}
+
+# Status polls made by wait_for_resources for resources that settle after
+# the given seconds, and the time the wait takes
+def estimate_polls(seconds):
+    passes, waited, delay= 1, 0, waiter_initial_delay
+    while waited < seconds:
+        waited+= delay
+        delay= min(delay * 2, waiter_max_delay)
+        passes+= 1
+    return passes, waited + passes * estimate_call_latency
+
+# Tasks in flight in a phase run by the selected engine
+def engine_concurrency():
+    return worker_processes if engine == "process" else task_concurrency
+
+# A phase of the deploy:
+#   calls        operation -> number of calls
+#   work         seconds of calls and waits made by all the tasks
+#   concurrency  tasks in flight
+#   chain        seconds of the longest task, run one call after the other
+#   wait         seconds the whole phase waits for resources to settle
+def estimate_phase(name, concurrency):
+    return {"name": name, "calls": collections.Counter(), "work": 0, "concurrency": concurrency, "chain": 0, "wait": 0}
+
+# Count the calls of every phase of the plan the way create_asset_model,
+# update_asset_model, create_asset, update_asset_aliases, put_attribute_values
+# and associate_child_assets make them, and the deletes of apply_plan. With
+# nothing recorded the plan is the whole CREATE. Data streams are counted as
+# new, their scan as one ListTimeSeries page per 250 aliases.
+def estimate_plan(plan, models, assets, model_hierarchies, config_index):
+    
+    latency= estimate_call_latency
+    properties= config_index["properties"]
+    phases= []
+    
+    ##
+    # Remove associations, assets and models
+    ##
+    if plan["disassociate"] or plan["delete_assets"] or plan["delete_models"]:
+        phase= estimate_phase("delete", task_concurrency)
+        phase["calls"]["DisassociateAssets"]= len(plan["disassociate"])
+        for resource_type, resources, operation in (("asset", plan["delete_assets"], "DeleteAsset"), ("asset_model", plan["delete_models"], "DeleteAssetModel")):
+            if resources:
+                passes, wait= estimate_polls(estimate_consistency_delay[resource_type])
+                phase["calls"][operation]+= len(resources)
+                phase["calls"][waiter_operations[resource_type][0]]+= len(resources) * passes
+                phase["wait"]+= wait
+        phase["work"]= (len(plan["disassociate"]) + len(plan["delete_assets"]) + len(plan["delete_models"])) * latency
+        phase["chain"]= latency
+        phases.append(phase)
+    
+    ##
+    # Create and update models, leaves first
+    ##
+    passes, wait= estimate_polls(estimate_consistency_delay["asset_model"])
+    for number, level in enumerate(model_levels(models, model_hierarchies)):
+        created= [model for model in level if model['model_name'] in plan["create_models"]]
+        updated= [model for model in level if model['model_name'] in plan["update_models"]]
+        if not created and not updated:
+            continue
+        phase= estimate_phase("models level " + str(number), engine_concurrency())
+        phase["calls"]["CreateAssetModel"]= len(created)
+        # An update describes the model before changing it
+        phase["calls"]["UpdateAssetModel"]= len(updated)
+        phase["calls"]["DescribeAssetModel"]= len(updated) + (len(created) + len(updated)) * passes
+        phase["work"]= (len(created) + 2 * len(updated)) * latency
+        phase["chain"]= (2 if updated else 1) * latency
+        phase["wait"]= wait
+        phases.append(phase)
+    
+    ##
+    # Create assets and set their aliases
+    ##
+    create_assets= set(plan["create_assets"])
+    update_assets= set(plan["update_assets"])
+    write_attributes= collections.Counter(asset_name for asset_name, _ in plan["write_attributes"])
+    passes, wait= estimate_polls(estimate_consistency_delay["asset"])
+    phase= estimate_phase("assets", engine_concurrency())
+    attribute_values= 0
+    for asset in assets:
+        asset_properties= properties.get(asset['model_name'], {})
+        measurements= sum(1 for measurement in asset['measurements'] if measurement['name'] in asset_properties)
+        # Alias updates of an asset run alias_concurrency at a time
+        alias_time= -(-measurements // alias_concurrency) * latency
+        if asset['asset_name'] in create_assets:
+            task_time= latency
+            phase["calls"]["CreateAsset"]+= 1
+            if asset['measurements'] != []:
+                phase["calls"]["DescribeAsset"]+= passes
+                phase["calls"]["UpdateAssetProperty"]+= measurements
+                task_time+= wait + alias_time
+            attribute_values+= sum(1 for attribute in asset['attributes'] if attribute['name'] in asset_properties)
+        elif asset['asset_name'] in update_assets:
+            phase["calls"]["UpdateAssetProperty"]+= measurements
+            task_time= alias_time
+        else:
+            task_time= 0
+        attribute_values+= write_attributes[asset['asset_name']]
+        phase["work"]+= task_time
+        phase["chain"]= max(phase["chain"], task_time)
+    if phase["calls"]:
+        # The data streams of the aliases are indexed first, one page after the other
+        pages= -(-phase["calls"]["UpdateAssetProperty"] // 250)
+        if pages:
+            index_phase= estimate_phase("data streams", 1)
+            index_phase["calls"]["ListTimeSeries"]= pages
+            index_phase["work"]= index_phase["chain"]= pages * latency
+            phases.append(index_phase)
+        phases.append(phase)
+    
+    ##
+    # Write attribute values
+    ##
+    if attribute_values:
+        phase= estimate_phase("attributes", attribute_batch_concurrency)
+        phase["calls"]["BatchPutAssetPropertyValue"]= -(-attribute_values // attribute_batch_size)
+        phase["work"]= phase["calls"]["BatchPutAssetPropertyValue"] * latency
+        phase["chain"]= latency
+        phases.append(phase)
+    
+    ##
+    # Add associations, the assets are described once and then associated
+    # level by level, the children of a parent one after the other
+    ##
+    if plan["associate"]:
+        graph= AssetHierarchyGraph()
+        for parent_asset_name, child_asset_name in plan["associate"]:
+            graph.add(parent_asset_name, child_asset_name, None)
+        associated_assets= {asset_name for association in plan["associate"] for asset_name in association}
+        phase= estimate_phase("associations", engine_concurrency())
+        phase["calls"]["DescribeAsset"]= len(associated_assets)
+        phase["calls"]["AssociateAssets"]= len(plan["associate"])
+        phase["work"]= len(plan["associate"]) * latency
+        phase["chain"]= len(associated_assets) * latency / waiter_concurrency + sum(max(len(graph.children[parent]) for parent in level) for level in graph.levels()) * latency
+        phases.append(phase)
+    
+    return phases
+
+# Time of a phase and what bounds it: an operation at its rate limit, the
+# tasks in flight, or its longest task. rates override api_rate_limits.
+def estimate_phase_time(phase, rates):
+    bounds= [(phase["work"] / phase["concurrency"], "concurrency"), (phase["chain"], "latency")]
+    for operation, calls in phase["calls"].items():
+        if rates.get(operation):
+            bounds.append((calls / rates[operation], operation))
+    seconds, bound= max(bounds)
+    return seconds + phase["wait"], bound
+
+def estimate_total_time(phases, rates):
+    return sum(estimate_phase_time(phase, rates)[0] for phase in phases)
+
+# Print the expected time of every phase, the calls and rate limit of every
+# operation, the bottleneck and the quota increase that saves the most time
+def print_estimate(phases):
+    
+    print("\nEstimate (" + engine + " engine, " + str(estimate_call_latency) + " s per call):")
+    bound_time= collections.Counter()
+    for phase in phases:
+        seconds, bound= estimate_phase_time(phase, api_rate_limits)
+        bound_time[bound]+= seconds - phase["wait"]
+        bound_time["waits"]+= phase["wait"]
+        print(f"\t{phase['name']:<24} {seconds:10.1f} s, bound by {bound}" + (f", {phase['wait']:.1f} s waiting" if phase["wait"] else ""))
+    total= estimate_total_time(phases, api_rate_limits)
+    print(f"\tTotal: {total:.1f} s ({total / 60:.1f} min)")
+    
+    calls= collections.Counter()
+    for phase in phases:
+        calls.update(phase["calls"])
+    print("\n\t%-40s %10s %8s %12s" % ("Operation", "Calls", "TPS", "At quota"))
+    for operation in sorted(calls):
+        if calls[operation]:
+            rate= api_rate_limits.get(operation)
+            print("\t%-40s %10d %8s %12s" % (operation, calls[operation], rate or "-", "%.1f s" % (calls[operation] / rate) if rate else "-"))
+    
+    if total == 0:
+        return
+    bottleneck, seconds= bound_time.most_common(1)[0]
+    print(f"\nBottleneck: {bottleneck}, {seconds:.1f} s of {total:.1f} s")
+    
+    # Double every quota in turn and keep the one that saves the most
+    savings= [(total - estimate_total_time(phases, dict(api_rate_limits, **{operation: api_rate_limits[operation] * 2})), operation) for operation in calls if api_rate_limits.get(operation)]
+    saving, operation= max(savings, default=(0, None))
+    if saving >= total * 0.01:
+        print(f"Doubling the {operation} quota to {api_rate_limits[operation] * 2} TPS would save {saving:.1f} s ({saving * 100 / total:.0f}%)")
+    else:
+        print("No quota increase would save more than 1%, the deploy is bound by latency, tasks in flight and waits")
+
+#################################
+# WORK QUEUE
+#################################
+
+# Queue of create asset and associate assets work items, shared by workers on
+# several hosts. ENQUEUE creates the models and fills the queue, WORKER
+# claims items until the queue is drained, COLLECT records the created
+# resources for DELETE. The queue is a SQLite file, it must be on a file
+# system that every host can lock.
+queue_path= "created/queue.db"
+
+# Most items a worker claims at once. Claims are small, so that a worker
+# that joins late still finds items of a small queue to run.
+queue_batch_size= 20
+
+# A claimed item goes back to the queue if its worker does not renew the
+# lease in time. Items are tried at most queue_max_attempts times.
+queue_lease_seconds= 300
+queue_max_attempts= 3
+
+# Seconds between the heartbeats of a worker. A worker is active while its
+# last heartbeat is less than three intervals old, and every heartbeat shares
+# the account rates again among the active workers.
+queue_heartbeat_interval= 5
+
+# Seconds a worker waits before looking again when all remaining items are
+# claimed or wait for assets that are not created yet
+queue_poll_interval= 5
+
+queue_states= ("pending", "leased", "done", "failed")
+
+def open_queue(path):
+    connection= sqlite3.connect(path, timeout=60, isolation_level=None)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS work_items (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',
+            owner TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            UNIQUE (kind, name)
+        );
+        CREATE INDEX IF NOT EXISTS work_items_state ON work_items (state);
+        CREATE TABLE IF NOT EXISTS dependencies (
+            item_id INTEGER NOT NULL,
+            asset_name TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS dependencies_item ON dependencies (item_id);
+        CREATE TABLE IF NOT EXISTS workers (
+            owner TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """)
+    return connection
+
+# Write transaction, other hosts wait for it to finish
+@contextlib.contextmanager
+def queue_transaction(connection):
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+def queue_meta(connection, key, default=None):
+    row= connection.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return json.loads(row[0]) if row is not None else default
+
+# Number of items by (kind, state)
+def queue_counts(connection):
+    return collections.Counter({
+        (kind, state): count
+        for kind, state, count in connection.execute("SELECT kind, state, COUNT(*) FROM work_items GROUP BY kind, state")
+    })
+
+def print_queue_counts(counts):
+    for kind in ("asset", "association"):
+        print("\t" + kind + " items: " + ", ".join(f"{counts[(kind, state)]} {state}" for state in queue_states))
+
+# Store what the workers need and add an item for every asset and every
+# parent asset of the asset hierarchy. An association item waits for the
+# items of its assets. Items already in the queue are left as they are,
+# except failed items that are tried again.
+def enqueue_work(path, asset_models, hierarchy_id_mapping, properties):
+    
+    connection= open_queue(path)
+    with queue_transaction(connection):
+        for key, value in [
+            ("asset_models", {model_name: asset_model.to_json() for model_name, asset_model in asset_models.items()}),
+            ("hierarchy_id_mapping", hierarchy_id_mapping),
+            ("property_index", properties),
+            ("alias_prefix", config_alias_prefix())
+        ]:
+            connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        connection.execute("UPDATE work_items SET state='pending', attempts=0, error=NULL WHERE state='failed'")
+        
+        connection.executemany(
+            "INSERT OR IGNORE INTO work_items (kind, name, payload) VALUES ('asset', ?, ?)",
+            ((asset['asset_name'], json.dumps(asset)) for asset in iter_config(assets_path))
+        )
+        for asset_hierarchy in iter_config(asset_hierarchy_path):
+            cursor= connection.execute(
+                "INSERT OR IGNORE INTO work_items (kind, name, payload) VALUES ('association', ?, ?)",
+                (asset_hierarchy['parent_asset_name'], json.dumps(asset_hierarchy))
+            )
+            if cursor.rowcount:
+                asset_names= [asset_hierarchy['parent_asset_name']] + [child_asset['child_asset_name'] for child_asset in asset_hierarchy['child_assets']]
+                connection.executemany("INSERT INTO dependencies (item_id, asset_name) VALUES (?, ?)", [(cursor.lastrowid, asset_name) for asset_name in asset_names])
+    
+    counts= queue_counts(connection)
+    connection.close()
+    return counts
+
+# Claim up to batch_size items that are pending, or whose lease expired, and
+# whose assets are all created. When fewer items are ready than workers can
+# claim, a worker only claims its share of them.
+def claim_work(connection, owner, batch_size, workers=1):
+    
+    now= t.time()
+    with queue_transaction(connection):
+        # Items that keep failing, and associations of assets that failed, are not tried again
+        connection.execute(
+            "UPDATE work_items SET state='failed', error='lease expired' WHERE state='leased' AND lease_expires < ? AND attempts >= ?",
+            (now, queue_max_attempts)
+        )
+        connection.execute("""
+            UPDATE work_items SET state='failed', error='an asset to associate failed'
+            WHERE state='pending' AND EXISTS (
+                SELECT 1 FROM dependencies JOIN work_items AS assets ON assets.kind='asset' AND assets.name=dependencies.asset_name
+                WHERE dependencies.item_id=work_items.id AND assets.state='failed'
+            )
+        """)
+        items= connection.execute("""
+            SELECT id, kind, payload FROM work_items
+            WHERE (state='pending' OR (state='leased' AND lease_expires < ?)) AND NOT EXISTS (
+                SELECT 1 FROM dependencies JOIN work_items AS assets ON assets.kind='asset' AND assets.name=dependencies.asset_name
+                WHERE dependencies.item_id=work_items.id AND assets.state!='done'
+            )
+            ORDER BY id LIMIT ?
+        """, (now, batch_size * workers)).fetchall()
+        items= items[:min(batch_size, -(-len(items) // workers))]
+        connection.executemany(
+            "UPDATE work_items SET state='leased', owner=?, lease_expires=?, attempts=attempts+1 WHERE id=?",
+            [(owner, now + queue_lease_seconds, item_id) for item_id, _, _ in items]
+        )
+    
+    return [(item_id, kind, json.loads(payload)) for item_id, kind, payload in items]
+
+# Record the (item id, result, error) of claimed items. Failed items go back
+# to the queue until they have been tried queue_max_attempts times.
+def complete_work(connection, owner, results):
+    with queue_transaction(connection):
+        for item_id, result, error in results:
+            if error is None:
+                connection.execute(
+                    "UPDATE work_items SET state='done', result=?, error=NULL, owner=NULL, lease_expires=NULL WHERE id=?",
+                    (json.dumps(result), item_id)
+                )
+            else:
+                connection.execute(
+                    "UPDATE work_items SET state=CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, error=?, owner=NULL, lease_expires=NULL "
+                    "WHERE id=? AND owner=? AND state='leased'",
+                    (queue_max_attempts, error, item_id, owner)
+                )
+
+# Renew the heartbeat of a worker and the leases of its items, returns the
+# number of active workers
+def queue_heartbeat(connection, owner):
+    now= t.time()
+    with queue_transaction(connection):
+        connection.execute("INSERT OR REPLACE INTO workers (owner, heartbeat) VALUES (?, ?)", (owner, now))
+        connection.execute("UPDATE work_items SET lease_expires=? WHERE state='leased' AND owner=?", (now + queue_lease_seconds, owner))
+        workers= connection.execute("SELECT COUNT(*) FROM workers WHERE heartbeat >= ?", (now - 3 * queue_heartbeat_interval,)).fetchone()[0]
+    return max(workers, 1)
+
+# Ids of the created assets among asset_names
+def queue_assets(connection, asset_names):
+    
+    asset_names= list(asset_names)
+    assets= {}
+    # SQLite limits the number of parameters of a statement
+    for i in range(0, len(asset_names), 500):
+        chunk= asset_names[i:i + 500]
+        for asset_name, result in connection.execute(
+            "SELECT name, result FROM work_items WHERE kind='asset' AND state='done' AND name IN (" + ",".join("?" * len(chunk)) + ")", chunk
+        ):
+            assets[asset_name]= AssetRecord(*json.loads(result))
+    return assets
+
+# Run one item of the queue, returns (result, attribute values, error)
+def run_work_item(kind, payload, asset_models, hierarchy_id_mapping, assets):
+    try:
+        if kind == "asset":
+            obj, attribute_values= create_asset(payload, asset_models)
+            if payload['asset_name'] not in obj:
+                return None, [], "the asset was not created"
+            return obj[payload['asset_name']].to_json(), attribute_values, None
+        
+        # Assets can only be associated once they are ACTIVE
+        asset_names= [payload['parent_asset_name']] + [child_asset['child_asset_name'] for child_asset in payload['child_assets']]
+        wait_for_resources("asset", [assets[asset_name]["assetId"] for asset_name in asset_names])
+        asset_hierarchy_list= associate_child_assets(payload, hierarchy_id_mapping, assets)
+        if len(asset_hierarchy_list) < len(payload['child_assets']):
+            return None, [], "some assets were not associated"
+        return asset_hierarchy_list, [], None
+    
+    except Exception as err:
+        # Retryable errors are deferred by the engine
+        if classify_error(err) != "fatal":
+            raise
+        return None, [], repr(err)
+
+# Claim and run items until the queue is drained, returns the number of items
+# completed and failed by kind. The account rates are divided among the
+# workers that are active.
+def run_worker(path):
+    global property_index, time_series_index
+    
+    owner= socket.gethostname() + ":" + str(os.getpid())
+    connection= open_queue(path)
+    asset_models= {model_name: AssetModelRecord(*values) for model_name, values in queue_meta(connection, "asset_models").items()}
+    hierarchy_id_mapping= queue_meta(connection, "hierarchy_id_mapping")
+    property_index= queue_meta(connection, "property_index")
+    time_series_index= build_time_series_index(queue_meta(connection, "alias_prefix", ""))
+    
+    def heartbeat(heartbeat_connection):
+        workers= queue_heartbeat(heartbeat_connection, owner)
+        rate_limiter.share(1 / workers)
+        return workers
+    
+    # The heartbeat and the leases are renewed in the background, while items
+    # run, and before every claim
+    stopped= threading.Event()
+    def renew():
+        renew_connection= open_queue(path)
+        while not stopped.wait(queue_heartbeat_interval):
+            heartbeat(renew_connection)
+        renew_connection.close()
+    
+    print(f"Worker {owner} joined {heartbeat(connection)} active workers")
+    renewer= threading.Thread(target=renew, daemon=True)
+    renewer.start()
+    
+    completed= collections.Counter()
+    try:
+        # One pool of processes runs the items of every claim
+        with task_pool():
+            while True:
+                items= claim_work(connection, owner, queue_batch_size, heartbeat(connection))
+                if not items:
+                    remaining= connection.execute("SELECT COUNT(*) FROM work_items WHERE state IN ('pending', 'leased')").fetchone()[0]
+                    if remaining == 0:
+                        break
+                    t.sleep(queue_poll_interval)
+                    continue
+                
+                assets= queue_assets(connection, {
+                    asset_name
+                    for _, kind, payload in items if kind == "association"
+                    for asset_name in [payload['parent_asset_name']] + [child_asset['child_asset_name'] for child_asset in payload['child_assets']]
+                })
+                results= run_tasks(run_work_item, [(kind, payload, asset_models, hierarchy_id_mapping, assets) for _, kind, payload in items])
+                results= [result if result is not None else (None, [], "failed after " + str(retry_max_attempts) + " attempts") for result in results]
+                
+                # Attribute values of the batch are written together
+                put_attribute_values([value for _, attribute_values, _ in results for value in attribute_values])
+                complete_work(connection, owner, [(item_id, result, error) for (item_id, _, _), (result, _, error) in zip(items, results)])
+                for (_, kind, payload), (_, _, error) in zip(items, results):
+                    if error is not None:
+                        print("\t" + kind + " " + (payload.get('asset_name') or payload.get('parent_asset_name')) + ": " + error)
+                    completed[kind + (" failed" if error is not None else " done")]+= 1
+    finally:
+        stopped.set()
+        renewer.join()
+        with queue_transaction(connection):
+            connection.execute("DELETE FROM workers WHERE owner=?", (owner,))
+        connection.close()
+    
+    return completed
+
+# Record the assets and associations created by all the workers in the
+# journal and in created/assets.json, so that DELETE removes them
+def collect_work(path):
+    
+    connection= open_queue(path)
+    asset_models= queue_meta(connection, "asset_models")
+    
+    assets_file= JsonObjectWriter(script_assets_path)
+    for asset_name, payload, result in connection.execute("SELECT name, payload, result FROM work_items WHERE kind='asset' AND state='done' ORDER BY id"):
+        asset_record= AssetRecord(*json.loads(result))
+        asset_model_id= AssetModelRecord(*asset_models[json.loads(payload)['model_name']]).assetModelId
+        add_resources_element("assets", asset_record.assetId)
+        add_resources_element("asset_model_ids", {"assetId": asset_record.assetId, "assetModelId": asset_model_id})
+        checkpoint("asset", asset_name, {"assetId": asset_record.assetId, "assetArn": asset_record.assetArn})
+        assets_file.write(asset_name, asset_record.to_json())
+    assets_file.close()
+    
+    for (result,) in connection.execute("SELECT result FROM work_items WHERE kind='association' AND state='done'"):
+        for asset_hierarchy in json.loads(result):
+            add_asset_hierarchy_mapping_element(asset_hierarchy)
+    
+    for kind, name, error in connection.execute("SELECT kind, name, error FROM work_items WHERE state='failed' ORDER BY id"):
+        print("\tFailed " + kind + " " + name + ": " + error)
+    
+    counts= queue_counts(connection)
+    connection.close()
+    return counts
+
+#################################
+# LIBRARY API
+#################################
+
+# Every phase of CREATE can be run on its own from another program, on config
+# entries held in memory and with a client of the caller:
+#
+#   import sw_infra
+#   asset_models, hierarchy_id_mapping= sw_infra.deploy_models(models, model_hierarchies, sitewise_client=client)
+#   assets= sw_infra.deploy_assets(batch, asset_models)
+#   sw_infra.deploy_asset_hierarchy(asset_hierarchies, hierarchy_id_mapping, assets)
+#
+# Importing the script makes no API call and reads no config file. Like
+# CREATE, the phases record what they create in the resources journal for
+# DELETE, and skip the steps found in checkpoints. The client is shared by
+# the tasks of the thread, async and dag engines, the workers of the process
+# engine create their own. Set time_series_index with build_time_series_index
+# to send every alias straight to the right call.
+
+# Use the client of the caller, and start the rate limiter and the event loop
+# of the engine on the first phase
+def prepare_phase(sitewise_client=None):
+    global client, rate_limiter, max_pool_connections
+    if sitewise_client is not None:
+        client= sitewise_client
+    if engine != "process":
+        max_pool_connections= task_concurrency + alias_concurrency
+    if rate_limiter is None:
+        rate_limiter= RateLimiter(api_rate_limits)
+    if engine == "async" and async_loop is None:
+        start_async_engine()
+
+# Create models leaves first, each parent model with its hierarchies.
+# asset_models holds the models created by an earlier batch. Returns all the
+# models and the hierarchy ids of the created parent models by logical id,
+# and indexes the property ids of the created models for deploy_assets.
+def deploy_models(models, model_hierarchies, asset_models=None, sitewise_client=None):
+    prepare_phase(sitewise_client)
+    asset_models, describe_asset_model_responses= create_asset_models(models, model_hierarchies, asset_models)
+    property_index.update(build_property_index(asset_models, describe_asset_model_responses))
+    return asset_models, build_hierarchy_id_mapping(model_hierarchies, asset_models, describe_asset_model_responses)
+
+# Give the created parent models of model_hierarchies their hierarchies, for
+# child models created after their parent, for example by a later batch.
+# Returns the hierarchy ids of the updated parent models by logical id.
+def deploy_model_hierarchy(models, model_hierarchies, asset_models, sitewise_client=None):
+    prepare_phase(sitewise_client)
+    models_by_name= {model['model_name']: model for model in models}
+    updated_asset_models= {}
+    for item in run_tasks(update_asset_model, [
+        (models_by_name[model_hierarchy['parent_asset_model_name']], asset_model_hierarchies(model_hierarchy, asset_models), asset_models[model_hierarchy['parent_asset_model_name']]["assetModelId"])
+        for model_hierarchy in model_hierarchies
+        if model_hierarchy['parent_asset_model_name'] in models_by_name and model_hierarchy['parent_asset_model_name'] in asset_models
+    ]):
+        updated_asset_models.update(item or {})
+    describe_asset_model_responses= wait_for_resources("asset_model", [asset_model["assetModelId"] for asset_model in updated_asset_models.values()])
+    return build_hierarchy_id_mapping(model_hierarchies, asset_models, describe_asset_model_responses)
+
+# Create the assets, an iterable read one entry at a time, set their aliases
+# and write their attribute values. asset_models holds the created models of
+# the assets. on_created gets the name and record of every asset as soon as
+# it is created. Returns the created assets by name.
+def deploy_assets(assets, asset_models, on_created=None, sitewise_client=None):
+    prepare_phase(sitewise_client)
+    
+    # Property ids of the models created by another run
+    property_index.update(build_property_index(asset_models, describe_resources("asset_model", [
+        asset_model["assetModelId"] for model_name, asset_model in asset_models.items() if model_name not in property_index
+    ])))
+    
+    created_assets= {}
+    attribute_values= []
+    # Write attribute values as soon as there are enough of them for full batches
+    def asset_created(result):
+        obj, asset_attribute_values= result
+        for asset_name, asset_record in obj.items():
+            created_assets[asset_name]= asset_record
+            if on_created is not None:
+                on_created(asset_name, asset_record)
+        attribute_values.extend(asset_attribute_values)
+        if len(attribute_values) >= attribute_flush_size:
+            put_attribute_values(attribute_values)
+            attribute_values.clear()
+    
+    stream_tasks(create_asset, zip(assets, itertools.repeat(asset_models)), asset_created)
+    put_attribute_values(attribute_values)
+    return created_assets
+
+# Associate the assets of asset_hierarchies once they are ACTIVE. assets holds
+# the created assets by name. Returns the number of associations.
+def deploy_asset_hierarchy(asset_hierarchies, hierarchy_id_mapping, assets, sitewise_client=None):
+    prepare_phase(sitewise_client)
+    asset_hierarchies= list(asset_hierarchies)
+    asset_ids= list(dict.fromkeys(
+        assets[asset_name]["assetId"]
+        for asset_hierarchy in asset_hierarchies
+        for asset_name in [asset_hierarchy['parent_asset_name']] + [child_asset['child_asset_name'] for child_asset in asset_hierarchy['child_assets']]
+        if asset_name in assets
+    ))
+    for i in range(0, len(asset_ids), stream_window):
+        wait_for_resources("asset", asset_ids[i:i + stream_window])
+    return create_asset_hierarchy(asset_hierarchies, hierarchy_id_mapping, assets)
+
+#################################
+# PHASE COMMANDS
+#################################
+
+# Config file each phase command reads when no --batch is given
+phase_config_paths= {
+    "MODELS": models_path,
+    "MODEL-HIERARCHY": model_hierarchy_path,
+    "ASSETS": assets_path,
+    "ASSET-HIERARCHY": asset_hierarchy_path
+}
+
+# Metrics phase the calls of each phase command are counted under when they
+# are not made by the functions of a phase, like waiters and describes
+phase_metric_names= {
+    "MODELS": "models",
+    "MODEL-HIERARCHY": "models",
+    "ASSETS": "assets",
+    "ASSET-HIERARCHY": "associations"
+}
+
+# Answer yes to every question, set with --yes for unattended runs
+assume_yes= False
+
+# Ask a yes or no question and exit on no
+def confirm(question):
+    if assume_yes:
+        return
+    answer = None
+    while answer not in ("yes", "no"):
+        answer = input(question + "\nEnter yes or no: ")
+        if answer == "no":
+            print("Exiting ... ")
+            exit(0)
+        elif answer != "yes":
+            print("Please enter yes or no.")
+
+def load_created_records(path, record_type):
+    return load_records(path, record_type) if os.path.exists(path) else {}
+
+# Add the hierarchy ids of a phase to hierarchy_id_mapping.json
+def update_hierarchy_id_mapping(hierarchy_id_mapping):
+    recorded= {}
+    if os.path.exists(hierarchy_id_mapping_path):
+        with open(hierarchy_id_mapping_path, 'r') as file:
+            recorded= json.load(file)
+    recorded.update(hierarchy_id_mapping)
+    with open(hierarchy_id_mapping_path, "w") as outfile:
+        outfile.write(json.dumps(recorded, indent=4))
+    return recorded
+
+# Run one phase on the entries of one batch file, with the resources created
+# by the earlier phases and batches read from created/
+def run_phase_batch(phase, batch_path):
+    global time_series_index
+    
+    if phase == "MODELS":
+        model_hierarchies= list(iter_config(model_hierarchy_path)) if os.path.exists(model_hierarchy_path) else []
+        asset_models, hierarchy_id_mapping= deploy_models(list(iter_config(batch_path)), model_hierarchies, load_created_records(script_asset_models_path, AssetModelRecord))
+        save_records(script_asset_models_path, asset_models)
+        update_hierarchy_id_mapping(hierarchy_id_mapping)
+        return str(len(asset_models)) + " asset models created in total"
+    
+    if phase == "MODEL-HIERARCHY":
+        hierarchy_id_mapping= deploy_model_hierarchy(list(iter_config(models_path)), list(iter_config(batch_path)), load_created_records(script_asset_models_path, AssetModelRecord))
+        update_hierarchy_id_mapping(hierarchy_id_mapping)
+        return str(len(hierarchy_id_mapping)) + " model hierarchies updated"
+    
+    if phase == "ASSETS":
+        time_series_index= build_time_series_index(config_alias_prefix(iter_config(batch_path)))
+        created_assets= deploy_assets(iter_config(batch_path), load_created_records(script_asset_models_path, AssetModelRecord))
+        assets= load_created_records(script_assets_path, AssetRecord)
+        assets.update(created_assets)
+        save_records(script_assets_path, assets)
+        return str(len(created_assets)) + " assets created"
+    
+    with open(hierarchy_id_mapping_path, 'r') as file:
+        hierarchy_id_mapping= json.load(file)
+    associations= deploy_asset_hierarchy(iter_config(batch_path), hierarchy_id_mapping, load_created_records(script_assets_path, AssetRecord))
+    return str(associations) + " assets associated"
+
+#################################
+# MAIN
+#################################
+
+# Run one flow or phase from the command line arguments, argv defaults to sys.argv
+def main(argv=None):
+    global engine, max_pool_connections, api_metrics, rate_limiter, time_series_index, checkpoints, property_index, assume_yes
+    
+    parser= argparse.ArgumentParser(description="Create or delete AWS IoT SiteWise resources from the sitewise_config files")
+    parser.add_argument("action", type=str.upper, choices=["CREATE", "DELETE", "PLAN", "APPLY", "COMPACT", "ENQUEUE", "WORKER", "COLLECT", "VALIDATE", "DISCOVER"] + list(phase_config_paths),
+                        help="a flow, or one phase of CREATE: MODELS, MODEL-HIERARCHY, ASSETS or ASSET-HIERARCHY")
+    parser.add_argument("--queue", default=queue_path,
+                        help="work queue file used by ENQUEUE, WORKER and COLLECT")
+    parser.add_argument("--engine", choices=["process", "thread", "async", "dag"], default=engine,
+                        help="run tasks in a multiprocessing pool (default), in a thread pool, as coroutines on one event loop whose calls run on task_concurrency threads, or as a dependency graph")
+    parser.add_argument("--metrics-interval", type=float, default=0,
+                        help="also write the API metrics every this many seconds while the run goes on")
+    parser.add_argument("--trace", action="store_true",
+                        help="write a trace of every resource operation and API call to " + trace_path + ", and print the critical path")
+    parser.add_argument("--estimate", action="store_true",
+                        help="with PLAN or APPLY, also estimate how long the changes take to deploy from api_rate_limits, without calling AWS")
+    parser.add_argument("--batch", nargs="+", default=[], metavar="FILE",
+                        help="config files a phase runs on one after the other, in the same process, instead of its sitewise_config file")
+    parser.add_argument("--yes", action="store_true",
+                        help="answer yes to every confirmation, for unattended runs")
+    args= parser.parse_args(argv)
+
+    assume_yes= args.yes
+
+    engine= args.engine
+    if engine != "process" or args.action in ('DELETE', 'APPLY', 'DISCOVER'):
+        # One client shared by all tasks, with a connection for every task in flight
+        max_pool_connections= task_concurrency + alias_concurrency
+    if engine == "async":
+        start_async_engine()
+
+    # Metrics of every API call, written at the end of the run
+    api_metrics= ApiMetrics(api_rate_limits, phase_metric_names.get(args.action, args.action.lower()))
+    if args.metrics_interval > 0:
+        flush_metrics_periodically(args.metrics_interval)
+    if args.trace:
+        start_trace()
+
+    if args.action=='CREATE':
+
+        #################################
+        # CREATE 
+        #################################
+    
+    
+        ##
+        # Find every error of the config before creating anything
+        ##
+        preflight()
+    
+        ##
+        # Get confirmation that existing resources can be adopted
+        ##
+        confirm("Resources of the config that already exist in this account will be adopted by this deployment, and removed by DELETE. Continue?")
+    
+        ##
+        # Initiate the rate limiter shared by all workers
+        ##
+        rate_limiter= RateLimiter(api_rate_limits)
+    
+        ##
+        # Index the data streams of the aliases, each alias then goes straight to the right call
+        ##
+        print("Indexing Data Streams ... ")
+        time_series_index= build_time_series_index(config_alias_prefix())
+        print(f"{len(time_series_index)} data streams found")
+    
+        ##
+        # Load the steps completed by previous runs, they are skipped
+        ##
+        print("Loading Resources Journal")
+        compact_journal()
+        checkpoints= load_checkpoints()
+        print(f"{len(checkpoints['model'])} asset models and {len(checkpoints['asset'])} assets already created")
+    
+        if engine == "dag":
+        
+            ##
+            # Create Asset Models, Assets and Hierarchies as one dependency graph
+            ##
+            print("Creating Asset Models, Assets and Hierarchies ... ")
+            models, assets, model_hierarchies, asset_hierarchies= load_sitewise_config()
+            begin = t.time()
+            script_asset_models, script_assets, hierarchy_id_mapping= create_resources_graph(models, assets, model_hierarchies, asset_hierarchies)
+            end = t.time()
+            print(f"\nTotal runtime to Create all resources is {end - begin}\n")
+            # Update models, assets and hierarchy id files
+            save_records(script_asset_models_path, script_asset_models)
+            save_records(script_assets_path, script_assets)
+            with open(hierarchy_id_mapping_path, "w") as outfile:
+                outfile.write(json.dumps(hierarchy_id_mapping, indent=4))
+    
+        else:
+        
+            ##
+            # Create Asset Models with their Model Hierarchy
+            ##
+            print("Creating Asset Models ... ")
+             # Open models file from sitewise config files 
+            with open(models_path, 'r') as file:
+                models = json.load(file)
+            with open(model_hierarchy_path, 'r') as file:
+                model_hierarchies= json.load(file)
+            begin = t.time()
+            # Create models leaves first, models of the same level in parallel
+            script_asset_models, hierarchy_id_mapping= deploy_models(models, model_hierarchies)
+            end = t.time()
+            print(f"\nTotal runtime to Create all Asset Models is {end - begin}\n")
+            # Update models file
+            save_records(script_asset_models_path, script_asset_models)
+            # Writing to hierarchy_id_mapping.json
+            with open(hierarchy_id_mapping_path, "w") as outfile:
+                outfile.write(json.dumps(hierarchy_id_mapping, indent=4))
+        
+            ##
+            # Create Assets and write their Attributes
+            ##
+            print("Creating Assets ... ")
+            begin = t.time()
+            # Save every asset as soon as it is created
+            assets_file= JsonObjectWriter(script_assets_path)
+            # Create all assets in parallel, reading the assets config file as a stream
+            script_assets= deploy_assets(iter_config(assets_path), script_asset_models, lambda asset_name, asset_record: assets_file.write(asset_name, asset_record.to_json()))
+            assets_file.close()
+            end = t.time()
+            print(f"\nTotal runtime to Create all Assets is {end - begin}\n")
+        
+            ##
+            # Configure Asset Hierarchy
+            ##
+            print("Adding Asset Hierarchy ... ")
+            begin = t.time()
+            deploy_asset_hierarchy(iter_config(asset_hierarchy_path), hierarchy_id_mapping, script_assets)
+            end = t.time()
+            print(f"\nTotal runtime to Add the Asset Hierarchy is {end - begin}\n")
+    
+        # Write the journal back to the created/ files
+        compact_journal()
+        # Record the config that was deployed for PLAN and APPLY
+        record_config_hashes(hash_sitewise_config())
+        rate_limiter.report()
+        report_failures()
+        write_metrics()
+        write_trace()
+        print("Done!")
+    
+        print("\n\n*********")
+        print("\nNOTE: If this deployment has FAILED, or operations failed permanently, fix the cause and run the CREATE flow again. It resumes from the steps that are already done.")
+        print("\n*********\n")
+
+    elif args.action in phase_config_paths:
+        #################################
+        # ONE PHASE 
+        #################################
+    
+        if args.action in ("MODELS", "ASSETS"):
+            confirm("Resources of the config that already exist in this account will be adopted by this deployment, and removed by DELETE. Continue?")
+    
+        rate_limiter= RateLimiter(api_rate_limits)
+    
+        ##
+        # Load the steps completed by previous runs, they are skipped
+        ##
+        compact_journal()
+        checkpoints= load_checkpoints()
+    
+        ##
+        # Run the phase on every batch, the resources of the earlier phases and batches are read from created/
+        ##
+        for batch_path in args.batch or [phase_config_paths[args.action]]:
+            print("Running " + args.action + " on " + batch_path + " ... ")
+            begin = t.time()
+            summary= run_phase_batch(args.action, batch_path)
+            end = t.time()
+            print(f"\n{summary} in {end - begin:.1f} s\n")
+            # Write the journal back to the created/ files after every batch
+            compact_journal()
+    
+        rate_limiter.report()
+        report_failures()
+        write_metrics()
+        write_trace()
+        print("Done!")
+
+    elif args.action=='DELETE':
+        #################################
+        # DELETE 
+        #################################
+    
+    
+        ##
+        # Initiate the rate limiter
+        ##
+        rate_limiter= RateLimiter(api_rate_limits)
+    
+        # Fetch all the created resources from the journal
+        state= load_journal()
+    
+        ##
+        # Remove Asset Hierarchy, Assets and Models
+        ##
+        print("Removing Asset Hierarchy, Assets and Models ... ")
+        begin = t.time()
+        delete_resources_graph(state)
+        end = t.time()
+        print(f"\nTotal runtime to Delete all resources is {end - begin}\n")
+        # Writing empty assets.json, asset_models.json and hierarchy_id_mapping.json
+        with open(script_assets_path, "w") as outfile:
+            outfile.write(json.dumps({}, indent=4))
+        with open(script_asset_models_path, "w") as outfile:
+            outfile.write(json.dumps({}, indent=4))
+        with open(hierarchy_id_mapping_path, "w") as outfile:
+            outfile.write(json.dumps({}, indent=4))
+        record_config_hashes(hash_config([], [], [], []))
+    
+        # Write the journal back to the created/ files
+        compact_journal()
+    
+        rate_limiter.report()
+        report_failures()
+        write_metrics()
+        write_trace()
+        print("Done!")
+
+    elif args.action in ('PLAN', 'APPLY'):
+        #################################
+        # PLAN AND APPLY 
+        #################################
+    
+        ##
+        # Compare the sitewise_config files with the config of the last CREATE or APPLY
+        ##
+        config_index= preflight()
+        models, assets, model_hierarchies, asset_hierarchies= load_sitewise_config()
+        recorded= load_config_hashes()
+        hashes= hash_config(models, assets, model_hierarchies, asset_hierarchies)
+        plan= plan_changes(recorded, hashes)
+        print_plan(plan)
+        if args.estimate:
+            print_estimate(estimate_plan(plan, models, assets, model_hierarchies, config_index))
+    
+        if args.action == 'APPLY' and any(plan.values()):
+        
+            ##
+            # Get confirmation before changing resources
+            ##
+            confirm("Do you want to apply these changes?")
+        
+            ##
+            # Initiate the rate limiter shared by all workers
+            ##
+            rate_limiter= RateLimiter(api_rate_limits)
+            time_series_index= build_time_series_index(config_alias_prefix())
+        
+            print("Applying changes ... ")
+            begin = t.time()
+            applied= apply_plan(plan, recorded, hashes, models, assets, model_hierarchies, asset_hierarchies)
+            end = t.time()
+            print(f"\nTotal runtime to Apply all changes is {end - begin}\n")
+            record_config_hashes(applied)
+        
+            # Write the journal back to the created/ files
+            compact_journal()
+            rate_limiter.report()
+            report_failures()
+            write_metrics()
+            write_trace()
+        print("Done!")
+
+    elif args.action=='ENQUEUE':
+        #################################
+        # ENQUEUE 
+        #################################
+    
+        preflight()
+    
+        ##
+        # Get confirmation that existing resources can be adopted
+        ##
+        confirm("Resources of the config that already exist in this account will be adopted by this deployment, and removed by DELETE. Continue?")
+    
+        rate_limiter= RateLimiter(api_rate_limits)
+        print("Loading Resources Journal")
+        compact_journal()
+        checkpoints= load_checkpoints()
+    
+        ##
+        # Create Asset Models with their Model Hierarchy
+        ##
+        print("Creating Asset Models ... ")
+        with open(models_path, 'r') as file:
+            models = json.load(file)
+        with open(model_hierarchy_path, 'r') as file:
+            model_hierarchies= json.load(file)
+        script_asset_models, describe_asset_model_responses= create_asset_models(models, model_hierarchies)
+        save_records(script_asset_models_path, script_asset_models)
+        hierarchy_id_mapping= build_hierarchy_id_mapping(model_hierarchies, script_asset_models, describe_asset_model_responses)
+        with open(hierarchy_id_mapping_path, "w") as outfile:
+            outfile.write(json.dumps(hierarchy_id_mapping, indent=4))
+        property_index= build_property_index(script_asset_models, describe_asset_model_responses)
+    
+        ##
+        # Fill the work queue with the Assets and the Asset Hierarchy
+        ##
+        print("Adding Assets and Asset Hierarchy to the queue " + args.queue + " ... ")
+        print_queue_counts(enqueue_work(args.queue, script_asset_models, hierarchy_id_mapping, property_index))
+    
+        compact_journal()
+        rate_limiter.report()
+        report_failures()
+        write_metrics()
+        write_trace()
+        print("Done! Run the WORKER flow on every host, then the COLLECT flow.")
+
+    elif args.action=='WORKER':
+        #################################
+        # WORKER 
+        #################################
+    
+        rate_limiter= RateLimiter(api_rate_limits)
+    
+        print("Working on the queue " + args.queue + " ... ")
+        begin = t.time()
+        completed= run_worker(args.queue)
+        end = t.time()
+        print(f"\nTotal runtime of the worker is {end - begin}\n")
+        for key, count in sorted(completed.items()):
+            print("\t" + str(count) + " " + key)
+    
+        compact_journal()
+        rate_limiter.report()
+        report_failures()
+        write_metrics()
+        write_trace()
+        print("Done!")
+
+    elif args.action=='COLLECT':
+        #################################
+        # COLLECT 
+        #################################
+    
+        print("Collecting Assets and Asset Hierarchy from the queue " + args.queue + " ... ")
+        counts= collect_work(args.queue)
+        print_queue_counts(counts)
+        compact_journal()
+    
+        # Record the config that was deployed for PLAN and APPLY, once every item is done
+        if not any(counts[(kind, state)] for kind in ("asset", "association") for state in queue_states if state != "done"):
+            record_config_hashes(hash_sitewise_config())
+        print("Done!")
+
+    elif args.action=='DISCOVER':
+        #################################
+        # DISCOVER 
+        #################################
+    
+    
+        ##
+        # Get confirmation that the resources journal can be replaced
+        ##
+        confirm("The resources journal and the created/ files will be replaced by the resources of this account tagged with " + json.dumps(tags) + ". Continue?")
+    
+        ##
+        # Initiate the rate limiter
+        ##
+        rate_limiter= RateLimiter(api_rate_limits)
+    
+        ##
+        # Find the Asset Models, Assets and Asset Hierarchy of the script
+        ##
+        print("Discovering Resources ... ")
+        begin = t.time()
+        state= discover_resources()
+        end = t.time()
+        print(f"\nTotal runtime to Discover all resources is {end - begin}\n")
+    
+        # Write the journal, and from it the created/ files read by DELETE
+        rewrite_journal(state)
+        compact_journal()
+        rate_limiter.report()
+        report_failures()
+        write_metrics()
+        write_trace()
+        print("Done!")
+
+    elif args.action=='VALIDATE':
+        #################################
+        # VALIDATE 
+        #################################
+    
+        config_index= preflight()
+        print(f"{len(config_index['models'])} asset models, {len(config_index['hierarchies'])} model hierarchies and {len(config_index['asset_models'])} assets are valid")
+        print("Done!")
+
+    elif args.action=='COMPACT':
+        #################################
+        # COMPACT 
+        #################################
+    
+        print("Compacting Resources Journal ... ")
+        compact_journal()
+        print("Done!")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,871 @@
+import os
+import sys
+import json
+import shutil
+import contextlib
+import collections
+import multiprocessing
+import time as t
+
+import pytest
+import botocore.exceptions
+
+import sw_infra
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark"))
+from generate_config import generate_config
+from sitewise_standin import SiteWiseStandIn, serve
+
+#################################
+# HELPERS
+#################################
+
+config_dir= os.path.join(os.path.dirname(os.path.abspath(__file__)), "sitewise_config")
+
+def client_error(code, status=400):
+    return botocore.exceptions.ClientError({"Error": {"Code": code, "Message": code}, "ResponseMetadata": {"HTTPStatusCode": status}}, "TestOperation")
+
+# Run in a directory with a copy of the sample config and an empty created/
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    shutil.copytree(config_dir, tmp_path / "sitewise_config")
+    (tmp_path / "created").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sw_infra, "journal_fd", None)
+    return tmp_path
+
+# Fail if the block takes longer than seconds. The bounds are far above the
+# time of a linear implementation, and far below a quadratic one.
+@pytest.fixture
+def benchmark_timer():
+    @contextlib.contextmanager
+    def timer(seconds):
+        begin= t.monotonic()
+        yield
+        elapsed= t.monotonic() - begin
+        assert elapsed < seconds, f"took {elapsed:.2f} s, expected less than {seconds} s"
+    return timer
+
+# Send the calls of the script to a local stand-in of SiteWise, with the
+# operations failed permanently in this test collected apart
+@pytest.fixture
+def standin(workdir, monkeypatch):
+    server= serve(SiteWiseStandIn(latency=0, consistency_delay=0, seed=1))
+    for key, value in {"AWS_ACCESS_KEY_ID": "test", "AWS_SECRET_ACCESS_KEY": "test", "AWS_DEFAULT_REGION": "us-east-1"}.items():
+        monkeypatch.setenv(key, value)
+    monkeypatch.setattr(sw_infra, "endpoint_url", server.endpoint_url)
+    monkeypatch.setattr(sw_infra, "session", None)
+    monkeypatch.setattr(sw_infra, "client", None)
+    monkeypatch.setattr(sw_infra, "failed_operations", [])
+    monkeypatch.setattr(sw_infra, "checkpoints", {})
+    monkeypatch.setattr(sw_infra, "property_index", {})
+    monkeypatch.setattr(sw_infra, "time_series_index", {})
+    monkeypatch.setattr(sw_infra, "engine", "thread")
+    monkeypatch.setattr(sw_infra, "rate_limiter", None)
+    monkeypatch.setattr(sw_infra, "max_pool_connections", sw_infra.max_pool_connections)
+    monkeypatch.setattr(sw_infra, "retry_base_delay", 0.001)
+    monkeypatch.setattr(sw_infra, "waiter_initial_delay", 0.001)
+    yield server.standin
+    server.shutdown()
+
+# Deploy the sample config to the stand-in with the library API, returns the
+# created models and assets by name
+def deploy_sample_config():
+    asset_models, hierarchy_id_mapping= sw_infra.deploy_models(read_config_entries("models.json"), read_config_entries("model_hierarchy.json"))
+    assets= sw_infra.deploy_assets(read_config_entries("assets.json"), asset_models)
+    assert sw_infra.deploy_asset_hierarchy(read_config_entries("asset_hierarchy.json"), hierarchy_id_mapping, assets) == 1
+    assert sw_infra.failed_operations == []
+    return asset_models, assets
+
+@pytest.fixture
+def deployed(standin):
+    return deploy_sample_config()
+
+# Asset of the stand-in by name
+def standin_asset(standin, asset_name):
+    return next(asset for asset in standin.assets.values() if asset["name"] == asset_name)
+
+# Create the models of the sample config in the stand-in, without hierarchies
+def create_sample_models():
+    asset_models= {}
+    for model in read_config_entries("models.json"):
+        asset_models.update(sw_infra.create_asset_model(model))
+    return asset_models
+
+# Entries of a file of the sample config
+def read_config_entries(name):
+    with open(os.path.join(config_dir, name), 'r') as file:
+        return json.load(file)
+
+# Entries of a config file of the working directory
+def read_config(name):
+    with open(os.path.join("sitewise_config", name), 'r') as file:
+        return json.load(file)
+
+def write_config(name, entries):
+    with open(os.path.join("sitewise_config", name), "w") as outfile:
+        outfile.write(json.dumps(entries, indent=4))
+
+def hierarchy(parent, *children):
+    return {"parent_asset_name": parent, "child_assets": [{"child_asset_name": child, "logical_id": "ParentChildAssetModelHierarchy"} for child in children]}
+
+#################################
+# API RATE LIMITER
+#################################
+
+# Clock of the rate limiter that only moves when it sleeps
+class FakeClock:
+    
+    def __init__(self):
+        self.now= 1000.0
+        self.slept= 0.0
+    
+    def monotonic(self):
+        return self.now
+    
+    # A real clock always moves on, also when the delay is rounded to nothing
+    def sleep(self, seconds):
+        seconds= max(seconds, 1e-9)
+        self.now+= seconds
+        self.slept+= seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock= FakeClock()
+    monkeypatch.setattr(sw_infra, "t", clock)
+    return clock
+
+def test_rate_limiter_allows_one_second_of_burst_then_the_rate(clock):
+    limiter= sw_infra.RateLimiter({"CreateAsset": 10, "DescribeAsset": 2})
+    assert [limiter.acquire("CreateAsset") for _ in range(10)] == [0.0] * 10
+    assert limiter.acquire("CreateAsset") == pytest.approx(0.1)
+    for _ in range(20):
+        limiter.acquire("CreateAsset")
+    assert clock.slept == pytest.approx(2.1)
+    # Every operation has its own bucket
+    assert limiter.acquire("DescribeAsset") == 0.0
+    assert limiter.acquire("UnknownOperation") == 0.0
+    assert list(limiter.calls) == [31, 1]
+    assert limiter.delayed_calls[0] == 21
+
+def test_rate_limiter_empties_the_bucket_when_throttled(clock):
+    limiter= sw_infra.RateLimiter({"CreateAsset": 10})
+    limiter.acquire("CreateAsset")
+    limiter.throttled("CreateAsset")
+    assert limiter.acquire("CreateAsset") == pytest.approx(0.1)
+    assert limiter.throttled_calls[0] == 1
+
+def test_rate_limiter_share(clock):
+    limiter= sw_infra.RateLimiter({"CreateAsset": 10, "DeleteAssetModel": 1})
+    limiter.share(1 / 4)
+    assert list(limiter.rates) == [2.5, 0.25]
+    # The burst shrinks with the rate, and holds at least one request
+    assert [limiter.acquire("CreateAsset") for _ in range(2)] == [0.0, 0.0]
+    # Half a token is left of the burst of 2.5
+    assert limiter.acquire("CreateAsset") == pytest.approx(0.2)
+    assert limiter.acquire("CreateAsset") == pytest.approx(0.4)
+    assert limiter.acquire("DeleteAssetModel") == 0.0
+    assert limiter.acquire("DeleteAssetModel") == pytest.approx(4)
+    limiter.share(1)
+    assert list(limiter.rates) == [10, 1]
+
+# Worker processes draw from the budget of the process that created the limiter
+def test_rate_limiter_is_shared_with_forked_processes():
+    limiter= sw_infra.RateLimiter({"CreateAsset": 5})
+    context= multiprocessing.get_context("fork")
+    processes= [context.Process(target=limiter.acquire, args=("CreateAsset",)) for _ in range(3)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert limiter.calls[0] == 3
+    assert limiter.tokens[0] < 3
+
+#################################
+# API METRICS
+#################################
+
+def test_api_metrics_counts_calls_by_operation_and_phase():
+    metrics= sw_infra.ApiMetrics(["CreateAsset", "DescribeAsset"], "create")
+    metrics.record("CreateAsset", 0.003, 0.5)
+    sw_infra.task_context.phase= "assets"
+    try:
+        metrics.record("CreateAsset", 0.2, 0, "retryable", throttled=True)
+        metrics.record("CreateAsset", 30, 0, "fatal")
+        metrics.record("CreateAsset", 0.04, 0)
+        # Operations and phases that are not known are not counted
+        metrics.record("DeleteAsset", 0.1, 0)
+        sw_infra.task_context.phase= "unknown"
+        metrics.record("CreateAsset", 0.1, 0)
+    finally:
+        sw_infra.task_context.phase= None
+    
+    series= {(entry["operation"], entry["phase"]): entry for entry in metrics.snapshot()}
+    assert list(series) == [("CreateAsset", "assets"), ("CreateAsset", "create")]
+    assert series["CreateAsset", "create"]["calls"] == 1
+    assert series["CreateAsset", "create"]["limiter_wait_seconds"] == 0.5
+    assert series["CreateAsset", "create"]["latency_seconds_p99"] == 0.005
+    
+    entry= series["CreateAsset", "assets"]
+    assert (entry["calls"], entry["throttles"], entry["retries"], entry["errors"]) == (3, 1, 1, 1)
+    assert entry["latency_seconds_sum"] == 30.24
+    assert entry["latency_seconds_max"] == 30
+    assert entry["latency_buckets"] == [0, 0, 0, 1, 0, 1, 0, 0, 0, 0, 0, 1]
+    # Percentiles are the upper bound of their bucket, the maximum past the last one
+    assert (entry["latency_seconds_p50"], entry["latency_seconds_p90"], entry["latency_seconds_p99"]) == (0.25, 30, 30)
+
+def test_write_metrics_after_a_deploy(standin, monkeypatch):
+    monkeypatch.setattr(sw_infra, "api_metrics", sw_infra.ApiMetrics(sw_infra.api_rate_limits, "create"))
+    deploy_sample_config()
+    sw_infra.write_metrics()
+    
+    with open(sw_infra.metrics_path) as infile:
+        metrics= json.load(infile)
+    assert {operation: metrics["operations"][operation]["calls"] for operation in ("CreateAssetModel", "CreateAsset", "AssociateAssets")} == {
+        operation: standin.calls[operation] for operation in ("CreateAssetModel", "CreateAsset", "AssociateAssets")
+    }
+    phases= {(entry["operation"], entry["phase"]) for entry in metrics["series"]}
+    assert {("CreateAssetModel", "models"), ("CreateAsset", "assets"), ("BatchPutAssetPropertyValue", "attributes"), ("AssociateAssets", "associations")} <= phases
+    
+    with open(sw_infra.metrics_textfile_path) as infile:
+        lines= infile.read().splitlines()
+    assert 'sitewise_api_calls_total{operation="CreateAsset",phase="assets"} 2' in lines
+    assert 'sitewise_api_latency_seconds_bucket{operation="CreateAsset",phase="assets",le="+Inf"} 2' in lines
+    assert 'sitewise_api_latency_seconds_count{operation="CreateAsset",phase="assets"} 2' in lines
+    assert not os.path.exists(sw_infra.metrics_path + ".tmp")
+
+#################################
+# TRACING
+#################################
+
+def trace_span_event(name, begin, end, parent_id=None, **args):
+    return {"name": name, "cat": "test", "ph": "X", "ts": begin * 1e6, "dur": (end - begin) * 1e6, "pid": 1, "tid": 1,
+            "args": dict(args, span_id=name, parent_id=parent_id, worker="1/MainThread")}
+
+# With the dag engine a step goes back to the dependency that ended last
+def test_critical_path_follows_the_dependencies():
+    events= [
+        trace_span_event("a", 0, 1, key="a"),
+        trace_span_event("b", 0, 2.5, key="b"),
+        trace_span_event("c", 3, 4, key="c", dependencies=["a"]),
+        trace_span_event("CreateAsset", 3.25, 3.75, parent_id="c")
+    ]
+    events[3]["cat"]= "api"
+    path= sw_infra.critical_path(events)
+    assert [step["name"] for step in path] == ["a", "c"]
+    assert path[1]["waited_seconds"] == 2
+    assert path[1]["calls"] == {"CreateAsset": 0.5}
+
+# Without dependencies the phases run one after the other
+def test_critical_path_follows_the_phases():
+    events= [trace_span_event("a", 0, 1), trace_span_event("b", 0, 2.5), trace_span_event("c", 3, 4)]
+    assert [step["name"] for step in sw_infra.critical_path(events)] == ["b", "c"]
+
+def test_write_trace_after_a_deploy(standin, monkeypatch, capsys):
+    monkeypatch.setattr(sw_infra, "tracing", False)
+    monkeypatch.setattr(sw_infra, "trace_fd", None)
+    sw_infra.start_trace()
+    try:
+        deploy_sample_config()
+        sw_infra.write_trace()
+    finally:
+        os.close(sw_infra.trace_fd)
+    
+    with open(sw_infra.trace_path) as infile:
+        trace= json.load(infile)
+    spans= {event["args"]["span_id"]: event for event in trace["traceEvents"] if event["ph"] == "X"}
+    names= {event["name"] for event in spans.values()}
+    assert {"models ParentModelName", "assets ParentAssetName", "assets ChildAssetName", "associations ParentAssetName"} <= names
+    
+    # Every API call is the child of the operation on the resource it was made for
+    create_asset_spans= [event for event in spans.values() if event["name"] == "CreateAsset"]
+    assert len(create_asset_spans) == 2
+    assert {spans[event["args"]["parent_id"]]["name"] for event in create_asset_spans} == {"assets ParentAssetName", "assets ChildAssetName"}
+    assert any(event["name"] == "thread_name" for event in trace["traceEvents"] if event["ph"] == "M")
+    assert trace["otherData"]["critical_path"][-1]["name"] == "associations ParentAssetName"
+    assert "Critical path" in capsys.readouterr().out
+
+#################################
+# CLASSIFY ERROR
+#################################
+
+@pytest.mark.parametrize("err, error_class", [
+    (client_error("ThrottlingException"), "retryable"),
+    (client_error("TooManyRequestsException"), "retryable"),
+    (client_error("ServiceUnavailableException", 503), "retryable"),
+    (client_error("SomeServerError", 500), "retryable"),
+    (client_error("ConflictingOperationException"), "conflict"),
+    (client_error("InvalidRequestException"), "fatal"),
+    (client_error("ResourceNotFoundException", 404), "fatal"),
+    (botocore.exceptions.EndpointConnectionError(endpoint_url="https://iotsitewise"), "retryable"),
+    (botocore.exceptions.ReadTimeoutError(endpoint_url="https://iotsitewise"), "retryable"),
+    (botocore.exceptions.ParamValidationError(report="bad parameter"), "fatal"),
+    (ValueError("not an API error"), "fatal")
+])
+def test_classify_error(err, error_class):
+    assert sw_infra.classify_error(err) == error_class
+
+#################################
+# PLAN CHANGES
+#################################
+
+def test_plan_changes_without_changes():
+    hashes= sw_infra.hash_config(read_config_entries("models.json"), read_config_entries("assets.json"), read_config_entries("model_hierarchy.json"), read_config_entries("asset_hierarchy.json"))
+    plan= sw_infra.plan_changes(hashes, hashes)
+    assert all(changes == [] for changes in plan.values())
+
+def test_plan_changes_from_nothing_creates_everything():
+    models, assets, model_hierarchies, asset_hierarchies= (read_config_entries(name) for name in ("models.json", "assets.json", "model_hierarchy.json", "asset_hierarchy.json"))
+    plan= sw_infra.plan_changes(sw_infra.hash_config([], [], [], []), sw_infra.hash_config(models, assets, model_hierarchies, asset_hierarchies))
+    assert plan["create_models"] == ["ParentModelName", "ChildModelName"]
+    assert plan["create_assets"] == ["ParentAssetName", "ChildAssetName"]
+    assert plan["associate"] == [("ParentAssetName", "ChildAssetName")]
+    # New assets get their attribute values when they are created
+    assert plan["write_attributes"] == []
+    assert plan["delete_models"] == plan["delete_assets"] == plan["disassociate"] == []
+
+def test_plan_changes_updates_attributes_in_place():
+    models, assets, model_hierarchies, asset_hierarchies= (read_config_entries(name) for name in ("models.json", "assets.json", "model_hierarchy.json", "asset_hierarchy.json"))
+    recorded= sw_infra.hash_config(models, assets, model_hierarchies, asset_hierarchies)
+    assets[1]["attributes"][0]["value"]= "new value"
+    plan= sw_infra.plan_changes(recorded, sw_infra.hash_config(models, assets, model_hierarchies, asset_hierarchies))
+    assert plan["write_attributes"] == [("ChildAssetName", "AttributeName")]
+    assert plan["update_assets"] == plan["create_assets"] == plan["delete_assets"] == []
+
+def test_plan_changes_recreates_an_asset_that_changes_model():
+    models, assets, model_hierarchies, asset_hierarchies= (read_config_entries(name) for name in ("models.json", "assets.json", "model_hierarchy.json", "asset_hierarchy.json"))
+    recorded= sw_infra.hash_config(models, assets, model_hierarchies, asset_hierarchies)
+    assets[1]["model_name"]= "ParentModelName"
+    assets[1]["measurements"]= []
+    plan= sw_infra.plan_changes(recorded, sw_infra.hash_config(models, assets, model_hierarchies, asset_hierarchies))
+    assert plan["create_assets"] == plan["delete_assets"] == ["ChildAssetName"]
+    assert plan["update_assets"] == []
+    # Its association is made again
+    assert plan["disassociate"] == plan["associate"] == [("ParentAssetName", "ChildAssetName")]
+
+#################################
+# ESTIMATE
+#################################
+
+# Estimate of the plan from recorded_config to the config of the working directory
+def estimate_config(recorded_config):
+    models, assets, model_hierarchies, asset_hierarchies= (read_config(name) for name in ("models.json", "assets.json", "model_hierarchy.json", "asset_hierarchy.json"))
+    plan= sw_infra.plan_changes(sw_infra.hash_config(*recorded_config), sw_infra.hash_config(models, assets, model_hierarchies, asset_hierarchies))
+    errors, config_index= sw_infra.validate_config()
+    assert errors == []
+    return sw_infra.estimate_plan(plan, models, assets, model_hierarchies, config_index)
+
+def estimate_calls(phases):
+    calls= collections.Counter()
+    for phase in phases:
+        calls.update(phase["calls"])
+    return calls
+
+# The estimate counts the calls that a CREATE of the config makes
+def test_estimate_plan_counts_the_calls_of_a_create(standin):
+    phases= estimate_config(([], [], [], []))
+    assert [phase["name"] for phase in phases] == ["models level 0", "models level 1", "data streams", "assets", "attributes", "associations"]
+    
+    deploy_sample_config()
+    calls= estimate_calls(phases)
+    for operation in ("CreateAssetModel", "CreateAsset", "UpdateAssetProperty", "BatchPutAssetPropertyValue", "AssociateAssets"):
+        assert calls[operation] == standin.calls[operation], operation
+
+def test_estimate_plan_of_an_attribute_change(workdir):
+    recorded_config= [read_config_entries(name) for name in ("models.json", "assets.json", "model_hierarchy.json", "asset_hierarchy.json")]
+    assert estimate_config(recorded_config) == []
+    
+    assets= read_config("assets.json")
+    assets[1]["attributes"][0]["value"]= "new value"
+    write_config("assets.json", assets)
+    phases= estimate_config(recorded_config)
+    assert [phase["name"] for phase in phases] == ["attributes"]
+    assert estimate_calls(phases) == {"BatchPutAssetPropertyValue": 1}
+
+def test_estimate_polls(monkeypatch):
+    monkeypatch.setattr(sw_infra, "estimate_call_latency", 0.1)
+    monkeypatch.setattr(sw_infra, "waiter_initial_delay", 0.25)
+    monkeypatch.setattr(sw_infra, "waiter_max_delay", 5)
+    assert sw_infra.estimate_polls(0) == (1, 0.1)
+    # Waits of 0.25, 0.5 and 1 s, one poll before each and one after
+    passes, seconds= sw_infra.estimate_polls(1.5)
+    assert (passes, round(seconds, 6)) == (4, 2.15)
+    assert sw_infra.estimate_polls(60)[0] == 17
+
+# A phase takes as long as its slowest bound, then waits for its resources
+def test_estimate_phase_time():
+    phase= sw_infra.estimate_phase("assets", 10)
+    phase["calls"]["CreateAsset"]= 100
+    phase["work"]= 20
+    phase["chain"]= 0.5
+    assert sw_infra.estimate_phase_time(phase, {}) == (2, "concurrency")
+    assert sw_infra.estimate_phase_time(phase, {"CreateAsset": 10}) == (10, "CreateAsset")
+    phase["chain"]= 12
+    phase["wait"]= 3
+    assert sw_infra.estimate_phase_time(phase, {"CreateAsset": 10}) == (15, "latency")
+    assert sw_infra.estimate_total_time([phase, phase], {"CreateAsset": 10}) == 30
+
+def test_print_estimate_names_the_bottleneck(workdir, monkeypatch, capsys):
+    monkeypatch.setattr(sw_infra, "engine", "thread")
+    generate_config("sitewise_config", models=4, assets=2000, properties=4, depth=3)
+    sw_infra.print_estimate(estimate_config(([], [], [], [])))
+    out= capsys.readouterr().out
+    assert "Total: " in out
+    assert "CreateAsset " in out
+    assert "Bottleneck: " in out
+
+#################################
+# ASSET HIERARCHY GRAPH
+#################################
+
+def test_asset_hierarchy_graph_levels_top_down():
+    graph= sw_infra.AssetHierarchyGraph.from_config([
+        hierarchy("Line", "Cell-1", "Cell-2"),
+        hierarchy("Site", "Line"),
+        hierarchy("Cell-1", "Machine")
+    ])
+    assert graph.levels() == [["Site"], ["Line"], ["Cell-1"]]
+    assert graph.multiple_parents() == {}
+    assert graph.cycle() == []
+    assert graph.asset_hierarchy("Line") == hierarchy("Line", "Cell-1", "Cell-2")
+
+def test_asset_hierarchy_graph_multiple_parents():
+    graph= sw_infra.AssetHierarchyGraph.from_config([
+        hierarchy("Line-1", "Machine"),
+        hierarchy("Line-2", "Machine")
+    ])
+    assert graph.multiple_parents() == {"Machine": ["Line-1", "Line-2"]}
+
+def test_asset_hierarchy_graph_cycle():
+    graph= sw_infra.AssetHierarchyGraph.from_config([
+        hierarchy("Site", "Line"),
+        hierarchy("Line", "Cell"),
+        hierarchy("Cell", "Line")
+    ])
+    assert sorted(graph.cycle()) == ["Cell", "Line"]
+    assert graph.levels(check=False) == [["Site"]]
+    with pytest.raises(ValueError):
+        graph.levels()
+
+# Binary tree of assets, every asset below the root has one parent
+def tree_hierarchies(parents):
+    return [hierarchy("Asset-" + str(i), "Asset-" + str(2 * i + 1), "Asset-" + str(2 * i + 2)) for i in range(parents)]
+
+def test_asset_hierarchy_graph_cycle_is_linear(benchmark_timer):
+    asset_hierarchies= tree_hierarchies(5000)
+    graph= sw_infra.AssetHierarchyGraph.from_config(asset_hierarchies)
+    with benchmark_timer(1.0):
+        assert graph.cycle() == []
+    assert len(graph.levels()) == 13
+    
+    # The last parent is also the parent of the root, every parent is in the cycle or below it
+    asset_hierarchies[-1]["child_assets"].append({"child_asset_name": "Asset-0", "logical_id": "ParentChildAssetModelHierarchy"})
+    graph= sw_infra.AssetHierarchyGraph.from_config(asset_hierarchies)
+    with benchmark_timer(1.0):
+        assert graph.cycle() == ["Asset-" + str(i) for i in range(5000)]
+
+def test_asset_hierarchy_graph_from_mapping():
+    graph= sw_infra.AssetHierarchyGraph.from_mapping([
+        {"assetId": "site", "childAssetId": "line", "hierarchyId": "h1"},
+        {"assetId": "line", "childAssetId": "cell", "hierarchyId": "h2"}
+    ])
+    assert graph.levels() == [["site"], ["line"]]
+
+#################################
+# VALIDATE CONFIG
+#################################
+
+def test_validate_config_accepts_the_sample_config(workdir):
+    errors, config_index= sw_infra.validate_config()
+    assert errors == []
+    assert config_index["asset_models"] == {"ParentAssetName": "ParentModelName", "ChildAssetName": "ChildModelName"}
+    assert config_index["hierarchies"] == {"ParentChildAssetModelHierarchy": ("ParentModelName", "ChildModelName")}
+
+def test_validate_config_reports_every_error(workdir):
+    assets= read_config("assets.json")
+    assets.append(dict(assets[1], asset_name="OtherChildAssetName"))
+    assets.append(dict(assets[0], asset_name="OtherParentAssetName", model_name="UnknownModelName"))
+    assets.append(assets[0])
+    write_config("assets.json", assets)
+    write_config("asset_hierarchy.json", [
+        hierarchy("ParentAssetName", "ChildAssetName", "UnknownAssetName"),
+        hierarchy("ChildAssetName", "ParentAssetName")
+    ])
+    errors, _= sw_infra.validate_config()
+    assert errors == [
+        "assets.json: alias 'asset/alias' of asset 'OtherChildAssetName' is used more than once",
+        "assets.json: asset 'OtherParentAssetName' uses unknown model 'UnknownModelName'",
+        "assets.json: duplicate asset 'ParentAssetName'",
+        "asset_hierarchy.json: child asset 'UnknownAssetName' of 'ParentAssetName' is unknown",
+        "asset_hierarchy.json: child asset 'ParentAssetName' of 'ChildAssetName' uses hierarchy 'ParentChildAssetModelHierarchy' of model 'ParentModelName', the parent asset is a 'ChildModelName'",
+        "asset_hierarchy.json: child asset 'ParentAssetName' of 'ChildAssetName' uses hierarchy 'ParentChildAssetModelHierarchy' for model 'ChildModelName', the child asset is a 'ParentModelName'",
+        "asset_hierarchy.json: cycle in the asset hierarchy between assets: 'ParentAssetName', 'ChildAssetName'"
+    ]
+
+def test_validate_config_reads_json_lines(workdir):
+    with open(os.path.join("sitewise_config", "assets.jsonl"), "w") as outfile:
+        for asset in read_config("assets.json")[:1]:
+            outfile.write(json.dumps(asset) + "\n")
+    errors, _= sw_infra.validate_config()
+    assert errors == ["asset_hierarchy.json: child asset 'ChildAssetName' of 'ParentAssetName' is unknown"]
+
+# The check runs before every CREATE, it must stay cheap on a large fleet
+def test_preflight_on_a_large_config(tmp_path, monkeypatch, benchmark_timer, capsys):
+    models, assets, associations= generate_config(str(tmp_path / "sitewise_config"), models=4, assets=12000, properties=4, depth=4)
+    monkeypatch.chdir(tmp_path)
+    with benchmark_timer(1.5):
+        config_index= sw_infra.preflight()
+    assert len(config_index["asset_models"]) == assets
+    assert "0 errors found" in capsys.readouterr().out
+
+#################################
+# STREAM CONFIG FILES
+#################################
+
+stream_entries= [
+    {"asset_name": "Asset-" + str(i), "model_name": "Model, ]" + "x" * i, "attributes": [{"name": "Attribute", "value": "[{\"quoted\"}]"}]}
+    for i in range(20)
+]
+
+# Entries cut anywhere by the end of a chunk are still read whole
+@pytest.mark.parametrize("read_size", [1, 2, 7, 64, 1 << 20])
+def test_iter_config_reads_a_json_array_across_chunks(tmp_path, monkeypatch, read_size):
+    monkeypatch.setattr(sw_infra, "config_read_size", read_size)
+    path= str(tmp_path / "assets.json")
+    with open(path, "w") as outfile:
+        json.dump(stream_entries, outfile, indent=4)
+    assert list(sw_infra.iter_config(path)) == stream_entries
+
+def test_iter_config_reads_json_lines(tmp_path):
+    path= str(tmp_path / "assets.jsonl")
+    with open(path, "w") as outfile:
+        for entry in stream_entries:
+            outfile.write(json.dumps(entry) + "\n\n")
+    assert list(sw_infra.iter_config(path)) == stream_entries
+
+def test_iter_config_reads_the_json_lines_version_of_a_config_file(workdir):
+    with open(os.path.join("sitewise_config", "assets.jsonl"), "w") as outfile:
+        outfile.write(json.dumps(stream_entries[0]) + "\n")
+    assert list(sw_infra.iter_config(sw_infra.assets_path)) == stream_entries[:1]
+
+@pytest.mark.parametrize("content, error", [
+    ('{"asset_name": "Asset"}', "is not a JSON array"),
+    ('[{"asset_name": "Asset"}, ', "ends before the end of the JSON array"),
+    ('[{"asset_name": "Asset"}, {"asset_name": ', "Expecting value")
+])
+def test_iter_config_rejects_a_file_that_is_not_a_json_array(tmp_path, monkeypatch, content, error):
+    monkeypatch.setattr(sw_infra, "config_read_size", 4)
+    path= str(tmp_path / "assets.json")
+    with open(path, "w") as outfile:
+        outfile.write(content)
+    with pytest.raises(ValueError, match=error):
+        list(sw_infra.iter_config(path))
+
+def test_json_object_writer_replaces_the_file_on_close(tmp_path):
+    path= str(tmp_path / "assets.json")
+    with open(path, "w") as outfile:
+        json.dump({"OldAssetName": ["old-id", "old-arn"]}, outfile)
+    writer= sw_infra.JsonObjectWriter(path)
+    writer.write("AssetName", ["asset-id", "asset-arn"])
+    writer.write("OtherAssetName", ["other-id", "other-arn"])
+    with open(path) as infile:
+        assert json.load(infile) == {"OldAssetName": ["old-id", "old-arn"]}
+    writer.close()
+    with open(path) as infile:
+        assert json.load(infile) == {"AssetName": ["asset-id", "asset-arn"], "OtherAssetName": ["other-id", "other-arn"]}
+    assert not os.path.exists(path + ".tmp")
+
+def test_json_object_writer_without_members(tmp_path):
+    path= str(tmp_path / "assets.json")
+    sw_infra.JsonObjectWriter(path).close()
+    with open(path) as infile:
+        assert json.load(infile) == {}
+
+#################################
+# RESULT RECORDS
+#################################
+
+def test_records_are_saved_as_id_and_arn_arrays(tmp_path):
+    path= str(tmp_path / "assets.json")
+    records= {"AssetName": sw_infra.AssetRecord("asset-id", "asset-arn"), "OtherAssetName": sw_infra.AssetRecord("other-id", "other-arn")}
+    sw_infra.save_records(path, records)
+    with open(path) as infile:
+        assert json.load(infile) == {"AssetName": ["asset-id", "asset-arn"], "OtherAssetName": ["other-id", "other-arn"]}
+    
+    loaded= sw_infra.load_records(path, sw_infra.AssetRecord)
+    assert {name: record.to_json() for name, record in loaded.items()} == {name: record.to_json() for name, record in records.items()}
+    assert loaded["AssetName"]["assetId"] == "asset-id"
+    assert loaded["AssetName"].assetArn == "asset-arn"
+
+# Files written by earlier versions hold the whole API response
+def test_load_records_reads_whole_api_responses(tmp_path):
+    path= str(tmp_path / "asset_models.json")
+    with open(path, "w") as outfile:
+        json.dump({"ModelName": {
+            "assetModelId": "model-id", "assetModelArn": "model-arn",
+            "assetModelStatus": {"state": "CREATING"}, "ResponseMetadata": {"HTTPStatusCode": 201, "RetryAttempts": 0}
+        }}, outfile, indent=4)
+    record= sw_infra.load_records(path, sw_infra.AssetModelRecord)["ModelName"]
+    assert record.to_json() == ["model-id", "model-arn"]
+    assert not hasattr(record, "__dict__")
+
+def test_deploy_keeps_only_the_id_and_arn(deployed, standin):
+    asset_models, assets= deployed
+    for model_name, record in asset_models.items():
+        model= next(model for model in standin.asset_models.values() if model["name"] == model_name)
+        assert record.to_json() == [model["id"], model["arn"]]
+    assert {name: record.to_json() for name, record in assets.items()} == {
+        name: [standin_asset(standin, name)["id"], standin_asset(standin, name)["arn"]] for name in ["ParentAssetName", "ChildAssetName"]
+    }
+
+#################################
+# COMPACT JOURNAL
+#################################
+
+def test_compact_journal_keeps_the_resources_that_still_exist(workdir):
+    sw_infra.add_resources_element("asset_models", "model-1")
+    sw_infra.add_resources_element("assets", "asset-1")
+    sw_infra.add_resources_element("assets", "asset-2")
+    sw_infra.journal_append("add", "checkpoints", {"step": "asset", "name": "Asset1", "result": {"assetId": "asset-1", "assetArn": "arn-1"}})
+    sw_infra.journal_append("add", "checkpoints", {"step": "asset", "name": "Asset2", "result": {"assetId": "asset-2", "assetArn": "arn-2"}})
+    sw_infra.journal_append("add", "checkpoints", {"step": "aliases", "name": "asset-2", "result": None})
+    sw_infra.delete_resources_element("assets", "asset-2")
+
+    state= sw_infra.compact_journal()
+
+    assert state["assets"] == ["asset-1"]
+    assert [element["name"] for element in state["checkpoints"]] == ["Asset1"]
+    with open(sw_infra.resources_path, 'r') as file:
+        assert json.load(file) == {"asset_models": ["model-1"], "assets": ["asset-1"]}
+    # The journal only holds the live elements, and replays to the same state
+    with open(sw_infra.journal_path, 'r') as file:
+        assert len(file.readlines()) == 3
+    assert sw_infra.load_journal() == state
+
+def test_compact_journal_keeps_records_appended_after_it(workdir):
+    sw_infra.add_resources_element("assets", "asset-1")
+    sw_infra.compact_journal()
+    sw_infra.add_resources_element("assets", "asset-2")
+    sw_infra.journal_sync()
+    assert sw_infra.load_journal()["assets"] == ["asset-1", "asset-2"]
+
+#################################
+# WORK QUEUE
+#################################
+
+# Queue of the sample config: two asset items and one association item
+@pytest.fixture
+def work_queue(workdir):
+    path= str(workdir / "created" / "queue.db")
+    counts= sw_infra.enqueue_work(path, {}, {}, {})
+    assert counts[("asset", "pending")] == 2 and counts[("association", "pending")] == 1
+    connection= sw_infra.open_queue(path)
+    yield connection
+    connection.close()
+
+def item_states(connection):
+    return dict(connection.execute("SELECT name || ':' || kind, state FROM work_items").fetchall())
+
+def test_claim_work_waits_for_the_assets_of_an_association(work_queue):
+    items= sw_infra.claim_work(work_queue, "worker-1", 10)
+    assert [(kind, payload["asset_name"]) for _, kind, payload in items] == [("asset", "ParentAssetName"), ("asset", "ChildAssetName")]
+    assert sw_infra.claim_work(work_queue, "worker-1", 10) == []
+    
+    sw_infra.complete_work(work_queue, "worker-1", [(item_id, ["asset-id", "asset-arn"], None) for item_id, _, _ in items])
+    items= sw_infra.claim_work(work_queue, "worker-1", 10)
+    assert [kind for _, kind, _ in items] == ["association"]
+    assert item_states(work_queue)["ParentAssetName:association"] == "leased"
+
+def test_claim_work_takes_a_share_of_the_ready_items(work_queue):
+    assert len(sw_infra.claim_work(work_queue, "worker-1", 10, workers=2)) == 1
+    assert len(sw_infra.claim_work(work_queue, "worker-2", 10, workers=2)) == 1
+
+def test_failed_items_go_back_to_the_queue_until_the_last_attempt(work_queue, monkeypatch):
+    monkeypatch.setattr(sw_infra, "queue_max_attempts", 2)
+    for attempt in range(2):
+        items= sw_infra.claim_work(work_queue, "worker-1", 1)
+        assert [payload["asset_name"] for _, _, payload in items] == ["ParentAssetName"]
+        sw_infra.complete_work(work_queue, "worker-1", [(items[0][0], None, "InvalidRequestException")])
+    assert item_states(work_queue)["ParentAssetName:asset"] == "failed"
+    # The association of a failed asset fails with it
+    sw_infra.claim_work(work_queue, "worker-1", 10)
+    assert item_states(work_queue)["ParentAssetName:association"] == "failed"
+
+def test_expired_leases_are_claimed_again(work_queue, monkeypatch):
+    items= sw_infra.claim_work(work_queue, "worker-1", 10)
+    assert sw_infra.claim_work(work_queue, "worker-2", 10) == []
+    
+    now= t.time()
+    monkeypatch.setattr(sw_infra.t, "time", lambda: now + sw_infra.queue_lease_seconds + 1)
+    assert [item_id for item_id, _, _ in sw_infra.claim_work(work_queue, "worker-2", 10)] == [item_id for item_id, _, _ in items]
+    # The results of the worker that lost its lease are ignored
+    sw_infra.complete_work(work_queue, "worker-1", [(item_id, None, "timed out") for item_id, _, _ in items])
+    assert item_states(work_queue)["ParentAssetName:asset"] == "leased"
+    sw_infra.complete_work(work_queue, "worker-2", [(item_id, ["asset-id", "asset-arn"], None) for item_id, _, _ in items])
+    assert item_states(work_queue)["ParentAssetName:asset"] == "done"
+
+def test_queue_heartbeat_counts_the_active_workers(work_queue, monkeypatch):
+    assert sw_infra.queue_heartbeat(work_queue, "worker-1") == 1
+    assert sw_infra.queue_heartbeat(work_queue, "worker-2") == 2
+    # A worker that stopped sending heartbeats no longer counts after three intervals
+    now= t.time()
+    monkeypatch.setattr(sw_infra.t, "time", lambda: now + 3 * sw_infra.queue_heartbeat_interval + 1)
+    assert sw_infra.queue_heartbeat(work_queue, "worker-2") == 1
+
+#################################
+# DEPENDENCY GRAPH
+#################################
+
+def test_work_graph_runs_items_after_their_dependencies():
+    order= []
+    graph= sw_infra.WorkGraph()
+    graph.add("association:Site", lambda: order.append("association:Site"), ["asset:Site", "asset:Line"])
+    graph.add("asset:Line", lambda: order.append("asset:Line"), ["model:Line"])
+    graph.add("asset:Site", lambda: order.append("asset:Site"), ["model:Site"])
+    graph.add("model:Site", lambda: order.append("model:Site"), ["model:Line"])
+    graph.add("model:Line", lambda: order.append("model:Line"))
+    assert graph.run(4) == set()
+    assert sorted(order) == sorted(graph.items)
+    for key, (_, dependencies, _) in graph.items.items():
+        assert all(order.index(dependency) < order.index(key) for dependency in dependencies)
+
+def test_work_graph_skips_the_items_of_a_failed_dependency(capsys):
+    ran= []
+    def fail():
+        raise client_error("InvalidRequestException")
+    graph= sw_infra.WorkGraph()
+    graph.add("model:Line", fail)
+    graph.add("asset:Line", lambda: ran.append("asset:Line"), ["model:Line"])
+    graph.add("association:Line", lambda: ran.append("association:Line"), ["asset:Line"])
+    graph.add("report", lambda: ran.append("report"), ["asset:Line"], always=True)
+    graph.add("asset:Other", lambda: ran.append("asset:Other"), ["model:Other"])
+    failed_operations= list(sw_infra.failed_operations)
+    try:
+        assert graph.run(2) == {"model:Line", "asset:Line", "association:Line", "asset:Other"}
+    finally:
+        sw_infra.failed_operations[:]= failed_operations
+    assert ran == ["report"]
+    assert "asset:Other depends on unknown item model:Other" in capsys.readouterr().out
+
+def test_work_graph_defers_retryable_errors(monkeypatch):
+    monkeypatch.setattr(sw_infra, "retry_base_delay", 0.001)
+    attempts= []
+    def throttled():
+        attempts.append(t.monotonic())
+        if len(attempts) < 3:
+            raise client_error("ThrottlingException")
+    graph= sw_infra.WorkGraph()
+    graph.add("model:Line", throttled)
+    graph.add("asset:Line", lambda: None, ["model:Line"])
+    assert graph.run(2) == set()
+    assert len(attempts) == 3
+
+# Flows other than CREATE run their tasks on threads of the main process
+def test_dispatch_tasks_runs_on_threads_with_the_dag_engine(monkeypatch):
+    monkeypatch.setattr(sw_infra, "engine", "dag")
+    assert sw_infra.run_tasks(os.getpid, [()] * 4) == [os.getpid()] * 4
+
+#################################
+# CREATE ASSETS
+#################################
+
+# An asset whose model has no known properties is created, without its
+# aliases and attributes, and the failure is reported
+def test_create_asset_without_the_properties_of_its_model(standin):
+    asset_models= create_sample_models()
+    asset= read_config_entries("assets.json")[1]
+    obj, attribute_values= sw_infra.create_asset(asset, asset_models)
+    assert list(obj) == ["ChildAssetName"] and attribute_values == []
+    assert sw_infra.failed_operations == [("UpdateAssetProperty", "ChildAssetName", "the properties of model ChildModelName are not known")]
+    assert sw_infra.update_asset_aliases(asset, obj["ChildAssetName"].assetId) is False
+
+#################################
+# ALIASES
+#################################
+
+def test_config_alias_prefix():
+    assets= [
+        {"measurements": [{"name": "Temperature", "alias": "plant/line-1/temperature"}, {"name": "Pressure"}]},
+        {"measurements": [{"name": "Temperature", "alias": "plant/line-2/temperature"}, {"name": "Pressure", "alias": None}]}
+    ]
+    assert sw_infra.config_alias_prefix(assets) == "plant/line-"
+    assert sw_infra.config_alias_prefix(assets[:1]) == "plant/line-1/temperature"
+    assert sw_infra.config_alias_prefix([{"measurements": [{"name": "Pressure"}]}]) == ""
+
+def test_build_time_series_index(standin):
+    standin.time_series.update({"asset/alias": None, "asset/other": ("asset-id", "property-id"), "other/alias": None})
+    assert sw_infra.build_time_series_index("asset/") == {"asset/alias": None, "asset/other": ("asset-id", "property-id")}
+    assert len(sw_infra.build_time_series_index()) == 3
+
+# Deploy the sample models and assets, with time_series_index built from the
+# data streams of the stand-in when scan is set
+def deploy_aliases(standin, scan):
+    if scan:
+        sw_infra.time_series_index= sw_infra.build_time_series_index(sw_infra.config_alias_prefix())
+    asset_models, _= sw_infra.deploy_models(read_config_entries("models.json"), read_config_entries("model_hierarchy.json"))
+    sw_infra.deploy_assets(read_config_entries("assets.json"), asset_models)
+    asset= standin_asset(standin, "ChildAssetName")
+    property_id= next(property_id for property_id, asset_property in asset["properties"].items() if asset_property["name"] == "Temperature (Celsius)")
+    return asset["id"], property_id
+
+@pytest.mark.parametrize("scan", [True, False])
+def test_new_alias_is_set(standin, scan):
+    asset_id, property_id= deploy_aliases(standin, scan)
+    assert standin.time_series == {"asset/alias": (asset_id, property_id)}
+    assert (standin.calls["UpdateAssetProperty"], standin.calls["AssociateTimeSeriesToAssetProperty"]) == (1, 0)
+    assert sw_infra.failed_operations == []
+
+# A data stream created by data sent to the alias before the asset existed is
+# associated first, at once when it is in the index, after a conflict otherwise
+@pytest.mark.parametrize("scan, update_calls", [(True, 1), (False, 2)])
+def test_unassociated_data_stream_is_associated(standin, scan, update_calls):
+    standin.time_series["asset/alias"]= None
+    asset_id, property_id= deploy_aliases(standin, scan)
+    assert standin.time_series == {"asset/alias": (asset_id, property_id)}
+    assert (standin.calls["UpdateAssetProperty"], standin.calls["AssociateTimeSeriesToAssetProperty"]) == (update_calls, 1)
+    assert sw_infra.failed_operations == []
+
+def test_alias_of_another_property_is_reported_without_calls(standin):
+    standin.time_series["asset/alias"]= ("other-asset-id", "other-property-id")
+    deploy_aliases(standin, True)
+    assert standin.time_series == {"asset/alias": ("other-asset-id", "other-property-id")}
+    assert (standin.calls["UpdateAssetProperty"], standin.calls["AssociateTimeSeriesToAssetProperty"]) == (0, 0)
+    assert sw_infra.failed_operations == [("UpdateAssetProperty", "asset/alias", "the alias is used by property other-property-id of asset other-asset-id")]
+
+#################################
+# WRITE ATTRIBUTE VALUES
+#################################
+
+def test_deploy_writes_the_attribute_values(deployed, standin):
+    for asset_name, value in [("ParentAssetName", "parent attribute value"), ("ChildAssetName", "child attribute value")]:
+        properties= {asset_property["name"]: asset_property for asset_property in standin_asset(standin, asset_name)["properties"].values()}
+        assert properties["AttributeName"]["values"][0]["value"] == {"stringValue": value}
+    assert standin.calls["BatchPutAssetPropertyValue"] == 1
+
+# Entries of a batch that fail with a retryable error are sent again, the others fail at once
+def test_put_attribute_values_retries_the_failed_entries_of_a_batch(deployed, standin, monkeypatch):
+    asset= standin_asset(standin, "ChildAssetName")
+    property_id= next(property_id for property_id, asset_property in asset["properties"].items() if asset_property["name"] == "AttributeName")
+    
+    # The first attempt of every other entry is throttled, entry 3 always is
+    sent= collections.Counter()
+    batch_put= standin.op_BatchPutAssetPropertyValue
+    def throttled_batch_put(entries, **kwargs):
+        assert len(entries) <= sw_infra.attribute_batch_size
+        throttled= []
+        for entry in entries:
+            sent[entry["entryId"]]+= 1
+            if entry["entryId"] == "3" or (int(entry["entryId"]) % 2 == 0 and sent[entry["entryId"]] == 1):
+                throttled.append({"entryId": entry["entryId"], "errors": [{"errorCode": "ThrottlingException", "errorMessage": "Rate exceeded", "timestamps": []}]})
+        response= batch_put([entry for entry in entries if entry["entryId"] not in {error_entry["entryId"] for error_entry in throttled}])
+        return {"errorEntries": response["errorEntries"] + throttled}
+    monkeypatch.setattr(standin, "op_BatchPutAssetPropertyValue", throttled_batch_put)
+    
+    values= [(asset["id"], property_id, "value " + str(i)) for i in range(25)] + [(asset["id"], "00000000-0000-0000-0000-000000000000", "value")]
+    failed= sw_infra.put_attribute_values(values)
+    
+    assert sorted(entry["entryId"] for entry in failed) == ["25", "3"]
+    assert sent["3"] == sw_infra.attribute_batch_attempts
+    assert sent["25"] == 1
+    assert all(sent[str(i)] == (2 if i % 2 == 0 else 1) for i in range(25) if i != 3)
+    assert [(operation, error.split(":")[0]) for operation, _, error in sw_infra.failed_operations] == [("BatchPutAssetPropertyValue", "ResourceNotFoundException"), ("BatchPutAssetPropertyValue", "ThrottlingException")]